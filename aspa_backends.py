@@ -0,0 +1,162 @@
+#
+# One verification API over the interchangeable implementations: ASPA
+# with its record stores and the algorithms of aspa_hackathon.
+#
+#   backend = create_backend('aspa', aspa_records)
+#   verdict = backend.verify(aspath, neighbor_as, IPv4, UPFLOW)
+#
+#   backend, report = select_backend(aspa_records, sample_routes)
+#
+# Backends are registered as 'module:attribute' strings and only imported
+# when created, so importing this module costs nothing beyond aspa_logic.
+# select_backend runs every candidate on a sample of the routes and returns
+# the fastest one whose verdicts equal those of the reference backend.
+#
+# A backend is created with the {afi: {customer_as: set(providers)}} records
+# or a record store such as a mapped snapshot, which the 'aspa' backend
+# queries in place, and verifies routes like ASPA.check_path, returning only
+# the verdict.
+# Backends that cannot verify a route (e.g. the aspa_hackathon algorithms
+# and AS_SET segments or IX paths) raise UnsupportedRoute. If the reference
+# backend cannot verify the sample, select_backend raises NoBackend with
+# the report.
+#
+import importlib
+import time
+
+from aspa_logic import *
+
+
+REFERENCE = 'aspa'
+
+# name -> (factory as 'module:attribute', keyword arguments of the factory)
+BACKENDS = {}
+
+
+class UnsupportedRoute(ValueError):
+    pass
+
+
+class NoBackend(RuntimeError):
+    def __init__(self, report):
+        reasons = '; '.join(f"{name}: {reason}" for name, reason in report.items())
+        super().__init__(f"no usable backend ({reasons})")
+        self.report = report
+
+
+def register(name, factory, **options):
+    BACKENDS[name] = factory, options
+
+
+def resolve(reference):
+    module, _, attribute = reference.partition(':')
+    return getattr(importlib.import_module(module), attribute)
+
+
+def create_backend(name, aspa_records):
+    if name not in BACKENDS:
+        raise KeyError(f"unknown backend {name!r}, registered: {', '.join(sorted(BACKENDS))}")
+    factory, options = BACKENDS[name]
+    backend = resolve(factory)(aspa_records, **options)
+    backend.name = name
+    return backend
+
+
+class ASPABackend:
+    def __init__(self, aspa_records, store=None):
+        if store is not None:
+            aspa_records = records_dict(aspa_records)
+        self.aspa = ASPA(aspa_records, store=resolve(store) if store is not None else None)
+        self.check_path = self.aspa.check_path
+
+    def verify(self, aspath, neighbor_as, afi, kind):
+        return self.check_path(aspath, neighbor_as, afi, kind)[0]
+
+
+class HackathonBackend:
+    def __init__(self, aspa_records, module, function):
+        structs = importlib.import_module('aspa_hackathon.structs')
+        self.algorithm = getattr(importlib.import_module(module), function)
+        self.directions = {UPFLOW: structs.ASPADirection.UPSTREAM, DOWNFLOW: structs.ASPADirection.DOWNSTREAM}
+        self.verdicts = {structs.ASPAVerificationResult.VALID: Valid, structs.ASPAVerificationResult.INVALID: Invalid,
+                         structs.ASPAVerificationResult.UNKNOWN: Unknown}
+        # the algorithms take a single AFI {customer_as: [providers]}
+        self.records = {afi: {customer_as: list(providers) for customer_as, providers in records_afi.items()}
+                        for afi, records_afi in records_dict(aspa_records).items()}
+
+    def verify(self, aspath, neighbor_as, afi, kind):
+        direction = self.directions.get(kind, None)
+        if direction is None:
+            raise UnsupportedRoute("IX paths are not supported")
+        if len(aspath) == 0:
+            return Invalid
+        # neighbor first without prepends, AS_SEQUENCE members only
+        path = []
+        for segment in aspath:
+            if segment.type != AS_SEQUENCE:
+                raise UnsupportedRoute("only AS_SEQUENCE segments are supported")
+            if not path or path[-1] != segment.value:
+                path.append(segment.value)
+        if path[-1] != neighbor_as:
+            return Invalid
+        path.reverse()
+        return self.verdicts[self.algorithm(self.records.get(afi, {}), path, direction)]
+
+
+register('aspa', 'aspa_backends:ASPABackend')
+register('compact', 'aspa_backends:ASPABackend', store='aspa_store:CompactRecords')
+register('hot', 'aspa_backends:ASPABackend', store='aspa_store:HotProviderRecords')
+register('draft', 'aspa_backends:HackathonBackend', module='aspa_hackathon.draft', function='draft_algorithm')
+register('optimized', 'aspa_backends:HackathonBackend', module='aspa_hackathon.optimized', function='optimized_algorithm')
+register('simple', 'aspa_backends:HackathonBackend', module='aspa_hackathon.simple', function='new_algorithm')
+register('compiled', 'aspa_backends:HackathonBackend', module='aspa_hackathon.compiled', function='compiled_algorithm')
+
+
+def calibrate(backend, routes, repeat=3):
+    # best of repeat runs over routes, returns (verdicts, seconds)
+    verify = backend.verify
+    best, verdicts = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        verdicts = [verify(aspath, neighbor_as, afi, kind) for aspath, neighbor_as, afi, kind in routes]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return verdicts, best
+
+
+def select_backend(aspa_records, routes, names=None, repeat=3):
+    # routes is a sample of (aspath, neighbor_as, afi, kind) of the current
+    # workload; returns the fastest backend equivalent to the reference and
+    # {name: ns per route or the reason it was not eligible}
+    routes = list(routes)
+    names = list(names or BACKENDS)
+    if REFERENCE in names:
+        names.remove(REFERENCE)
+    names.insert(0, REFERENCE)
+
+    report, best, expected = {}, None, None
+    for name in names:
+        try:
+            backend = create_backend(name, aspa_records)
+            verdicts, elapsed = calibrate(backend, routes, repeat)
+        except Exception as error:
+            # e.g. a backend that fails to import or the IndexError of
+            # simple.py on some single hop paths
+            if isinstance(error, UnsupportedRoute):
+                report[name] = f"unsupported: {error}"
+            else:
+                report[name] = f"failed: {error!r}"
+            if name == REFERENCE:
+                # there is nothing to check the equivalence against
+                raise NoBackend(report) from error
+            continue
+        if name == REFERENCE:
+            expected = verdicts
+        elif verdicts != expected:
+            mismatches = sum(verdict != reference for verdict, reference in zip(verdicts, expected))
+            report[name] = f"not equivalent: {mismatches} of {len(routes)} verdicts differ"
+            continue
+        report[name] = elapsed / len(routes) * 1e9 if routes else 0.0
+        if best is None or elapsed < best[1]:
+            best = backend, elapsed
+    return best[0], report
@@ -0,0 +1,171 @@
+from itertools import chain
+
+import numpy as np
+
+from aspa_logic import *
+from aspa_store import CompactRecords, CompactTable, HotProviderRecords
+
+
+def pair_table(aspa, afi):
+    # Sorted customer array plus sorted (customer index << 32 | provider)
+    # keys, built once per AFI and kept on the ASPA instance.
+    tables = aspa._batch_tables
+    if afi in tables:
+        return tables[afi]
+
+    records = aspa.aspa_records
+    if isinstance(records, CompactRecords):
+        table = records.tables.get(afi, None)
+        if table is not None and table.changes:
+            table = CompactTable.from_dict(table.to_dict())
+    elif isinstance(records, HotProviderRecords):
+        table = records.tables.get(afi, None)
+        if table is not None:
+            table = CompactTable.from_dict(table.to_dict())
+    elif isinstance(records, dict):
+        records_afi = records.get(afi, None)
+        table = CompactTable.from_dict(records_afi) if records_afi is not None else None
+    else:
+        raise TypeError(f"verify_batch does not support {type(records).__name__} records")
+
+    if table is not None:
+        customers = np.asarray(table.customers, dtype=np.uint32)
+        offsets = np.asarray(table.offsets, dtype=np.int64)
+        providers = np.asarray(table.providers, dtype=np.uint64)
+        rows = np.repeat(np.arange(len(customers), dtype=np.uint64), np.diff(offsets))
+        tables[afi] = customers, (rows << np.uint64(32)) | providers
+    else:
+        tables[afi] = None
+    return tables[afi]
+
+
+def lookup_pairs(table, as1, as2):
+    # vectorized ASPA.verify_pair
+    verdicts = np.full(len(as1), Unknown, dtype=np.uint8)
+    if table is None or len(as1) == 0:
+        return verdicts
+
+    customers, keys = table
+    index = np.searchsorted(customers, as1)
+    found = index < len(customers)
+    found[found] = customers[index[found]] == as1[found]
+
+    if len(keys) == 0:
+        verdicts[found] = Invalid
+        return verdicts
+
+    key = (index[found].astype(np.uint64) << np.uint64(32)) | as2[found].astype(np.uint64)
+    position = np.minimum(np.searchsorted(keys, key), len(keys) - 1)
+    verdicts[found] = np.where(keys[position] == key, Valid, Invalid)
+    return verdicts
+
+
+def flatten_paths(paths, lengths, types):
+    if isinstance(paths, np.ndarray) and paths.ndim == 2:
+        count, width = paths.shape
+        lengths = np.full(count, width, dtype=np.int64) if lengths is None else np.asarray(lengths, dtype=np.int64)
+        mask = np.arange(width) < lengths[:, None]
+        values = paths[mask].astype(np.uint32)
+        types = np.full(len(values), AS_SEQUENCE, dtype=np.uint8) if types is None else np.asarray(types)[mask].astype(np.uint8)
+    else:
+        lengths = np.fromiter(map(len, paths), dtype=np.int64, count=len(paths))
+        total = int(lengths.sum())
+        values = np.fromiter(chain.from_iterable(paths), dtype=np.uint32, count=total)
+        if types is None:
+            types = np.full(total, AS_SEQUENCE, dtype=np.uint8)
+        else:
+            types = np.fromiter(chain.from_iterable(types), dtype=np.uint8)
+    if len(types) != len(values):
+        raise ValueError("types must have the same shape as paths")
+    return values, types, lengths
+
+
+def first_positions(mask, path_ids, positions, default):
+    result = default.copy()
+    index = np.flatnonzero(mask)
+    if len(index):
+        ids, first = np.unique(path_ids[index], return_index=True)
+        result[ids] = positions[index[first]]
+    return result
+
+
+def last_positions(mask, path_ids, positions, default):
+    result = default.copy()
+    index = np.flatnonzero(mask)[::-1]
+    if len(index):
+        ids, last = np.unique(path_ids[index], return_index=True)
+        result[ids] = positions[index[last]]
+    return result
+
+
+def verify_batch(aspa, paths, neighbor_ases, afi, kind, lengths=None, types=None):
+    # paths are either a padded 2D array (with optional per-row lengths) or a
+    # sequence of per-path ASN sequences, both ordered like the Segment lists
+    # of the check_* methods; types holds the segment type of every ASN and
+    # defaults to AS_SEQUENCE.
+    values, types, lengths = flatten_paths(paths, lengths, types)
+    count = len(lengths)
+    neighbor_ases = np.broadcast_to(np.asarray(neighbor_ases, dtype=np.uint32), (count,))
+
+    starts = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(lengths, out=starts[1:])
+    path_ids = np.repeat(np.arange(count), lengths)
+    positions = np.arange(len(values)) - starts[path_ids]
+
+    # pair (k - 1, k) is looked up by the forward scan of get_indexes and
+    # pair (k, k - 1) by the backward one, see ASPA.get_indexes
+    sequence = types == AS_SEQUENCE
+    changed = np.zeros(len(values), dtype=bool)
+    changed[1:] = sequence[1:] & sequence[:-1] & (values[1:] != values[:-1]) & (positions[1:] > 0)
+    forward = changed.copy()
+    forward[1:] &= values[:-1] != 0
+    backward = changed.copy()
+    backward[1:] &= values[1:] != 0
+    table = pair_table(aspa, afi)
+
+    forward_verdicts = np.full(len(values), Valid, dtype=np.uint8)
+    index = np.flatnonzero(forward)
+    forward_verdicts[index] = lookup_pairs(table, values[index - 1], values[index])
+
+    end = lengths
+    forward_invalid = first_positions(forward_verdicts == Invalid, path_ids, positions, end)
+    forward_unknown = np.minimum(first_positions(forward_verdicts == Unknown, path_ids, positions, end), forward_invalid)
+    forward_unverifiable = first_positions(~sequence, path_ids, positions, end) < forward_invalid
+
+    empty = lengths == 0
+    last = np.maximum(starts[1:] - 1, 0)
+    if len(values):
+        neighbor_mismatch = ~empty & sequence[last] & (values[last] != neighbor_ases)
+    else:
+        neighbor_mismatch = np.zeros(count, dtype=bool)
+
+    if kind == DOWNFLOW:
+        backward_verdicts = np.full(len(values), Valid, dtype=np.uint8)
+        index = np.flatnonzero(backward)
+        backward_verdicts[index] = lookup_pairs(table, values[index], values[index - 1])
+
+        # a hop found at position k of the reversed path sits at n - k
+        # in the original one (k - 1 for the provider side)
+        none = np.full(count, -1, dtype=np.int64)
+        backward_invalid = np.minimum(end - last_positions(backward_verdicts == Invalid, path_ids, positions, none), end)
+        backward_unknown = end - last_positions(backward_verdicts == Unknown, path_ids, positions, none)
+        backward_unknown = np.minimum(np.minimum(backward_unknown, end), backward_invalid)
+        backward_unverifiable = end - 1 - last_positions(~sequence, path_ids, positions, none) < backward_invalid
+
+        conditions = [
+            empty | neighbor_mismatch,
+            forward_invalid + backward_invalid < end,
+            forward_unverifiable | backward_unverifiable,
+            forward_unknown + backward_unknown < end,
+        ]
+    elif kind in (UPFLOW, IX):
+        conditions = [
+            empty | (neighbor_mismatch if kind == UPFLOW else False),
+            forward_invalid < end,
+            forward_unverifiable,
+            forward_unknown < end,
+        ]
+    else:
+        raise ValueError(f"Invalid verification kind: {kind}")
+
+    return np.select(conditions, [Invalid, Invalid, Unverifiable, Unknown], Valid).astype(np.uint8)
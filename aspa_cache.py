@@ -0,0 +1,92 @@
+from collections import OrderedDict
+from operator import attrgetter
+
+from aspa_logic import *
+
+
+segment_key = attrgetter('value', 'type')
+
+
+class VerdictCache:
+    # Bounded LRU cache in front of the ASPA check methods.
+    #
+    # Every entry remembers the (afi, customer ASN) records its verdict may
+    # depend on, so a record update evicts only the affected verdicts.
+    def __init__(self, aspa, maxsize=65536):
+        self.aspa = aspa
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.dependents = {}
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, kind, check, aspath, neighbor_as, afi):
+        path_key = aspath.key() if isinstance(aspath, ASPath) else tuple(map(segment_key, aspath))
+        key = kind, afi, neighbor_as, path_key
+        entry = self.entries.get(key, None)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        verdict = check(aspath, neighbor_as, afi)
+
+        afi_dependencies = {(afi, asn) for asn in dependencies(aspath)}
+        self.entries[key] = verdict, afi_dependencies
+        for dependency in afi_dependencies:
+            self.dependents.setdefault(dependency, set()).add(key)
+
+        if len(self.entries) > self.maxsize:
+            self.remove(next(iter(self.entries)))
+            self.evictions += 1
+        return verdict
+
+    def remove(self, key):
+        _, afi_dependencies = self.entries.pop(key)
+        for dependency in afi_dependencies:
+            keys = self.dependents[dependency]
+            keys.discard(key)
+            if not keys:
+                del self.dependents[dependency]
+
+    def check_upflow_path(self, aspath, neighbor_as, afi):
+        return self.lookup(UPFLOW, self.aspa.check_upflow_path, aspath, neighbor_as, afi)
+
+    def check_downflow_path(self, aspath, neighbor_as, afi):
+        return self.lookup(DOWNFLOW, self.aspa.check_downflow_path, aspath, neighbor_as, afi)
+
+    def check_ix_path(self, aspath, neighbor_as, afi):
+        # the IX verdict does not depend on the neighbor
+        return self.lookup(IX, self.aspa.check_ix_path, aspath, None, afi)
+
+    def invalidate(self, changed):
+        # changed: {afi: customer ASNs}, as returned by ASPA.apply_delta
+        for afi, customer_ases in changed.items():
+            for customer_as in customer_ases:
+                for key in list(self.dependents.get((afi, customer_as), ())):
+                    self.remove(key)
+                    self.invalidations += 1
+
+    def apply_delta(self, added=None, withdrawn=None):
+        changed = self.aspa.apply_delta(added, withdrawn)
+        self.invalidate(changed)
+        return changed
+
+    def clear(self):
+        self.entries.clear()
+        self.dependents.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+#
+# Verification daemon: one process owns the ASPA table and serves upflow,
+# downflow and IX verification to the route server, collectors and looking
+# glasses over a Unix or TCP socket.
+#
+#   python aspa_daemon.py --records records.json --unix /run/aspa.sock
+#
+#   client = await VerificationClient.connect_unix('/run/aspa.sock')
+#   verdict = await client.verify(aspath, neighbor_as, IPv4, UPFLOW)
+#   verdicts = await client.verify_many(routes)
+#
+# Every request is a header followed by the AS_PATH attribute body of the
+# path (4-byte ASNs, neighbor first, see aspa_wire):
+#
+#   request id (u32) | neighbor AS (u32) | afi (u8) | kind (u8) | length (u16)
+#
+# and answered with request id (u32) | verdict (u8), ERROR for a malformed
+# request. Clients pipeline requests and match the responses by id. The
+# requests of all connections that arrive within max_delay of each other
+# are verified in a single call, grouped by afi and kind, vectorized with
+# ASPA.verify_batch if numpy is available.
+#
+# The table can be kept in sync with RTRClient(server.aspa, host, port)
+# running on the same event loop.
+#
+import argparse
+import asyncio
+import logging
+import struct
+from array import array
+
+from aspa_logic import *
+from aspa_wire import WireError, encode_as_path, parse_as_path
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+request_header = struct.Struct('!IIBBH')
+response = struct.Struct('!IB')
+
+ERROR = 0xff
+
+AFIS = frozenset((IPv4, IPv6))
+KINDS = frozenset((UPFLOW, DOWNFLOW, IX))
+
+logger = logging.getLogger(__name__)
+
+
+class DaemonError(Exception):
+    pass
+
+
+def decode_requests(data):
+    # yields (request id, aspath or None if malformed, neighbor_as, afi,
+    # kind) of the complete requests in data; the last item is the offset of
+    # the first incomplete one
+    data = memoryview(data)
+    offset = 0
+    while offset + request_header.size <= len(data):
+        request_id, neighbor_as, afi, kind, length = request_header.unpack_from(data, offset)
+        end = offset + request_header.size + length
+        if end > len(data):
+            break
+        aspath = None
+        if afi in AFIS and kind in KINDS:
+            try:
+                aspath = parse_as_path(data[offset + request_header.size:end])
+            except WireError:
+                pass
+        yield request_id, aspath, neighbor_as, afi, kind
+        offset = end
+    yield offset
+
+
+def verify_requests(aspa, requests, batch_threshold=64):
+    # verdicts of the (request id, aspath, neighbor_as, afi, kind) requests,
+    # groups of batch_threshold or more paths go through verify_batch
+    verdicts = [ERROR] * len(requests)
+    groups = {}
+    for index, (_, aspath, _, afi, kind) in enumerate(requests):
+        if aspath is not None:
+            groups.setdefault((afi, kind), []).append(index)
+
+    check_path = aspa.check_path
+    for (afi, kind), indexes in groups.items():
+        if numpy is not None and len(indexes) >= batch_threshold:
+            paths = [requests[index][1] for index in indexes]
+            types = None
+            if any(aspath.types is not None for aspath in paths):
+                types = [aspath.types if aspath.types is not None else array('B', [AS_SEQUENCE]) * len(aspath)
+                         for aspath in paths]
+            try:
+                results = aspa.verify_batch([aspath.values for aspath in paths],
+                                            [requests[index][2] for index in indexes], afi, kind, types=types)
+            except TypeError:
+                # a record store verify_batch does not support, the paths
+                # are verified one by one below
+                results = None
+            except Exception:
+                logger.exception("verify_batch failed for %d paths, verifying them one by one", len(paths))
+                results = None
+            if results is not None:
+                for index, verdict in zip(indexes, results.tolist()):
+                    verdicts[index] = verdict
+                continue
+        for index in indexes:
+            request_id, aspath, neighbor_as, _, _ = requests[index]
+            try:
+                verdicts[index] = check_path(aspath, neighbor_as, afi, kind)[0]
+            except (WireError, ValueError):
+                # a path the checks reject, answered with ERROR
+                pass
+            except Exception:
+                # answered with ERROR as well, flush runs as an event loop
+                # callback and must not lose the rest of the batch
+                logger.exception("verification of request %d failed", request_id)
+    return verdicts
+
+
+class VerificationServer:
+    def __init__(self, aspa, max_batch=4096, max_delay=0.0, batch_threshold=64):
+        self.aspa = aspa
+        self.max_batch = max_batch
+        # seconds a request may wait for others to join its batch; with 0 the
+        # batch holds what arrived during the same event loop iteration
+        self.max_delay = max_delay
+        self.batch_threshold = batch_threshold
+        # (writer, request) waiting for the next flush
+        self.pending = []
+        self.timer = None
+        # writer -> task of the connection
+        self.connections = {}
+        self.servers = []
+        self.requests = self.batches = self.errors = 0
+
+    async def start(self, host='127.0.0.1', port=0):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        self.servers.append(server)
+        return server.sockets[0].getsockname()[:2]
+
+    async def start_unix(self, path):
+        self.servers.append(await asyncio.start_unix_server(self.handle_client, path))
+        return path
+
+    async def serve_forever(self):
+        await asyncio.gather(*(server.serve_forever() for server in self.servers))
+
+    async def stop(self):
+        self.flush()
+        for server in self.servers:
+            server.close()
+        for writer in list(self.connections):
+            writer.close()
+        await asyncio.gather(*self.connections.values(), return_exceptions=True)
+        for server in self.servers:
+            await server.wait_closed()
+        self.servers = []
+
+    async def handle_client(self, reader, writer):
+        self.connections[writer] = asyncio.current_task()
+        buffer = bytearray()
+        try:
+            while True:
+                data = await reader.read(1 << 16)
+                if not data:
+                    break
+                buffer += data
+                *requests, offset = decode_requests(buffer)
+                del buffer[:offset]
+                for request in requests:
+                    self.enqueue(writer, request)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections.pop(writer, None)
+            writer.close()
+
+    def enqueue(self, writer, request):
+        self.pending.append((writer, request))
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.max_delay, self.flush)
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+
+        requests = [request for _, request in pending]
+        verdicts = verify_requests(self.aspa, requests, self.batch_threshold)
+        responses = {}
+        for (writer, request), verdict in zip(pending, verdicts):
+            responses.setdefault(writer, bytearray()).extend(response.pack(request[0], verdict))
+        for writer, data in responses.items():
+            if not writer.is_closing():
+                writer.write(data)
+
+        self.requests += len(pending)
+        self.batches += 1
+        self.errors += verdicts.count(ERROR)
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'errors': self.errors,
+            'mean_batch': self.requests / self.batches if self.batches else 0.0,
+        }
+
+
+class VerificationClient:
+    def __init__(self, reader, writer):
+        self.reader, self.writer = reader, writer
+        self.next_id = 0
+        # request id -> future of the verdict
+        self.pending = {}
+        self.receiver = asyncio.ensure_future(self.receive())
+
+    @classmethod
+    async def connect(cls, host, port):
+        return cls(*await asyncio.open_connection(host, port))
+
+    @classmethod
+    async def connect_unix(cls, path):
+        return cls(*await asyncio.open_unix_connection(path))
+
+    def send(self, aspath, neighbor_as, afi, kind):
+        # queues a request without waiting for the daemon and returns the
+        # future of its verdict; aspath is an ASPath, a list of Segment
+        # objects or an already encoded AS_PATH attribute body
+        if self.receiver.done():
+            raise DaemonError("connection to the daemon is closed")
+        body = aspath if isinstance(aspath, (bytes, bytearray, memoryview)) else encode_as_path(aspath)
+        if len(body) > 0xffff:
+            raise DaemonError(f"AS_PATH of {len(body)} bytes exceeds the 65535 bytes of a request")
+        request_id = self.next_id
+        self.next_id = (request_id + 1) & 0xffffffff
+        self.writer.write(request_header.pack(request_id, neighbor_as, afi, kind, len(body)) + body)
+        future = self.pending[request_id] = asyncio.get_running_loop().create_future()
+        return future
+
+    async def drain(self):
+        # a lost connection fails the pending futures in receive()
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+
+    async def verify(self, aspath, neighbor_as, afi, kind):
+        future = self.send(aspath, neighbor_as, afi, kind)
+        await self.drain()
+        return await future
+
+    async def verify_many(self, routes):
+        # routes are (aspath, neighbor_as, afi, kind), all sent before the
+        # first verdict is awaited
+        futures = [self.send(*route) for route in routes]
+        await self.drain()
+        return await asyncio.gather(*futures)
+
+    async def receive(self):
+        buffer = bytearray()
+        try:
+            while True:
+                data = await self.reader.read(1 << 16)
+                if not data:
+                    break
+                buffer += data
+                end = len(buffer) - len(buffer) % response.size
+                for request_id, verdict in response.iter_unpack(memoryview(buffer)[:end]):
+                    future = self.pending.pop(request_id, None)
+                    if future is None or future.done():
+                        continue
+                    if verdict == ERROR:
+                        future.set_exception(DaemonError(f"daemon rejected request {request_id}"))
+                    else:
+                        future.set_result(verdict)
+                del buffer[:end]
+        except ConnectionError:
+            pass
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(DaemonError("connection to the daemon closed"))
+            self.pending.clear()
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+        await self.receiver
+
+
+async def serve(args):
+    from aspa_loader import load_records
+
+    server = VerificationServer(ASPA(load_records(args.records)), args.max_batch, args.max_delay)
+    if args.unix:
+        await server.start_unix(args.unix)
+    if args.listen or not args.unix:
+        host, _, port = (args.listen or '127.0.0.1:3323').rpartition(':')
+        await server.start(host, int(port))
+    await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="serve ASPA verification over a Unix or TCP socket")
+    parser.add_argument('--records', required=True, help="table (.json records, .snap snapshot or directory of .asa objects)")
+    parser.add_argument('--unix', help="path of the Unix socket to listen on")
+    parser.add_argument('--listen', help="host:port to listen on, 127.0.0.1:3323 without --unix")
+    parser.add_argument('--max-batch', type=int, default=4096)
+    parser.add_argument('--max-delay', type=float, default=0.0, help="seconds a request may wait for its batch")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+#
+# DER decoder for RPKI ASPA signed objects (.asa files) as defined by
+# RPKI-ASPA-2023.asn, loading a whole repository directory into the
+# {afi: {customer_as: set(providers)}} records ASPA expects.
+#
+#   aspa_records, report = load_directory('/var/lib/rpki-client')
+#   aspa = ASPA(aspa_records, store=CompactRecords)
+#
+# Only the eContent is decoded, signatures and certificates are assumed to
+# have been validated by the relying party software that fetched the files.
+#
+import mmap
+import os
+import time
+from multiprocessing import Pool
+
+from aspa_logic import *
+
+
+# DER tags
+INTEGER, OCTET_STRING, OBJECT_IDENTIFIER, SEQUENCE, SET = 0x02, 0x04, 0x06, 0x30, 0x31
+CONTEXT_0 = 0xa0
+
+# 1.2.840.113549.1.7.2 and 1.2.840.113549.1.9.16.1.49
+ID_SIGNED_DATA = bytes.fromhex('2a864886f70d010702')
+ID_CT_ASPA = bytes.fromhex('2a864886f70d0109100131')
+
+ASPA_VERSION = 1
+MAX_ASID = 2 ** 32 - 1
+
+
+class DERError(Exception):
+    pass
+
+
+def read_tlv(data, offset, expected_tag=None):
+    # returns (tag, value start, value end) of the element at offset
+    if offset + 2 > len(data):
+        raise DERError("truncated element")
+    tag, length = data[offset], data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        size = length & 0x7f
+        if size == 0 or size > 4 or offset + size > len(data):
+            raise DERError("unsupported length encoding")
+        length = int.from_bytes(data[offset:offset + size], 'big')
+        offset += size
+    if offset + length > len(data):
+        raise DERError("element exceeds its container")
+    if expected_tag is not None and tag != expected_tag:
+        raise DERError(f"expected tag 0x{expected_tag:02x}, found 0x{tag:02x}")
+    return tag, offset, offset + length
+
+
+def read_asid(data, offset):
+    _, start, end = read_tlv(data, offset, INTEGER)
+    if start == end:
+        raise DERError("empty INTEGER")
+    value = int.from_bytes(data[start:end], 'big', signed=True)
+    if not 0 <= value <= MAX_ASID:
+        raise DERError(f"ASID {value} out of range")
+    return value, end
+
+
+def decode_econtent(data):
+    # ASProviderAttestation -> (customer_as, providers)
+    _, offset, end = read_tlv(data, 0, SEQUENCE)
+
+    version = 0
+    if data[offset] == CONTEXT_0:
+        _, start, offset = read_tlv(data, offset)
+        _, start, stop = read_tlv(data, start, INTEGER)
+        version = int.from_bytes(data[start:stop], 'big', signed=True)
+    if version != ASPA_VERSION:
+        raise DERError(f"unsupported ASProviderAttestation version {version}")
+
+    customer_as, offset = read_asid(data, offset)
+    _, offset, providers_end = read_tlv(data, offset, SEQUENCE)
+    providers = []
+    while offset < providers_end:
+        provider_as, offset = read_asid(data, offset)
+        if providers and provider_as <= providers[-1]:
+            raise DERError("providers are not in strictly ascending order")
+        providers.append(provider_as)
+    if not providers:
+        raise DERError("empty ProviderASSet")
+    if customer_as in providers:
+        raise DERError("customer AS listed as its own provider")
+    if providers_end != end:
+        raise DERError("trailing data in ASProviderAttestation")
+    return customer_as, providers
+
+
+def decode_signed_object(data):
+    # ContentInfo -> SignedData -> EncapsulatedContentInfo -> eContent
+    _, offset, _ = read_tlv(data, 0, SEQUENCE)
+    _, start, offset = read_tlv(data, offset, OBJECT_IDENTIFIER)
+    if data[start:offset] != ID_SIGNED_DATA:
+        raise DERError("not a CMS SignedData object")
+    _, offset, _ = read_tlv(data, offset, CONTEXT_0)
+    _, offset, _ = read_tlv(data, offset, SEQUENCE)
+    _, _, offset = read_tlv(data, offset, INTEGER)
+    _, _, offset = read_tlv(data, offset, SET)
+
+    _, offset, _ = read_tlv(data, offset, SEQUENCE)
+    _, start, offset = read_tlv(data, offset, OBJECT_IDENTIFIER)
+    if data[start:offset] != ID_CT_ASPA:
+        raise DERError("eContentType is not id-ct-ASPA")
+    _, offset, _ = read_tlv(data, offset, CONTEXT_0)
+    _, start, end = read_tlv(data, offset, OCTET_STRING)
+    return decode_econtent(data[start:end])
+
+
+def decode_file(path):
+    # maps the file and decodes it in place, returns
+    # (path, customer_as, providers) or (path, None, error message)
+    try:
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return path, None, "empty file"
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                data = memoryview(mapped)
+                try:
+                    customer_as, providers = decode_signed_object(data)
+                except (DERError, IndexError) as error:
+                    # leaving the except block drops the traceback and with
+                    # it every view into the mapping before it is closed
+                    customer_as, providers = None, str(error) or "truncated object"
+                data.release()
+    except OSError as error:
+        return path, None, str(error)
+    return path, customer_as, providers
+
+
+def encode_tlv(tag, value):
+    length = len(value)
+    if length < 0x80:
+        return bytes([tag, length]) + value
+    size = (length.bit_length() + 7) // 8
+    return bytes([tag, 0x80 | size]) + length.to_bytes(size, 'big') + value
+
+
+def encode_asid(value):
+    return encode_tlv(INTEGER, value.to_bytes(value.bit_length() // 8 + 1, 'big'))
+
+
+def encode_signed_object(customer_as, providers):
+    # unsigned .asa object for tests and benchmarks: the SignedData carries
+    # the eContent but neither certificates nor signer infos
+    econtent = encode_tlv(SEQUENCE,
+                          encode_tlv(CONTEXT_0, encode_asid(ASPA_VERSION)) + encode_asid(customer_as) +
+                          encode_tlv(SEQUENCE, b''.join(encode_asid(provider) for provider in sorted(providers))))
+    encap = encode_tlv(SEQUENCE, encode_tlv(OBJECT_IDENTIFIER, ID_CT_ASPA) +
+                       encode_tlv(CONTEXT_0, encode_tlv(OCTET_STRING, econtent)))
+    signed_data = encode_tlv(SEQUENCE, encode_asid(3) + encode_tlv(SET, b'') + encap + encode_tlv(SET, b''))
+    return encode_tlv(SEQUENCE, encode_tlv(OBJECT_IDENTIFIER, ID_SIGNED_DATA) + encode_tlv(CONTEXT_0, signed_data))
+
+
+def find_objects(directory, suffix='.asa'):
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.endswith(suffix):
+                yield os.path.join(root, name)
+
+
+class DecodeReport:
+    def __init__(self):
+        self.parsed = 0
+        self.malformed = []
+        self.elapsed = 0.0
+
+    def objects_per_second(self):
+        return (self.parsed + len(self.malformed)) / self.elapsed if self.elapsed else 0.0
+
+
+def load_directory(directory, workers=None, chunksize=64, afis=(IPv4, IPv6)):
+    # ASPA objects are not AFI specific, every attestation is installed for
+    # all afis; several objects of the same customer are merged
+    report = DecodeReport()
+    aspa_records = {afi: {} for afi in afis}
+    started = time.perf_counter()
+
+    paths = find_objects(directory)
+    if workers == 1:
+        results = map(decode_file, paths)
+        pool = None
+    else:
+        pool = Pool(workers)
+        results = pool.imap_unordered(decode_file, paths, chunksize)
+
+    try:
+        for path, customer_as, providers in results:
+            if customer_as is None:
+                report.malformed.append((path, providers))
+                continue
+            report.parsed += 1
+            for afi in afis:
+                aspa_records[afi].setdefault(customer_as, set()).update(providers)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    report.elapsed = time.perf_counter() - started
+    return aspa_records, report
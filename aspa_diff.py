@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+#
+# Impact analysis of a new ASPA data set: the customer ASNs whose records
+# differ between two tables and the routes whose verdicts flip because of
+# them, without verifying the untouched routes at all.
+#
+#   python aspa_diff.py old.json new.snap --routes paths.jsonl.gz \
+#       --transitions transitions.jsonl
+#
+# A table is a records file as written by aspa_topology (.json), a snapshot
+# (.snap) or a directory of .asa objects; the routes are a paths file as
+# written by aspa_topology. From Python, against the routes of a RIB:
+#
+#   added, withdrawn = diff_records(old_records, new_records)
+#   report = impact(rib, ASPA(new_records), changed_customers(added, withdrawn))
+#
+import argparse
+import json
+import sys
+import time
+
+from aspa_logic import *
+from aspa_loader import load_records, records_dict
+from aspa_metrics import VERDICT_NAMES
+from aspa_topology import PathsError, iter_routes, open_text
+
+
+def diff_records(old_records, new_records):
+    # returns the (added, withdrawn) delta that turns old_records into
+    # new_records, in the format of ASPA.apply_delta
+    old_records, new_records = records_dict(old_records), records_dict(new_records)
+    added, withdrawn = {}, {}
+    for afi in set(old_records) | set(new_records):
+        old_afi, new_afi = old_records.get(afi, {}), new_records.get(afi, {})
+        added_afi = {customer_as: providers for customer_as, providers in new_afi.items()
+                     if old_afi.get(customer_as, None) != providers}
+        withdrawn_afi = [customer_as for customer_as in old_afi if customer_as not in new_afi]
+        if added_afi:
+            added[afi] = added_afi
+        if withdrawn_afi:
+            withdrawn[afi] = withdrawn_afi
+    return added, withdrawn
+
+
+def changed_customers(added, withdrawn):
+    changed = {}
+    for delta in (added, withdrawn):
+        for afi, customer_ases in delta.items():
+            changed.setdefault(afi, set()).update(customer_ases)
+    return changed
+
+
+class ImpactReport:
+    def __init__(self, changed):
+        self.changed = changed
+        self.routes = 0
+        self.affected = 0
+        # (key, old verdict, new verdict)
+        self.transitions = []
+        self.elapsed = 0.0
+
+    def summary(self):
+        flips = {}
+        for _, old_verdict, new_verdict in self.transitions:
+            name = f"{VERDICT_NAMES[old_verdict]}->{VERDICT_NAMES[new_verdict]}"
+            flips[name] = flips.get(name, 0) + 1
+        return {
+            'changed_customers': {afi: len(customer_ases) for afi, customer_ases in self.changed.items()},
+            'routes': self.routes,
+            'affected_routes': self.affected,
+            'transitions': len(self.transitions),
+            'flips': dict(sorted(flips.items())),
+            'elapsed': round(self.elapsed, 3),
+        }
+
+
+def impact(rib, aspa, changed):
+    # verdicts of the routes of an aspa_rib.RIB under aspa, the new data
+    # set, compared with the verdicts stored in the RIB; the RIB itself is
+    # left untouched
+    started = time.perf_counter()
+    report = ImpactReport(changed)
+    report.routes = len(rib)
+    keys = rib.affected(changed)
+    report.affected = len(keys)
+    for key in keys:
+        aspath, neighbor_as, afi, kind, old_verdict = rib.routes[key]
+        new_verdict = aspa.check_path(aspath, neighbor_as, afi, kind)[0]
+        if new_verdict != old_verdict:
+            report.transitions.append((key, old_verdict, new_verdict))
+    report.elapsed = time.perf_counter() - started
+    return report
+
+
+def impact_routes(routes, old_aspa, new_aspa, changed):
+    # routes are (key, aspath, neighbor_as, afi, kind); only the routes with
+    # a changed customer ASN in their AS_PATH are verified, under both sets
+    started = time.perf_counter()
+    report = ImpactReport(changed)
+    for key, aspath, neighbor_as, afi, kind in routes:
+        report.routes += 1
+        changed_afi = changed.get(afi, None)
+        if not changed_afi:
+            continue
+        if changed_afi.isdisjoint(dependencies(aspath)):
+            continue
+        report.affected += 1
+        old_verdict = old_aspa.check_path(aspath, neighbor_as, afi, kind)[0]
+        new_verdict = new_aspa.check_path(aspath, neighbor_as, afi, kind)[0]
+        if new_verdict != old_verdict:
+            report.transitions.append((key, old_verdict, new_verdict))
+    report.elapsed = time.perf_counter() - started
+    return report
+
+
+def read_routes(file):
+    # the routes of aspa_topology.iter_routes keyed by the route object
+    # itself and its line number, which is all a transition has to report
+    for _, line, route, item in iter_routes([file]):
+        route['line'] = line
+        yield (route, *item)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="routes whose ASPA verdict changes with a new ASPA data set")
+    parser.add_argument('old', help="deployed table (.json records, .snap snapshot or directory of .asa objects)")
+    parser.add_argument('new', help="table to be deployed")
+    parser.add_argument('--routes', required=True, help="paths file (JSON lines, .gz compressed or - for stdin)")
+    parser.add_argument('--transitions', help="write the transitions as JSON lines, - for stdout")
+    args = parser.parse_args()
+
+    old_records, new_records = load_records(args.old), load_records(args.new)
+    added, withdrawn = diff_records(old_records, new_records)
+    changed = changed_customers(added, withdrawn)
+
+    file = sys.stdin if args.routes == '-' else open_text(args.routes)
+    with file:
+        try:
+            report = impact_routes(read_routes(file), ASPA(old_records), ASPA(new_records), changed)
+        except PathsError as error:
+            raise SystemExit(f"{parser.prog}: {error}")
+
+    if args.transitions:
+        output = sys.stdout if args.transitions == '-' else open_text(args.transitions, 'w')
+        for route, old_verdict, new_verdict in report.transitions:
+            route.update(old=VERDICT_NAMES[old_verdict], new=VERDICT_NAMES[new_verdict])
+            output.write(json.dumps(route) + '\n')
+        if output is not sys.stdout:
+            output.close()
+
+    print(json.dumps(report.summary()), file=sys.stderr if args.transitions == '-' else sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#
+# Multi-process verification engine: every worker maps the same ASPA
+# snapshot (see aspa_snapshot) instead of receiving a pickled copy of the
+# records, and chunks of routes are verified in parallel.
+#
+#   with VerificationEngine('aspa.snap', workers=8) as engine:
+#       for verdict in engine.verify(routes):
+#           ...
+#
+# A route is (aspath, neighbor_as, afi, kind), where aspath holds the path
+# items of the aspa_topology paths files (ASNs, AS_SET members grouped in a
+# nested list) in the order the ASPA check methods expect, and kind is
+# UPFLOW, DOWNFLOW or IX. The workers convert them with
+# aspa_topology.to_segments, paths in another form need another convert
+# function.
+#
+import os
+import tempfile
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
+
+from aspa_logic import *
+from aspa_snapshot import load_snapshot, write_snapshot
+from aspa_topology import to_segments
+
+
+worker_checks = worker_error = None
+
+
+def init_worker(snapshot_path):
+    global worker_checks, worker_error
+    try:
+        aspa = ASPA(load_snapshot(snapshot_path))
+    except Exception as error:
+        # an initializer that raises makes the Pool respawn the worker
+        # forever, the error is raised by verify_chunk instead
+        worker_error = error
+        return
+    worker_checks = {UPFLOW: aspa.check_upflow_path, DOWNFLOW: aspa.check_downflow_path, IX: aspa.check_ix_path}
+
+
+def verify_chunk(routes, convert=to_segments):
+    if worker_error is not None:
+        raise worker_error
+    checks = worker_checks
+    return [checks[kind](convert(aspath), neighbor_as, afi) for aspath, neighbor_as, afi, kind in routes]
+
+
+class VerificationEngine:
+    def __init__(self, snapshot_path, workers=None, chunksize=2048, max_pending=None, convert=to_segments):
+        self.workers = workers or os.cpu_count()
+        self.chunksize = chunksize
+        # a module level function, the workers receive it by name
+        self.convert = convert
+        # a missing or corrupt snapshot is reported here, not by every worker
+        load_snapshot(snapshot_path).close()
+        # bounds the routes held in memory to max_pending chunks
+        self.max_pending = max_pending or 4 * self.workers
+        self.pool = Pool(self.workers, initializer=init_worker, initargs=(snapshot_path,))
+        self.temporary = None
+
+    @classmethod
+    def from_records(cls, aspa_records, **kwargs):
+        # writes the records to a temporary snapshot that is removed on close()
+        temporary = tempfile.TemporaryDirectory()
+        path = os.path.join(temporary.name, 'aspa.snap')
+        write_snapshot(path, aspa_records)
+        engine = cls(path, **kwargs)
+        engine.temporary = temporary
+        return engine
+
+    def verify(self, routes):
+        # yields the verdicts in the order of routes
+        routes = iter(routes)
+        pending = deque()
+        while True:
+            chunk = list(islice(routes, self.chunksize))
+            if chunk:
+                pending.append(self.pool.apply_async(verify_chunk, (chunk, self.convert)))
+            if pending and (not chunk or len(pending) >= self.max_pending):
+                yield from pending.popleft().get()
+            elif not chunk:
+                return
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        if self.temporary is not None:
+            self.temporary.cleanup()
+            self.temporary = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
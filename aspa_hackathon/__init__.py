@@ -0,0 +1,4 @@
+#
+# The AS_PATH verification algorithms of the IETF hackathon, see README.md.
+# aspa_backends registers them as verification backends.
+#
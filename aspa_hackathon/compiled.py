@@ -0,0 +1,86 @@
+from .structs import ASPADirection, ASPAVerificationResult
+
+
+# Hop codes of the compiled hop vectors
+NA, NP, P = 0, 1, 2
+P_BYTE = bytes([P])
+
+
+# Classifies every adjacent pair of the AS_PATH once in each direction:
+#   up[i - 1]   = hop(AS(i), AS(i+1))
+#   down[i - 1] = hop(AS(i+1), AS(i))
+# for 1 ≤ i ≤ N-1, with AS(1) being the origin AS. Without downstream only
+# the up vector is compiled and down is None.
+def compile_path(aspa, asPath, downstream=True):
+    N = len(asPath)
+    up = bytearray(N - 1)
+    if not downstream:
+        for i in range(1, N):
+            providers = aspa.get(asPath[N - i])
+            if providers is not None:
+                up[i - 1] = P if asPath[N - i - 1] in providers else NP
+        return up, None
+
+    down = bytearray(N - 1)
+    for i in range(1, N):
+        a, b = asPath[N - i], asPath[N - i - 1]
+        providers = aspa.get(a)
+        if providers is not None:
+            up[i - 1] = P if b in providers else NP
+        providers = aspa.get(b)
+        if providers is not None:
+            down[i - 1] = P if a in providers else NP
+    return up, down
+
+
+# Section 6.1. Algorithm for Upstream Paths
+def verify_upstream(up) -> ASPAVerificationResult:
+    if NP in up:
+        return ASPAVerificationResult.INVALID
+    if NA in up:
+        return ASPAVerificationResult.UNKNOWN
+    return ASPAVerificationResult.VALID
+
+
+# Section 6.2.2. Formal Procedure for Verification of Downstream Paths
+def verify_downstream(up, down) -> ASPAVerificationResult:
+    N = len(up) + 1
+    if N <= 2:
+        return ASPAVerificationResult.VALID
+
+    # u_min: lowest u with hop(AS(u-1), AS(u)) = nP+, else N+1
+    # v_max: highest v with hop(AS(v+1), AS(v)) = nP+, else 0
+    u_min = up.find(NP) + 2 if NP in up else N + 1
+    v_max = down.rfind(NP) + 1
+    if u_min <= v_max:
+        return ASPAVerificationResult.INVALID
+
+    # Up-ramp ends at K, down-ramp starts at L
+    K = 1 + len(up) - len(up.lstrip(P_BYTE))
+    L = N - (len(down) - len(down.rstrip(P_BYTE)))
+    if L - K <= 1:
+        return ASPAVerificationResult.VALID
+    return ASPAVerificationResult.UNKNOWN
+
+
+# draft_algorithm with every hop evaluated exactly once per direction
+def compiled_algorithm(aspa, asPath, direction: ASPADirection) -> ASPAVerificationResult:
+    if len(asPath) == 0:
+        raise ValueError("AS_PATH cannot have length zero")
+
+    if direction == ASPADirection.UPSTREAM:
+        up, _ = compile_path(aspa, asPath, downstream=False)
+        return verify_upstream(up)
+    elif direction == ASPADirection.DOWNSTREAM:
+        up, down = compile_path(aspa, asPath)
+        return verify_downstream(up, down)
+    raise ValueError("Invalid ASPA direction")
+
+
+# Both verification outcomes (UPSTREAM, DOWNSTREAM) from a single compilation
+def compiled_verify_both(aspa, asPath):
+    if len(asPath) == 0:
+        raise ValueError("AS_PATH cannot have length zero")
+
+    up, down = compile_path(aspa, asPath)
+    return verify_upstream(up), verify_downstream(up, down)
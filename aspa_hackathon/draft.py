@@ -1,6 +1,6 @@
 from enum import Enum
-from structs import ASPADirection, ASPAVerificationResult, Hop, inclusiveRange, inclusiveRangeInverse
-from simple import new_algorithm
+from .structs import ASPADirection, ASPAVerificationResult, Hop, inclusiveRange, inclusiveRangeInverse
+from .simple import new_algorithm
 
 
 # Performs draft-ietf-sidrops-aspa-verification-16 verification algorithm
@@ -1,6 +1,6 @@
 from enum import Enum
-from structs import ASPADirection, ASPAVerificationResult, Hop
-from simple import new_algorithm
+from .structs import ASPADirection, ASPAVerificationResult, Hop
+from .simple import new_algorithm
 
 
 #  Simplified AS_PATH verification algorithm
@@ -2,7 +2,7 @@
 
 from enum import Enum
 from typing import List, Dict
-from structs import Hop, ASPAVerificationResult, ASPADirection
+from .structs import Hop, ASPAVerificationResult, ASPADirection
 
 
 def new_algorithm(aspa: Dict[int, List[int]], as_path: List[int], direction: ASPADirection) -> ASPAVerificationResult:
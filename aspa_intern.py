@@ -0,0 +1,96 @@
+#
+# Path interning for bulk validation of full tables: every distinct AS_PATH
+# is stored once and routes keep only its path id, and each distinct
+# (path, neighbor, afi, kind) is verified once.
+#
+#   table = RouteTable()
+#   for prefix, peer_as, afi, aspath in MRTReader(aspa).read_routes(path):
+#       table.add(aspath, peer_as, afi, DOWNFLOW)
+#   verdicts = list(table.verify(aspa))
+#   table.stats()
+#
+from array import array
+
+from aspa_logic import *
+
+
+class PathInterner:
+    def __init__(self):
+        # path id -> ASPath and back
+        self.paths = []
+        self.ids = {}
+        self.references = 0
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, path_id):
+        return self.paths[path_id]
+
+    def intern(self, aspath):
+        # aspath is an ASPath or a list of Segment objects
+        if not isinstance(aspath, ASPath):
+            aspath = ASPath.from_segments(aspath)
+        self.references += 1
+        path_id = self.ids.get(aspath, None)
+        if path_id is None:
+            path_id = self.ids[aspath] = len(self.paths)
+            self.paths.append(aspath)
+        return path_id
+
+
+class RouteTable:
+    # routes as columns of path ids, neighbor ASNs, afis and kinds
+    def __init__(self, interner=None):
+        self.interner = interner if interner is not None else PathInterner()
+        self.path_ids = array('I')
+        self.neighbors = array(ASN_TYPECODE)
+        self.afis = array('B')
+        self.kinds = array('B')
+        self.verifications = self.verified_routes = 0
+
+    def __len__(self):
+        return len(self.path_ids)
+
+    def __getitem__(self, index):
+        return (self.interner[self.path_ids[index]], self.neighbors[index], self.afis[index], self.kinds[index])
+
+    def add(self, aspath, neighbor_as, afi, kind):
+        self.path_ids.append(self.interner.intern(aspath))
+        self.neighbors.append(neighbor_as)
+        self.afis.append(afi)
+        self.kinds.append(kind)
+        return len(self.path_ids) - 1
+
+    def extend(self, routes):
+        # routes are (aspath, neighbor_as, afi, kind)
+        for aspath, neighbor_as, afi, kind in routes:
+            self.add(aspath, neighbor_as, afi, kind)
+
+    def verify(self, aspa):
+        # yields the verdict of every route in order; verdicts are only
+        # remembered for the duration of the call, so ASPA updates in
+        # between two calls are always taken into account
+        check_path = aspa.check_path
+        paths = self.interner.paths
+        verdicts = {}
+        for route in zip(self.path_ids, self.neighbors, self.afis, self.kinds):
+            verdict = verdicts.get(route, None)
+            if verdict is None:
+                path_id, neighbor_as, afi, kind = route
+                verdict = verdicts[route] = check_path(paths[path_id], neighbor_as, afi, kind)[0]
+            yield verdict
+        self.verifications += len(verdicts)
+        self.verified_routes += len(self.path_ids)
+
+    def stats(self):
+        routes, unique_paths = len(self.path_ids), len(self.interner)
+        return {
+            'routes': routes,
+            'unique_paths': unique_paths,
+            'routes_per_path': routes / unique_paths if unique_paths else 0.0,
+            'verified_routes': self.verified_routes,
+            'verifications': self.verifications,
+            'saved_verifications': self.verified_routes - self.verifications,
+            'saved_ratio': 1 - self.verifications / self.verified_routes if self.verified_routes else 0.0,
+        }
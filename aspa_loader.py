@@ -0,0 +1,23 @@
+#
+# Loading an ASPA table from any of the formats the tools accept.
+#
+#   aspa = ASPA(load_records('records.json'))
+#   aspa_records = records_dict(load_records('aspa.snap'))
+#
+# A table is a records file as written by aspa_topology (.json), a snapshot
+# (.snap) or a directory of .asa objects.
+#
+import os
+
+from aspa_logic import records_dict
+from aspa_der import load_directory
+from aspa_snapshot import load_snapshot
+from aspa_topology import read_records
+
+
+def load_records(path):
+    if os.path.isdir(path):
+        return load_directory(path)[0]
+    if path.endswith('.snap'):
+        return load_snapshot(path)
+    return read_records(path)
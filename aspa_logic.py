@@ -1,7 +1,15 @@
+import re
+from array import array
+from itertools import groupby
+from operator import attrgetter
 
 IPv4, IPv6 = 4, 6
 AS_SET, AS_SEQUENCE, AS_CONFED_SEQUENCE, AS_CONFED_SET = range(1, 5)
 Valid, Invalid, Unknown, Unverifiable = range(4)
+UPFLOW, DOWNFLOW, IX = range(3)
+
+# array typecode holding an unsigned 32-bit ASN
+ASN_TYPECODE = 'I' if array('I').itemsize == 4 else 'L'
 
 
 class Segment:
@@ -9,9 +17,193 @@ class Segment:
         self.value, self.type = value, type
 
 
+# brackets of the non AS_SEQUENCE segments in the textual AS_PATH notation
+SEGMENT_BRACKETS = {AS_SET: '{}', AS_CONFED_SEQUENCE: '()', AS_CONFED_SET: '[]'}
+SEGMENT_OPENING = {brackets[0]: segment_type for segment_type, brackets in SEGMENT_BRACKETS.items()}
+PATH_TOKENS = re.compile(r'[{}()\[\]]|\d+|[^\s,]')
+
+
+class ASPath:
+    # Run-length AS_PATH, origin first like the ASPA check methods expect:
+    #   values - ASN of every run of equal (asn, segment type) hops
+    #   types  - segment type of every run, None if all are AS_SEQUENCE
+    #   counts - hops of every run, None if nothing is prepended
+    # Indexing and iteration yield one Segment per run.
+    __slots__ = ('values', 'types', 'counts')
+
+    def __init__(self, hops=()):
+        # hops are (asn, segment type) pairs
+        values, types, counts = array(ASN_TYPECODE), array('B'), array('H')
+        previous = None
+        for hop in hops:
+            if hop == previous and counts[-1] < 0xffff:
+                counts[-1] += 1
+            else:
+                values.append(hop[0])
+                types.append(hop[1])
+                counts.append(1)
+                previous = hop
+        self.values = values
+        self.types = None if types.count(AS_SEQUENCE) == len(types) else types
+        self.counts = None if counts.count(1) == len(counts) else counts
+
+    @classmethod
+    def from_list(cls, items):
+        # items are ASNs (AS_SEQUENCE members) or (asn, segment type) pairs
+        if all(isinstance(item, int) for item in items):
+            return cls.from_sequence(items)
+        return cls((item, AS_SEQUENCE) if isinstance(item, int) else tuple(item) for item in items)
+
+    @classmethod
+    def from_sequence(cls, asns):
+        # AS_SEQUENCE only path, the common case without a per-hop tuple
+        values, counts = array(ASN_TYPECODE), array('H')
+        previous = None
+        for asn in asns:
+            if asn == previous and counts[-1] < 0xffff:
+                counts[-1] += 1
+            else:
+                values.append(asn)
+                counts.append(1)
+                previous = asn
+        return cls.from_runs(values, None, None if counts.count(1) == len(counts) else counts)
+
+    @classmethod
+    def from_runs(cls, values, types=None, counts=None):
+        # adopts already collapsed run arrays, see the class comment
+        path = cls.__new__(cls)
+        path.values, path.types, path.counts = values, types, counts
+        return path
+
+    @classmethod
+    def from_segments(cls, segments):
+        return cls((segment.value, segment.type) for segment in segments)
+
+    @classmethod
+    def from_string(cls, text):
+        # textual notation with the neighbor first, e.g. '3356 13238 13238 {1 2}',
+        # with (...) for AS_CONFED_SEQUENCE and [...] for AS_CONFED_SET
+        hops = []
+        segment_type, closing = AS_SEQUENCE, None
+        for token in PATH_TOKENS.findall(text):
+            if token.isdigit():
+                hops.append((int(token), segment_type))
+            elif token in SEGMENT_OPENING and closing is None:
+                segment_type = SEGMENT_OPENING[token]
+                closing = SEGMENT_BRACKETS[segment_type][1]
+            elif token == closing:
+                segment_type, closing = AS_SEQUENCE, None
+            else:
+                raise ValueError(f"unexpected {token!r} in AS_PATH {text!r}")
+        if closing is not None:
+            raise ValueError(f"unterminated segment in AS_PATH {text!r}")
+        hops.reverse()
+        return cls(hops)
+
+    @classmethod
+    def from_wire(cls, data, as4=True):
+        # body of an AS_PATH (as4=False: 2-byte ASNs) or AS4_PATH attribute,
+        # see aspa_wire for merging both
+        from aspa_wire import parse_as_path
+        return parse_as_path(data, as4)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        return Segment(self.values[index], AS_SEQUENCE if self.types is None else self.types[index])
+
+    def __iter__(self):
+        if self.types is None:
+            return (Segment(value, AS_SEQUENCE) for value in self.values)
+        return map(Segment, self.values, self.types)
+
+    def __eq__(self, other):
+        if not isinstance(other, ASPath):
+            return NotImplemented
+        return self.values == other.values and self.types == other.types and self.counts == other.counts
+
+    def __hash__(self):
+        return hash((self.values.tobytes(), self.types and self.types.tobytes(), self.counts and self.counts.tobytes()))
+
+    def key(self):
+        # hashable key of the runs, equal for paths that only differ in
+        # their prepends and therefore always verify the same
+        return self.values.tobytes(), None if self.types is None else self.types.tobytes()
+
+    def hops(self):
+        return len(self.values) if self.counts is None else sum(self.counts)
+
+    def segments(self):
+        # the uncompressed list of Segment objects
+        if self.counts is None:
+            return list(self)
+        return [segment for segment, count in zip(self, self.counts) for _ in range(count)]
+
+    def __str__(self):
+        # the notation of from_string
+        items = []
+        for segment_type, group in groupby(reversed(self.segments()), key=attrgetter('type')):
+            asns = ' '.join(str(segment.value) for segment in group)
+            if segment_type in SEGMENT_BRACKETS:
+                asns = SEGMENT_BRACKETS[segment_type][0] + asns + SEGMENT_BRACKETS[segment_type][1]
+            items.append(asns)
+        return ' '.join(items)
+
+
+def records_dict(aspa_records):
+    # record stores answer with the {afi: {customer_as: set(providers)}} dict
+    return aspa_records if isinstance(aspa_records, dict) else aspa_records.to_dict()
+
+
+def dependencies(aspath):
+    # customer ASNs the verdict of aspath depends on: only AS_SEQUENCE
+    # members are ever looked up as customers
+    return {segment.value for segment in aspath if segment.type == AS_SEQUENCE}
+
+
 class ASPA:
-    def __init__(self, aspa_records):
+    def __init__(self, aspa_records, store=None):
+        # store converts the {afi: {customer_as: set(providers)}} dict into
+        # an alternative layout, e.g. aspa_store.CompactRecords
+        if store is not None:
+            aspa_records = store(aspa_records)
         self.aspa_records = aspa_records
+        self.serial = 0
+        self._batch_tables = {}
+
+        # non-dict layouts answer the pair lookups themselves
+        if not isinstance(aspa_records, dict):
+            self.verify_pair = aspa_records.verify_pair
+
+    def apply_delta(self, added=None, withdrawn=None):
+        # added: {afi: {customer_as: providers}} records to add or replace
+        # withdrawn: {afi: customer ASNs} records to remove
+        # returns {afi: set(customer ASNs whose record actually changed)}
+        added, withdrawn = added or {}, withdrawn or {}
+        if isinstance(self.aspa_records, dict):
+            changed = {}
+            for afi in set(added) | set(withdrawn):
+                added_afi = added.get(afi, {})
+                records_afi = self.aspa_records.setdefault(afi, {}) if added_afi else self.aspa_records.get(afi, {})
+                changed_afi = set()
+                for customer_as in withdrawn.get(afi, ()):
+                    if customer_as not in added_afi and records_afi.pop(customer_as, None) is not None:
+                        changed_afi.add(customer_as)
+                for customer_as, providers in added_afi.items():
+                    providers = set(providers)
+                    if records_afi.get(customer_as, None) != providers:
+                        records_afi[customer_as] = providers
+                        changed_afi.add(customer_as)
+                if changed_afi:
+                    changed[afi] = changed_afi
+        else:
+            changed = self.aspa_records.apply_delta(added, withdrawn)
+
+        for afi in changed:
+            self._batch_tables.pop(afi, None)
+        self.serial += 1
+        return changed
 
     def verify_pair(self, as1, as2, afi):
         aspa_records_afi = self.aspa_records.get(afi, None)
@@ -52,55 +244,144 @@ class ASPA:
 
         return index - 1, unknown_index - 1 if unknown_index else index - 1, unverifiable_flag
 
-    def check_upflow_path(self, aspath, neighbor_as, afi):
-        if len(aspath) == 0:
-            return Invalid
+    def verify_path(self, aspath, afi, kind):
+        # single pass verification kernel behind the check methods, without
+        # the neighbor check; returns (verdict, position) where position is
+        # the index into aspath of the segment after the first Invalid
+        # (Unknown) pair of the up-ramp, or None for Valid and Unverifiable;
+        # for an ASPath, positions are indexes of its runs
+        if isinstance(aspath, ASPath):
+            if aspath.types is None:
+                return self.verify_sequence(aspath.values, afi, kind)
+            aspath = list(aspath)
 
-        if aspath[-1].type == AS_SEQUENCE and aspath[-1].value != neighbor_as:
-            return Invalid
+        verify_pair = self.verify_pair
+        aspath_len = len(aspath)
+        forward_invalid = forward_unknown = aspath_len
+        unverifiable = False
 
-        forward_invalid_index, forward_unknown_index, forward_unverifiable = self.get_indexes(aspath, afi)
+        # up-ramp from the origin, stops at the first Invalid pair
+        as1 = 0
+        for index, segment in enumerate(aspath):
+            if segment.type != AS_SEQUENCE:
+                as1 = 0
+                unverifiable = True
+            elif as1 != segment.value:
+                if as1:
+                    pair_check = verify_pair(as1, segment.value, afi)
+                    if pair_check != Valid:
+                        if forward_unknown == aspath_len:
+                            forward_unknown = index
+                        if pair_check == Invalid:
+                            forward_invalid = index
+                            break
+                as1 = segment.value
 
-        aspath_len = len(aspath)
-        if forward_invalid_index < aspath_len:
-            return Invalid
-        if forward_unverifiable:
-            return Unverifiable
-        if forward_unknown_index < aspath_len:
-            return Unknown
-        return Valid
+        if kind != DOWNFLOW:
+            if forward_invalid < aspath_len:
+                return Invalid, forward_invalid
+            if unverifiable:
+                return Unverifiable, None
+            if forward_unknown < aspath_len:
+                return Unknown, forward_unknown
+            return Valid, None
 
-    def check_downflow_path(self, aspath, neighbor_as, afi):
-        if len(aspath) == 0:
-            return Invalid
+        # down-ramp from the neighbor, walked in place down to the first
+        # non-Valid pair of the up-ramp: the path is Invalid if it also
+        # breaks at or after the up-ramp, Unknown if a pair is not Valid
+        backward_unknown = False
+        as1 = 0
+        index = aspath_len
+        for segment in reversed(aspath):
+            index -= 1
+            if index < forward_invalid and (unverifiable or backward_unknown) or index < forward_unknown:
+                break
+            if segment.type != AS_SEQUENCE:
+                as1 = 0
+                unverifiable = True
+            elif as1 != segment.value:
+                if as1:
+                    pair_check = verify_pair(as1, segment.value, afi)
+                    if pair_check != Valid:
+                        if pair_check == Invalid and index >= forward_invalid:
+                            return Invalid, forward_invalid
+                        backward_unknown = True
+                as1 = segment.value
 
-        if aspath[-1].type == AS_SEQUENCE and aspath[-1].value != neighbor_as:
-            return Invalid
+        if unverifiable:
+            return Unverifiable, None
+        if backward_unknown:
+            return Unknown, forward_unknown
+        return Valid, None
 
-        forward_invalid_index, forward_unknown_index, forward_unverifiable = self.get_indexes(aspath, afi)
-        backward_invalid_index, backward_unknown_index, backward_unverifiable = self.get_indexes(list(reversed(aspath)), afi)
+    def verify_sequence(self, values, afi, kind):
+        # verify_path for the run ASNs of an AS_SEQUENCE only ASPath, where
+        # neighboring values never repeat
+        verify_pair = self.verify_pair
+        runs = len(values)
+        forward_invalid = forward_unknown = runs
 
-        aspath_len = len(aspath)
-        if forward_invalid_index + backward_invalid_index < aspath_len:
-            return Invalid
-        if forward_unverifiable or backward_unverifiable:
-            return Unverifiable
-        if forward_unknown_index + backward_unknown_index < aspath_len:
-            return Unknown
-        return Valid
+        as1 = 0
+        for index, value in enumerate(values):
+            if as1 and as1 != value:
+                pair_check = verify_pair(as1, value, afi)
+                if pair_check != Valid:
+                    if forward_unknown == runs:
+                        forward_unknown = index
+                    if pair_check == Invalid:
+                        forward_invalid = index
+                        break
+            as1 = value
 
-    def check_ix_path(self, aspath, neighbor_as, afi):
+        if forward_invalid < runs:
+            if kind != DOWNFLOW:
+                return Invalid, forward_invalid
+        elif forward_unknown == runs:
+            return Valid, None
+        elif kind != DOWNFLOW:
+            return Unknown, forward_unknown
+
+        backward_unknown = False
+        as1 = 0
+        index = runs
+        for value in reversed(values):
+            index -= 1
+            if index < forward_unknown or backward_unknown and index < forward_invalid:
+                break
+            if as1 and as1 != value:
+                pair_check = verify_pair(as1, value, afi)
+                if pair_check != Valid:
+                    if pair_check == Invalid and index >= forward_invalid:
+                        return Invalid, forward_invalid
+                    backward_unknown = True
+            as1 = value
+
+        if backward_unknown:
+            return Unknown, forward_unknown
+        return Valid, None
+
+    def check_path(self, aspath, neighbor_as, afi, kind):
+        # (verdict, position) of check_upflow_path, check_downflow_path or
+        # check_ix_path; position is len(aspath) - 1 for a neighbor mismatch
         if len(aspath) == 0:
-            return Invalid
+            return Invalid, None
 
-        forward_invalid_index, forward_unknown_index, forward_unverifiable = self.get_indexes(aspath, afi)
+        if kind != IX and aspath[-1].type == AS_SEQUENCE and aspath[-1].value != neighbor_as:
+            return Invalid, len(aspath) - 1
 
-        aspath_len = len(aspath)
-        if forward_invalid_index < aspath_len:
-            return Invalid
-        if forward_unverifiable:
-            return Unverifiable
-        if forward_unknown_index < aspath_len:
-            return Unknown
-        return Valid
+        return self.verify_path(aspath, afi, kind)
+
+    def check_upflow_path(self, aspath, neighbor_as, afi):
+        return self.check_path(aspath, neighbor_as, afi, UPFLOW)[0]
+
+    def check_downflow_path(self, aspath, neighbor_as, afi):
+        return self.check_path(aspath, neighbor_as, afi, DOWNFLOW)[0]
+
+    def check_ix_path(self, aspath, neighbor_as, afi):
+        return self.check_path(aspath, neighbor_as, afi, IX)[0]
 
+    def verify_batch(self, paths, neighbor_ases, afi, kind, lengths=None, types=None):
+        # vectorized check_upflow_path/check_downflow_path/check_ix_path over
+        # many paths at once, see aspa_batch.verify_batch (requires numpy)
+        from aspa_batch import verify_batch
+        return verify_batch(self, paths, neighbor_ases, afi, kind, lengths, types)
@@ -0,0 +1,157 @@
+#
+# Instrumentation of the ASPA verification hot path.
+#
+#   metrics = Metrics(aspa)
+#   metrics.enable()
+#   ...
+#   metrics.snapshot()
+#   metrics.write_prometheus('/var/lib/node_exporter/aspa.prom')
+#
+# enable() shadows verify_pair and check_path of the ASPA instance with
+# counting wrappers, the same way ASPA itself installs the verify_pair of a
+# record store; disable() removes them again, so that verification without
+# instrumentation runs the unmodified methods at no cost at all.
+#
+import os
+import time
+from bisect import bisect_left
+
+from aspa_logic import *
+
+
+DIRECTION_NAMES = {UPFLOW: 'upflow', DOWNFLOW: 'downflow', IX: 'ix'}
+VERDICT_NAMES = {Valid: 'valid', Invalid: 'invalid', Unknown: 'unknown', Unverifiable: 'unverifiable'}
+
+COUNT_BOUNDS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 12, 16, 24, 32, 64)
+LATENCY_BOUNDS = (250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 1000000)
+
+
+class Histogram:
+    # observations <= bounds[i] are counted in counts[i], the rest in counts[-1]
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        return {'bounds': list(self.bounds), 'counts': list(self.counts), 'sum': self.sum, 'count': self.count}
+
+    def prometheus(self, name, scale=1):
+        # cumulative buckets; scale converts bounds and sum, e.g. ns -> s
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + ('+Inf',), self.counts):
+            cumulative += count
+            le = bound if bound == '+Inf' else f"{bound * scale:g}"
+            lines.append(f'{name}_bucket{{le="{le}"}} {cumulative}')
+        lines.append(f"{name}_sum {self.sum * scale:g}")
+        lines.append(f"{name}_count {self.count}")
+        return lines
+
+
+class Metrics:
+    def __init__(self, aspa):
+        self.aspa = aspa
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        self.paths = 0
+        self.pair_lookups = 0
+        self.verdicts = {kind: {verdict: 0 for verdict in VERDICT_NAMES} for kind in DIRECTION_NAMES}
+        self.lookups_per_path = Histogram(COUNT_BOUNDS)
+        self.path_length = Histogram(COUNT_BOUNDS)
+        self.latency = Histogram(LATENCY_BOUNDS)
+        # position returned by ASPA.check_path for Invalid and Unknown paths
+        self.exit_position = Histogram(COUNT_BOUNDS)
+
+    def enable(self):
+        if self.enabled:
+            return
+        aspa = self.aspa
+        # the verify_pair of a record store is an instance attribute already
+        self.store_verify_pair = aspa.__dict__.get('verify_pair', None)
+        verify_pair, check_path = aspa.verify_pair, aspa.check_path
+        perf_counter_ns = time.perf_counter_ns
+
+        def counted_verify_pair(as1, as2, afi):
+            self.pair_lookups += 1
+            return verify_pair(as1, as2, afi)
+
+        def measured_check_path(aspath, neighbor_as, afi, kind):
+            lookups = self.pair_lookups
+            start = perf_counter_ns()
+            result = check_path(aspath, neighbor_as, afi, kind)
+            latency = perf_counter_ns() - start
+            self.paths += 1
+            self.verdicts[kind][result[0]] += 1
+            self.lookups_per_path.observe(self.pair_lookups - lookups)
+            # hops, an ASPath has one item per run of prepends
+            self.path_length.observe(aspath.hops() if isinstance(aspath, ASPath) else len(aspath))
+            self.latency.observe(latency)
+            if result[1] is not None:
+                self.exit_position.observe(result[1])
+            return result
+
+        aspa.verify_pair = counted_verify_pair
+        aspa.check_path = measured_check_path
+        self.enabled = True
+
+    def disable(self):
+        if not self.enabled:
+            return
+        del self.aspa.check_path
+        if self.store_verify_pair is None:
+            del self.aspa.verify_pair
+        else:
+            self.aspa.verify_pair = self.store_verify_pair
+        self.enabled = False
+
+    def snapshot(self):
+        return {
+            'paths': self.paths,
+            'pair_lookups': self.pair_lookups,
+            'verdicts': {DIRECTION_NAMES[kind]: {VERDICT_NAMES[verdict]: count for verdict, count in counts.items()}
+                         for kind, counts in self.verdicts.items()},
+            'lookups_per_path': self.lookups_per_path.snapshot(),
+            'path_length': self.path_length.snapshot(),
+            'latency_ns': self.latency.snapshot(),
+            'exit_position': self.exit_position.snapshot(),
+        }
+
+    def prometheus(self):
+        lines = [
+            '# HELP aspa_pair_lookups_total ASPA record lookups of customer/provider pairs.',
+            '# TYPE aspa_pair_lookups_total counter',
+            f'aspa_pair_lookups_total {self.pair_lookups}',
+            '# HELP aspa_verdicts_total Verified AS_PATHs by direction and verdict.',
+            '# TYPE aspa_verdicts_total counter',
+        ]
+        for kind, counts in self.verdicts.items():
+            for verdict, count in counts.items():
+                lines.append(f'aspa_verdicts_total{{direction="{DIRECTION_NAMES[kind]}",'
+                             f'verdict="{VERDICT_NAMES[verdict]}"}} {count}')
+
+        for name, histogram, help_text, scale in (
+                ('aspa_pair_lookups_per_path', self.lookups_per_path, 'Pair lookups per verified AS_PATH.', 1),
+                ('aspa_path_length', self.path_length, 'Length of the verified AS_PATHs.', 1),
+                ('aspa_verification_seconds', self.latency, 'Time spent verifying an AS_PATH.', 1e-9),
+                ('aspa_exit_position', self.exit_position,
+                 'Position of the first failing pair of Invalid and Unknown AS_PATHs.', 1)):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            lines.extend(histogram.prometheus(name, scale=scale))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        # renamed into place, the node_exporter textfile collector never
+        # reads a partial file
+        temporary = f"{path}.tmp{os.getpid()}"
+        with open(temporary, 'w') as file:
+            file.write(self.prometheus())
+        os.replace(temporary, path)
@@ -0,0 +1,230 @@
+#
+# Streaming MRT (RFC 6396) reader for TABLE_DUMP_V2 RIB dumps and BGP4MP
+# update archives, feeding the AS_PATHs to ASPA.
+#
+#   reader = MRTReader(ASPA(aspa_records))
+#   for prefix, peer_as, afi, verdict in reader.verify('rib.20231001.0000.bz2'):
+#       ...
+#
+import bz2
+import gzip
+import ipaddress
+import struct
+import time
+
+from aspa_logic import *
+from aspa_wire import ATTR_AS_PATH, ATTR_AS4_PATH, WireError, iter_attributes, parse_as_path
+
+
+TABLE_DUMP_V2, BGP4MP, BGP4MP_ET = 13, 16, 17
+
+# TABLE_DUMP_V2 subtypes
+PEER_INDEX_TABLE = 1
+RIB_IPV4_UNICAST, RIB_IPV4_MULTICAST, RIB_IPV6_UNICAST, RIB_IPV6_MULTICAST = 2, 3, 4, 5
+RIB_IPV4_UNICAST_ADDPATH, RIB_IPV4_MULTICAST_ADDPATH = 8, 9
+RIB_IPV6_UNICAST_ADDPATH, RIB_IPV6_MULTICAST_ADDPATH = 10, 11
+
+RIB_SUBTYPES = {
+    RIB_IPV4_UNICAST: (IPv4, False),
+    RIB_IPV4_MULTICAST: (IPv4, False),
+    RIB_IPV6_UNICAST: (IPv6, False),
+    RIB_IPV6_MULTICAST: (IPv6, False),
+    RIB_IPV4_UNICAST_ADDPATH: (IPv4, True),
+    RIB_IPV4_MULTICAST_ADDPATH: (IPv4, True),
+    RIB_IPV6_UNICAST_ADDPATH: (IPv6, True),
+    RIB_IPV6_MULTICAST_ADDPATH: (IPv6, True),
+}
+
+# BGP4MP subtypes carrying BGP messages: (4-byte ASNs, ADD-PATH)
+BGP4MP_MESSAGE_SUBTYPES = {
+    1: (False, False),   # BGP4MP_MESSAGE
+    4: (True, False),    # BGP4MP_MESSAGE_AS4
+    6: (False, False),   # BGP4MP_MESSAGE_LOCAL
+    7: (True, False),    # BGP4MP_MESSAGE_AS4_LOCAL
+    8: (False, True),    # BGP4MP_MESSAGE_ADDPATH
+    9: (True, True),     # BGP4MP_MESSAGE_AS4_ADDPATH
+    10: (False, True),   # BGP4MP_MESSAGE_LOCAL_ADDPATH
+    11: (True, True),    # BGP4MP_MESSAGE_AS4_LOCAL_ADDPATH
+}
+
+BGP_UPDATE = 2
+ATTR_MP_REACH_NLRI = 14
+BGP_AFIS = {1: IPv4, 2: IPv6}
+
+mrt_header = struct.Struct('!IHHI')
+
+
+class MRTError(Exception):
+    pass
+
+
+def open_mrt(path):
+    # gzip and bzip2 archives are recognized by their magic bytes
+    with open(path, 'rb') as file:
+        magic = file.read(3)
+    if magic[:2] == b'\x1f\x8b':
+        return gzip.open(path, 'rb')
+    if magic == b'BZh':
+        return bz2.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def read_records(file):
+    # yields (type, subtype, body) for every MRT record, one record in memory at a time
+    while True:
+        header = file.read(mrt_header.size)
+        if not header:
+            return
+        if len(header) < mrt_header.size:
+            raise MRTError("truncated MRT header")
+        _, mrt_type, subtype, length = mrt_header.unpack(header)
+        body = file.read(length)
+        if len(body) < length:
+            raise MRTError("truncated MRT record")
+        if mrt_type == BGP4MP_ET:
+            # microsecond timestamp extension
+            mrt_type, body = BGP4MP, body[4:]
+        yield mrt_type, subtype, memoryview(body)
+
+
+def decode_prefix(data, offset, afi):
+    length = data[offset]
+    size = (length + 7) // 8
+    if offset + 1 + size > len(data):
+        raise MRTError("truncated prefix")
+    address = bytes(data[offset + 1:offset + 1 + size])
+    if afi == IPv4:
+        prefix = ipaddress.IPv4Network((address.ljust(4, b'\0'), length), strict=False)
+    else:
+        prefix = ipaddress.IPv6Network((address.ljust(16, b'\0'), length), strict=False)
+    return str(prefix), offset + 1 + size
+
+
+class MRTReader:
+    def __init__(self, aspa, kind=DOWNFLOW):
+        self.aspa = aspa
+        self.check = {UPFLOW: aspa.check_upflow_path, DOWNFLOW: aspa.check_downflow_path,
+                      IX: aspa.check_ix_path}[kind]
+        self.peers = []
+        self.records = self.routes = 0
+        self.elapsed = 0.0
+
+    def routes_per_second(self):
+        return self.routes / self.elapsed if self.elapsed else 0.0
+
+    def verify(self, path):
+        for prefix, peer_as, afi, aspath in self.read_routes(path):
+            yield prefix, peer_as, afi, self.check(aspath, peer_as, afi)
+
+    def read_routes(self, path):
+        # yields (prefix, peer AS, afi, AS_PATH) for every announced route
+        started = time.perf_counter()
+        try:
+            with open_mrt(path) as file:
+                for mrt_type, subtype, body in read_records(file):
+                    self.records += 1
+                    if mrt_type == TABLE_DUMP_V2:
+                        routes = self.decode_table_dump(subtype, body)
+                    elif mrt_type == BGP4MP and subtype in BGP4MP_MESSAGE_SUBTYPES:
+                        routes = self.decode_bgp4mp(subtype, body)
+                    else:
+                        continue
+                    try:
+                        for route in routes:
+                            self.routes += 1
+                            yield route
+                    except WireError as error:
+                        raise MRTError(f"malformed BGP attributes: {error}") from error
+                    except (struct.error, IndexError, ValueError) as error:
+                        # fields running past the end of a truncated record,
+                        # invalid prefix lengths
+                        raise MRTError(f"malformed MRT record {self.records}: {error}") from error
+        finally:
+            self.elapsed += time.perf_counter() - started
+
+    def decode_table_dump(self, subtype, body):
+        if subtype == PEER_INDEX_TABLE:
+            self.decode_peer_index(body)
+            return
+        if subtype not in RIB_SUBTYPES:
+            return
+
+        afi, addpath = RIB_SUBTYPES[subtype]
+        prefix, offset = decode_prefix(body, 4, afi)
+        (count,) = struct.unpack_from('!H', body, offset)
+        offset += 2
+        for _ in range(count):
+            peer_index, _ = struct.unpack_from('!HI', body, offset)
+            offset += 10 if addpath else 6
+            (attr_length,) = struct.unpack_from('!H', body, offset)
+            offset += 2
+            attributes = body[offset:offset + attr_length]
+            offset += attr_length
+
+            if peer_index >= len(self.peers):
+                raise MRTError(f"RIB entry references unknown peer {peer_index}")
+            for attr_type, value in iter_attributes(attributes):
+                if attr_type == ATTR_AS_PATH:
+                    # TABLE_DUMP_V2 always encodes 4-byte ASNs
+                    yield prefix, self.peers[peer_index], afi, parse_as_path(value)
+                    break
+
+    def decode_peer_index(self, body):
+        (view_length,) = struct.unpack_from('!H', body, 4)
+        offset = 6 + view_length
+        (count,) = struct.unpack_from('!H', body, offset)
+        offset += 2
+        self.peers = []
+        for _ in range(count):
+            peer_type = body[offset]
+            offset += 5 + (16 if peer_type & 1 else 4)
+            if peer_type & 2:
+                (peer_as,) = struct.unpack_from('!I', body, offset)
+                offset += 4
+            else:
+                (peer_as,) = struct.unpack_from('!H', body, offset)
+                offset += 2
+            self.peers.append(peer_as)
+
+    def decode_bgp4mp(self, subtype, body):
+        as4, addpath = BGP4MP_MESSAGE_SUBTYPES[subtype]
+        if as4:
+            peer_as, _, _, bgp_afi = struct.unpack_from('!IIHH', body, 0)
+            offset = 12
+        else:
+            peer_as, _, _, bgp_afi = struct.unpack_from('!HHHH', body, 0)
+            offset = 8
+        offset += 2 * (16 if bgp_afi == 2 else 4)
+
+        message = body[offset:]
+        if len(message) < 19 or message[18] != BGP_UPDATE:
+            return
+        (withdrawn_length,) = struct.unpack_from('!H', message, 19)
+        offset = 21 + withdrawn_length
+        (attr_length,) = struct.unpack_from('!H', message, offset)
+        attributes = message[offset + 2:offset + 2 + attr_length]
+        nlri = message[offset + 2 + attr_length:]
+
+        as_path = as4_path = None
+        announced = []
+        for attr_type, value in iter_attributes(attributes):
+            if attr_type == ATTR_AS_PATH:
+                as_path = value
+            elif attr_type == ATTR_AS4_PATH:
+                as4_path = value
+            elif attr_type == ATTR_MP_REACH_NLRI:
+                mp_afi, _, nexthop_length = struct.unpack_from('!HBB', value, 0)
+                if mp_afi in BGP_AFIS:
+                    announced.append((BGP_AFIS[mp_afi], value[5 + nexthop_length:]))
+        if as_path is None:
+            return
+        aspath = parse_as_path(as_path, as4, as4_path)
+        announced.append((IPv4, nlri))
+
+        for afi, data in announced:
+            offset = 0
+            while offset < len(data):
+                if addpath:
+                    offset += 4
+                prefix, offset = decode_prefix(data, offset, afi)
+                yield prefix, peer_as, afi, aspath
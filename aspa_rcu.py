@@ -0,0 +1,125 @@
+#
+# Read-copy-update ASPA table for verifier threads: readers take the
+# current version once per path or batch and never lock, writers build the
+# next version and publish it with a single reference store.
+#
+#   table = RCUTable(aspa_records)
+#
+#   # reader threads
+#   aspa = table.current
+#   aspa.check_upflow_path(aspath, neighbor_as, IPv4)
+#
+#   # writer threads
+#   table.apply_delta(added, withdrawn)
+#
+# table.current is a plain ASPA whose records are an immutable
+# RecordsVersion. Every AFI is split into shards by the low bits of the
+# customer ASN and the next version copies only the shards a delta touches,
+# sharing the rest and all provider sets with the previous one. A version
+# is freed as soon as the last reader drops its reference to it.
+#
+import threading
+import weakref
+
+from aspa_logic import *
+
+
+SHARD_BITS = 8
+SHARD_MASK = (1 << SHARD_BITS) - 1
+
+
+class RecordsVersion:
+    # shards - {afi: tuple of SHARD_MASK + 1 {customer_as: frozenset(providers)}}
+    __slots__ = ('shards', 'serial', '__weakref__')
+
+    def __init__(self, shards, serial=0):
+        self.shards, self.serial = shards, serial
+
+    @classmethod
+    def from_dict(cls, aspa_records, serial=0):
+        shards = {}
+        for afi, records_afi in aspa_records.items():
+            afi_shards = tuple({} for _ in range(SHARD_MASK + 1))
+            for customer_as, providers in records_afi.items():
+                afi_shards[customer_as & SHARD_MASK][customer_as] = frozenset(providers)
+            shards[afi] = afi_shards
+        return cls(shards, serial)
+
+    def verify_pair(self, as1, as2, afi):
+        afi_shards = self.shards.get(afi, None)
+        if afi_shards is None:
+            return Unknown
+        providers = afi_shards[as1 & SHARD_MASK].get(as1, None)
+        if providers is None:
+            return Unknown
+        return Valid if as2 in providers else Invalid
+
+    def apply_delta(self, added, withdrawn):
+        raise TypeError("published versions are immutable, update the RCUTable instead")
+
+    def updated(self, added, withdrawn):
+        # returns the next version and {afi: changed customer ASNs}, or this
+        # version itself if the delta changes nothing
+        shards, changed = dict(self.shards), {}
+        for afi in set(added) | set(withdrawn):
+            added_afi = added.get(afi, {})
+            if afi not in shards and not added_afi:
+                continue
+            afi_shards = list(shards.get(afi, None) or ({} for _ in range(SHARD_MASK + 1)))
+            copied, changed_afi = set(), set()
+
+            def writable(customer_as):
+                index = customer_as & SHARD_MASK
+                if index not in copied:
+                    afi_shards[index] = dict(afi_shards[index])
+                    copied.add(index)
+                return afi_shards[index]
+
+            for customer_as in withdrawn.get(afi, ()):
+                if customer_as not in added_afi and customer_as in afi_shards[customer_as & SHARD_MASK]:
+                    del writable(customer_as)[customer_as]
+                    changed_afi.add(customer_as)
+            for customer_as, providers in added_afi.items():
+                providers = frozenset(providers)
+                if afi_shards[customer_as & SHARD_MASK].get(customer_as, None) != providers:
+                    writable(customer_as)[customer_as] = providers
+                    changed_afi.add(customer_as)
+            if changed_afi:
+                shards[afi] = tuple(afi_shards)
+                changed[afi] = changed_afi
+
+        if not changed:
+            return self, changed
+        return RecordsVersion(shards, self.serial + 1), changed
+
+    def to_dict(self):
+        return {afi: {customer_as: set(providers) for shard in afi_shards for customer_as, providers in shard.items()}
+                for afi, afi_shards in self.shards.items()}
+
+
+class RCUTable:
+    def __init__(self, aspa_records):
+        if not isinstance(aspa_records, dict):
+            aspa_records = aspa_records.to_dict()
+        # serializes the writers, readers never take it
+        self.lock = threading.Lock()
+        # serial -> versions still referenced by a reader or the table
+        self.versions = weakref.WeakValueDictionary()
+        self.publish(RecordsVersion.from_dict(aspa_records))
+
+    def publish(self, version):
+        aspa = ASPA(version)
+        aspa.serial = version.serial
+        self.versions[version.serial] = version
+        # a single reference store, readers see the old or the new version
+        self.current = aspa
+
+    def apply_delta(self, added=None, withdrawn=None):
+        with self.lock:
+            version, changed = self.current.aspa_records.updated(added or {}, withdrawn or {})
+            if changed:
+                self.publish(version)
+        return changed
+
+    def live_versions(self):
+        return sorted(self.versions.keys())
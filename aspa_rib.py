@@ -0,0 +1,85 @@
+#
+# RIB attached revalidation: stored routes are indexed by the ASNs of their
+# AS_PATH, so an ASPA update only re-verifies the routes that contain a
+# changed customer ASN and reports the verdicts that actually changed.
+#
+#   rib = RIB(aspa)
+#   rib.add(('192.0.2.0/24', peer), aspath, neighbor_as, IPv4, DOWNFLOW)
+#   for key, old_verdict, new_verdict in rib.apply_delta(added, withdrawn):
+#       ...
+#
+# Updates received by an RTRClient are followed with
+# RTRClient(aspa, host, port, on_update=rib.revalidate) and the transitions
+# delivered to the on_transition callback of the RIB.
+#
+from aspa_logic import *
+
+
+class RIB:
+    def __init__(self, aspa, on_transition=None):
+        self.aspa = aspa
+        # called with (key, old verdict, new verdict) for every transition
+        self.on_transition = on_transition
+        # key -> [aspath, neighbor_as, afi, kind, verdict]
+        self.routes = {}
+        # (afi, asn) -> keys of the routes with asn in their AS_PATH
+        self.index = {}
+        self.revalidated = 0
+
+    def __len__(self):
+        return len(self.routes)
+
+    def __contains__(self, key):
+        return key in self.routes
+
+    def verdict(self, key):
+        return self.routes[key][4]
+
+    def add(self, key, aspath, neighbor_as, afi, kind):
+        # adds or replaces the route stored under key, returns its verdict
+        if key in self.routes:
+            self.remove(key)
+        verdict = self.aspa.check_path(aspath, neighbor_as, afi, kind)[0]
+        self.routes[key] = [aspath, neighbor_as, afi, kind, verdict]
+        for asn in dependencies(aspath):
+            self.index.setdefault((afi, asn), set()).add(key)
+        return verdict
+
+    def remove(self, key):
+        aspath, _, afi, _, verdict = self.routes.pop(key)
+        for asn in dependencies(aspath):
+            keys = self.index[afi, asn]
+            keys.discard(key)
+            if not keys:
+                del self.index[afi, asn]
+        return verdict
+
+    def affected(self, changed):
+        # keys of the routes whose verdict may depend on a changed record
+        keys = set()
+        for afi, customer_ases in changed.items():
+            for customer_as in customer_ases:
+                keys.update(self.index.get((afi, customer_as), ()))
+        return keys
+
+    def revalidate(self, changed):
+        # changed: {afi: customer ASNs}, as returned by ASPA.apply_delta;
+        # returns the (key, old verdict, new verdict) transitions
+        check_path = self.aspa.check_path
+        transitions = []
+        keys = self.affected(changed)
+        for key in keys:
+            route = self.routes[key]
+            verdict = check_path(route[0], route[1], route[2], route[3])[0]
+            if verdict != route[4]:
+                transitions.append((key, route[4], verdict))
+                route[4] = verdict
+        self.revalidated += len(keys)
+
+        if self.on_transition is not None:
+            for transition in transitions:
+                self.on_transition(*transition)
+        return transitions
+
+    def apply_delta(self, added=None, withdrawn=None):
+        return self.revalidate(self.aspa.apply_delta(added, withdrawn))
@@ -0,0 +1,92 @@
+#
+# Route server stage: the same AS_PATH arrives over hundreds of sessions,
+# so the neighbor independent part of the verification (ASPA.verify_path)
+# runs once per distinct (path, afi, kind) and only the neighbor check is
+# done per session.
+#
+#   server = RouteServer(aspa)
+#   for verdict in server.verify_routes(routes):
+#       ...
+#   verdicts = server.verify_sessions(aspath, IPv4, UPFLOW, neighbor_ases)
+#
+# A route is (aspath, neighbor_as, afi, kind) like for the
+# VerificationEngine. The path verdicts are held in a VerdictCache
+# (server.cache), so ASPA updates passed to apply_delta only evict the
+# paths they affect.
+#
+from functools import partial
+
+from aspa_logic import *
+from aspa_cache import VerdictCache
+
+
+class RouteServer:
+    def __init__(self, aspa, maxsize=65536):
+        self.aspa = aspa
+        self.cache = VerdictCache(aspa, maxsize)
+        # cache checks that leave out the neighbor check
+        self.path_checks = {kind: partial(self.verify_path, kind=kind) for kind in (UPFLOW, DOWNFLOW, IX)}
+        self.sessions = 0
+        self.neighbor_mismatches = 0
+        # sessions whose verdict needs verify_path, and its actual runs
+        self.path_sessions = 0
+        self.path_verifications = 0
+
+    def verify_path(self, aspath, neighbor_as, afi, kind):
+        self.path_verifications += 1
+        return self.aspa.verify_path(aspath, afi, kind)[0]
+
+    def lookup(self, aspath, afi, kind):
+        return self.cache.lookup(kind, self.path_checks[kind], aspath, None, afi)
+
+    def verify(self, aspath, neighbor_as, afi, kind):
+        # same verdict as the check methods of ASPA
+        self.sessions += 1
+        if len(aspath) == 0:
+            return Invalid
+        if kind != IX:
+            last = aspath[-1]
+            if last.type == AS_SEQUENCE and last.value != neighbor_as:
+                self.neighbor_mismatches += 1
+                return Invalid
+        self.path_sessions += 1
+        return self.lookup(aspath, afi, kind)
+
+    def verify_routes(self, routes):
+        for aspath, neighbor_as, afi, kind in routes:
+            yield self.verify(aspath, neighbor_as, afi, kind)
+
+    def verify_sessions(self, aspath, afi, kind, neighbor_ases):
+        # fans the verdict of one path out to the sessions it was received on
+        self.sessions += len(neighbor_ases)
+        if len(aspath) == 0:
+            return [Invalid] * len(neighbor_ases)
+        last = aspath[-1]
+        if kind == IX or last.type != AS_SEQUENCE:
+            self.path_sessions += len(neighbor_ases)
+            return [self.lookup(aspath, afi, kind)] * len(neighbor_ases)
+        matches = sum(neighbor_as == last.value for neighbor_as in neighbor_ases)
+        self.neighbor_mismatches += len(neighbor_ases) - matches
+        if not matches:
+            return [Invalid] * len(neighbor_ases)
+        self.path_sessions += matches
+        verdict = self.lookup(aspath, afi, kind)
+        return [verdict if neighbor_as == last.value else Invalid for neighbor_as in neighbor_ases]
+
+    def apply_delta(self, added=None, withdrawn=None):
+        return self.cache.apply_delta(added, withdrawn)
+
+    def stats(self):
+        # kernel runs saved against verifying every session on its own;
+        # empty paths and neighbor mismatches never reach the kernel
+        saved = self.path_sessions - self.path_verifications
+        stats = self.cache.stats()
+        stats.update({
+            'sessions': self.sessions,
+            'neighbor_mismatches': self.neighbor_mismatches,
+            'path_sessions': self.path_sessions,
+            'path_verifications': self.path_verifications,
+            'saved_verifications': saved,
+            'saved_ratio': saved / self.path_sessions if self.path_sessions else 0.0,
+        })
+        return stats
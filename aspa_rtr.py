@@ -0,0 +1,285 @@
+#
+# asyncio RPKI-to-Router client (RFC 8210, ASPA PDU of
+# draft-ietf-sidrops-8210bis) keeping an ASPA table in sync with a cache.
+#
+#   client = RTRClient(aspa, 'rtr.example.net', 8282)
+#   await client.run()
+#
+# The ASPA PDUs of one Cache Response are collected until End of Data and
+# then handed to ASPA.apply_delta in a single call, which does not yield to
+# the event loop, so verification running on the same loop never sees a
+# half-applied update.
+#
+# RTRCacheServer is a small in-process cache to test clients against.
+#
+import asyncio
+import struct
+import time
+
+from aspa_logic import *
+
+
+RTR_VERSION = 2
+
+SERIAL_NOTIFY, SERIAL_QUERY, RESET_QUERY, CACHE_RESPONSE = 0, 1, 2, 3
+IPV4_PREFIX, IPV6_PREFIX, END_OF_DATA, CACHE_RESET = 4, 6, 7, 8
+ROUTER_KEY, ERROR_REPORT, ASPA_PDU = 9, 10, 11
+
+FLAG_ANNOUNCE = 1
+
+# error codes of Error Report PDUs
+CORRUPT_DATA, INTERNAL_ERROR, NO_DATA_AVAILABLE, INVALID_REQUEST = 0, 1, 2, 3
+UNSUPPORTED_PDU_TYPE = 5
+
+pdu_header = struct.Struct('!BBHI')
+MAX_PDU_LENGTH = 1 << 20
+
+DEFAULT_REFRESH = 3600
+
+
+class RTRError(Exception):
+    pass
+
+
+def encode_pdu(pdu_type, session, body=b'', version=RTR_VERSION):
+    return pdu_header.pack(version, pdu_type, session, pdu_header.size + len(body)) + body
+
+
+def encode_aspa(customer_as, providers, announce=True, version=RTR_VERSION):
+    # the session field carries the flags and a zero byte
+    flags = FLAG_ANNOUNCE if announce else 0
+    body = struct.pack(f'!I{len(providers)}I', customer_as, *sorted(providers)) if announce else \
+        struct.pack('!I', customer_as)
+    return encode_pdu(ASPA_PDU, flags << 8, body, version)
+
+
+def encode_error(code, text, version=RTR_VERSION):
+    text = text.encode()
+    return encode_pdu(ERROR_REPORT, code, struct.pack('!I', 0) + struct.pack('!I', len(text)) + text, version)
+
+
+async def read_pdu(reader):
+    header = await reader.readexactly(pdu_header.size)
+    version, pdu_type, session, length = pdu_header.unpack(header)
+    if not pdu_header.size <= length <= MAX_PDU_LENGTH:
+        raise RTRError(f"invalid PDU length {length}")
+    body = await reader.readexactly(length - pdu_header.size)
+    return version, pdu_type, session, body
+
+
+class RTRClient:
+    def __init__(self, aspa, host, port, afis=(IPv4, IPv6), on_update=None, latency_samples=10000):
+        self.aspa = aspa
+        self.host, self.port = host, port
+        # ASPA PDUs carry no AFI, every record is installed for all afis
+        self.afis = afis
+        # called with the changed customers after every applied update
+        self.on_update = on_update
+        self.session_id = None
+        self.serial = None
+        self.refresh = DEFAULT_REFRESH
+        self.customers = {}
+        self.updates = 0
+        self.latencies = []
+        self.latency_samples = latency_samples
+        self.synchronized = asyncio.Condition()
+        self.reader = self.writer = None
+        self.transaction = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+            self.writer = None
+
+    def send_query(self):
+        if self.serial is None:
+            self.writer.write(encode_pdu(RESET_QUERY, 0))
+        else:
+            self.writer.write(encode_pdu(SERIAL_QUERY, self.session_id, struct.pack('!I', self.serial)))
+
+    async def run(self):
+        # connects, synchronizes and keeps following the cache until the
+        # connection is closed or the cache reports an error
+        if self.writer is None:
+            await self.connect()
+        self.send_query()
+        timer = asyncio.ensure_future(self.refresh_timer())
+        try:
+            while True:
+                await self.handle_pdu(*await read_pdu(self.reader))
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            timer.cancel()
+            await self.close()
+
+    async def refresh_timer(self):
+        # the refresh interval is taken from the last End of Data
+        while True:
+            await asyncio.sleep(self.refresh)
+            if self.transaction is None and self.writer is not None:
+                self.send_query()
+
+    async def handle_pdu(self, version, pdu_type, session, body):
+        arrival = time.perf_counter()
+        if pdu_type == CACHE_RESPONSE:
+            if self.session_id is not None and session != self.session_id and self.serial is not None:
+                raise RTRError(f"cache changed its session id from {self.session_id} to {session}")
+            self.session_id = session
+            # (added, withdrawn, arrival times) of the running Cache Response;
+            # a response to a reset query replaces the whole table
+            self.transaction = {}, set(), [], self.serial is None
+        elif pdu_type == ASPA_PDU:
+            self.handle_aspa(session >> 8, body, arrival)
+        elif pdu_type == END_OF_DATA:
+            if self.transaction is None:
+                raise RTRError("End of Data outside of a Cache Response")
+            serial, self.refresh = struct.unpack_from('!II', body)
+            await self.apply(serial)
+        elif pdu_type == SERIAL_NOTIFY:
+            if self.transaction is None and self.serial is not None:
+                self.send_query()
+        elif pdu_type == CACHE_RESET:
+            self.serial = None
+            self.send_query()
+        elif pdu_type == ERROR_REPORT:
+            (pdu_length,) = struct.unpack_from('!I', body)
+            (text_length,) = struct.unpack_from('!I', body, 4 + pdu_length)
+            text = body[8 + pdu_length:8 + pdu_length + text_length].decode(errors='replace')
+            raise RTRError(f"cache reported error {session}: {text}")
+        elif pdu_type in (IPV4_PREFIX, IPV6_PREFIX, ROUTER_KEY):
+            pass
+        else:
+            self.writer.write(encode_error(UNSUPPORTED_PDU_TYPE, f"unsupported PDU type {pdu_type}"))
+
+    def handle_aspa(self, flags, body, arrival):
+        if self.transaction is None:
+            raise RTRError("ASPA PDU outside of a Cache Response")
+        added, withdrawn, arrivals, _ = self.transaction
+        (customer_as,) = struct.unpack_from('!I', body)
+        if flags & FLAG_ANNOUNCE:
+            added[customer_as] = frozenset(struct.unpack_from(f'!{len(body) // 4 - 1}I', body, 4))
+            withdrawn.discard(customer_as)
+        else:
+            withdrawn.add(customer_as)
+            added.pop(customer_as, None)
+        arrivals.append(arrival)
+
+    async def apply(self, serial):
+        added, withdrawn, arrivals, reset = self.transaction
+        self.transaction = None
+        if reset:
+            withdrawn = set(self.customers) - set(added)
+
+        changed = self.aspa.apply_delta({afi: added for afi in self.afis},
+                                        {afi: withdrawn for afi in self.afis})
+        applied = time.perf_counter()
+        for customer_as in withdrawn:
+            self.customers.pop(customer_as, None)
+        self.customers.update(added)
+
+        self.serial = serial
+        self.updates += 1
+        self.latencies.extend(applied - arrival for arrival in arrivals)
+        del self.latencies[:-self.latency_samples]
+        if self.on_update is not None:
+            self.on_update(changed)
+
+        async with self.synchronized:
+            self.synchronized.notify_all()
+
+    async def wait_serial(self, serial):
+        async with self.synchronized:
+            await self.synchronized.wait_for(lambda: self.serial is not None and self.serial >= serial)
+
+    def latency_summary(self):
+        if not self.latencies:
+            return {}
+        latencies = sorted(self.latencies)
+        return {
+            'count': len(latencies),
+            'mean': sum(latencies) / len(latencies),
+            'p50': latencies[len(latencies) // 2],
+            'p99': latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)],
+            'max': latencies[-1],
+        }
+
+
+class RTRCacheServer:
+    # In-process stand-in for an RPKI cache serving ASPA records
+    def __init__(self, records=None, session_id=1, refresh=DEFAULT_REFRESH):
+        self.session_id = session_id
+        self.refresh = refresh
+        self.serial = 0
+        self.records = {customer_as: frozenset(providers) for customer_as, providers in (records or {}).items()}
+        # serial -> (added, withdrawn) that led from serial - 1 to serial
+        self.history = {}
+        self.writers = set()
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=0):
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        for writer in list(self.writers):
+            writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def update(self, added=None, withdrawn=()):
+        added = {customer_as: frozenset(providers) for customer_as, providers in (added or {}).items()}
+        withdrawn = set(withdrawn) - set(added)
+        for customer_as in withdrawn:
+            self.records.pop(customer_as, None)
+        self.records.update(added)
+        self.serial += 1
+        self.history[self.serial] = added, withdrawn
+        for writer in self.writers:
+            writer.write(encode_pdu(SERIAL_NOTIFY, self.session_id, struct.pack('!I', self.serial)))
+
+    def end_of_data(self):
+        return encode_pdu(END_OF_DATA, self.session_id,
+                          struct.pack('!IIII', self.serial, self.refresh, 600, 7200))
+
+    async def handle_client(self, reader, writer):
+        self.writers.add(writer)
+        try:
+            while True:
+                _, pdu_type, session, body = await read_pdu(reader)
+                if pdu_type == RESET_QUERY:
+                    pdus = [encode_pdu(CACHE_RESPONSE, self.session_id)]
+                    pdus += [encode_aspa(customer_as, providers) for customer_as, providers in self.records.items()]
+                    writer.write(b''.join(pdus) + self.end_of_data())
+                elif pdu_type == SERIAL_QUERY:
+                    (serial,) = struct.unpack('!I', body)
+                    if session != self.session_id or serial > self.serial or \
+                            any(number not in self.history for number in range(serial + 1, self.serial + 1)):
+                        writer.write(encode_pdu(CACHE_RESET, 0))
+                        continue
+                    added, withdrawn = {}, set()
+                    for number in range(serial + 1, self.serial + 1):
+                        step_added, step_withdrawn = self.history[number]
+                        withdrawn = (withdrawn - set(step_added)) | step_withdrawn
+                        for customer_as in step_withdrawn:
+                            added.pop(customer_as, None)
+                        added.update(step_added)
+                    pdus = [encode_pdu(CACHE_RESPONSE, self.session_id)]
+                    pdus += [encode_aspa(customer_as, (), announce=False) for customer_as in withdrawn]
+                    pdus += [encode_aspa(customer_as, providers) for customer_as, providers in added.items()]
+                    writer.write(b''.join(pdus) + self.end_of_data())
+                elif pdu_type != ERROR_REPORT:
+                    writer.write(encode_error(INVALID_REQUEST, f"unexpected PDU type {pdu_type}"))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
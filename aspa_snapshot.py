@@ -0,0 +1,138 @@
+#
+# Versioned on-disk snapshot of the ASPA records that is mapped into memory
+# and queried in place, so that every verifier process shares the same
+# physical pages and starts without parsing anything.
+#
+#   write_snapshot('aspa.snap', aspa_records)
+#   aspa = ASPA(load_snapshot('aspa.snap'))
+#
+# Layout (little endian, sections aligned to 8 bytes):
+#
+#   header     magic 'ASPASNAP', u32 version, u32 AFI count, u64 serial
+#   directory  per AFI: u32 afi, u32 customer count, u32 provider count,
+#              u32 reserved, u64 customers, u64 offsets, u64 providers
+#              (file offsets of the sections below)
+#   sections   u32 customers[n], u32 offsets[n + 1], u32 providers[m]
+#              for every AFI, the CSR layout of aspa_store.CompactTable
+#
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from aspa_store import ASN_TYPECODE, CompactRecords, CompactTable
+
+
+SNAPSHOT_MAGIC = b'ASPASNAP'
+SNAPSHOT_VERSION = 1
+
+snapshot_header = struct.Struct('<8sIIQ')
+snapshot_entry = struct.Struct('<IIIIQQQ')
+snapshot_offset = struct.Struct('<I')
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def align(offset):
+    return (offset + 7) & ~7
+
+
+def write_snapshot(path, aspa_records, serial=0):
+    # aspa_records is the {afi: {customer_as: providers}} dict or a record
+    # store of aspa_store or this module, which all provide to_dict
+    if hasattr(aspa_records, 'to_dict'):
+        aspa_records = aspa_records.to_dict()
+    tables = [(afi, CompactTable.from_dict(records_afi)) for afi, records_afi in sorted(aspa_records.items())]
+
+    offset = align(snapshot_header.size + snapshot_entry.size * len(tables))
+    directory, sections = [], []
+    for afi, table in tables:
+        positions = []
+        for section in (table.customers, table.offsets, table.providers):
+            data = array(ASN_TYPECODE, section)
+            if sys.byteorder != 'little':
+                data.byteswap()
+            positions.append(offset)
+            sections.append((offset, data.tobytes()))
+            offset = align(offset + len(section) * 4)
+        directory.append(snapshot_entry.pack(afi, len(table.customers), len(table.providers), 0, *positions))
+
+    # written next to the target and renamed, so readers never map a partial file
+    temporary = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(temporary, 'wb') as file:
+            file.write(snapshot_header.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(tables), serial))
+            file.write(b''.join(directory))
+            for position, data in sections:
+                file.write(b'\0' * (position - file.tell()))
+                file.write(data)
+        os.replace(temporary, path)
+    except BaseException:
+        # e.g. a full disk, the partial file is not left behind
+        if os.path.exists(temporary):
+            os.unlink(temporary)
+        raise
+
+
+class SnapshotRecords(CompactRecords):
+    # CompactRecords whose arrays are uint32 views into a read-only mapping
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size < snapshot_header.size:
+                raise SnapshotError(f"{path}: truncated snapshot header")
+            self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.path = path
+        try:
+            self.tables = self.map_tables()
+        except (SnapshotError, struct.error):
+            self.mapping.close()
+            raise
+
+    def map_tables(self):
+        size = len(self.mapping)
+        magic, version, afi_count, self.serial = snapshot_header.unpack_from(self.mapping, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise SnapshotError(f"{self.path}: not an ASPA snapshot")
+        if version != SNAPSHOT_VERSION:
+            raise SnapshotError(f"{self.path}: unsupported snapshot version {version}")
+
+        # validate the whole directory before the first view is taken
+        directory = []
+        for index in range(afi_count):
+            afi, customer_count, provider_count, _, *positions = \
+                snapshot_entry.unpack_from(self.mapping, snapshot_header.size + index * snapshot_entry.size)
+            counts = customer_count, customer_count + 1, provider_count
+            for position, count in zip(positions, counts):
+                if position % 4 or position + count * 4 > size:
+                    raise SnapshotError(f"{self.path}: section outside of the snapshot")
+            # the provider slices have to start at 0 and end with the providers
+            first, = snapshot_offset.unpack_from(self.mapping, positions[1])
+            last, = snapshot_offset.unpack_from(self.mapping, positions[1] + customer_count * 4)
+            if first != 0 or last != provider_count:
+                raise SnapshotError(f"{self.path}: provider offsets of AFI {afi} out of range")
+            directory.append((afi, list(zip(positions, counts))))
+
+        data = memoryview(self.mapping)
+        tables = {}
+        for afi, sections in directory:
+            views = []
+            for position, count in sections:
+                view = data[position:position + count * 4].cast('I')
+                if sys.byteorder != 'little':
+                    view = array(ASN_TYPECODE, view)
+                    view.byteswap()
+                views.append(view)
+            tables[afi] = CompactTable(*views)
+        return tables
+
+    def close(self):
+        # all views have to be dropped before the mapping can be closed
+        self.tables = {}
+        self.mapping.close()
+
+
+def load_snapshot(path):
+    return SnapshotRecords(path)
@@ -0,0 +1,250 @@
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import chain
+
+from aspa_logic import ASN_TYPECODE, Valid, Invalid, Unknown
+
+
+class CompactTable:
+    # CSR layout of the ASPA records of a single AFI:
+    #   customers  - sorted customer ASNs
+    #   offsets    - providers of customers[i] are providers[offsets[i]:offsets[i + 1]]
+    #   providers  - provider ASNs, sorted within every customer slice
+    #   changes    - {customer_as: frozenset(providers) or None if withdrawn}
+    #                applied on top of the arrays until the next compact()
+    __slots__ = ('customers', 'offsets', 'providers', 'changes')
+
+    def __init__(self, customers, offsets, providers):
+        if len(offsets) != len(customers) + 1:
+            raise ValueError("offsets must have exactly one more entry than customers")
+        self.customers, self.offsets, self.providers = customers, offsets, providers
+        self.changes = {}
+
+    @classmethod
+    def from_dict(cls, records_afi):
+        customers = array(ASN_TYPECODE, sorted(records_afi))
+        offsets = array(ASN_TYPECODE, [0])
+        providers = array(ASN_TYPECODE)
+        for customer in customers:
+            providers.extend(sorted(records_afi[customer]))
+            offsets.append(len(providers))
+        return cls(customers, offsets, providers)
+
+    def find(self, customer):
+        customers = self.customers
+        index = bisect_left(customers, customer)
+        if index == len(customers) or customers[index] != customer:
+            return -1
+        return index
+
+    def providers_of(self, customer):
+        if customer in self.changes:
+            return self.changes[customer]
+        index = self.find(customer)
+        if index < 0:
+            return None
+        return frozenset(self.providers[self.offsets[index]:self.offsets[index + 1]])
+
+    def verify_pair(self, as1, as2):
+        changes = self.changes
+        if changes and as1 in changes:
+            providers = changes[as1]
+            if providers is None:
+                return Unknown
+            return Valid if as2 in providers else Invalid
+
+        customers = self.customers
+        index = bisect_left(customers, as1)
+        if index == len(customers) or customers[index] != as1:
+            return Unknown
+
+        providers = self.providers
+        low, high = self.offsets[index], self.offsets[index + 1]
+        position = bisect_left(providers, as2, low, high)
+        if position == high or providers[position] != as2:
+            return Invalid
+        return Valid
+
+    def apply_delta(self, added, withdrawn):
+        changed = set()
+        for customer_as in withdrawn:
+            if customer_as not in added and self.providers_of(customer_as) is not None:
+                self.changes[customer_as] = None
+                changed.add(customer_as)
+        for customer_as, providers in added.items():
+            providers = frozenset(providers)
+            if self.providers_of(customer_as) != providers:
+                self.changes[customer_as] = providers
+                changed.add(customer_as)
+        return changed
+
+    def to_dict(self):
+        offsets, providers = self.offsets, self.providers
+        records_afi = {customer: set(providers[offsets[i]:offsets[i + 1]]) for i, customer in enumerate(self.customers)}
+        for customer, changed_providers in self.changes.items():
+            if changed_providers is None:
+                records_afi.pop(customer, None)
+            else:
+                records_afi[customer] = set(changed_providers)
+        return records_afi
+
+
+class CompactRecords:
+    # Frozen replacement for the {afi: {customer_as: set(providers)}} dict,
+    # selected with ASPA(aspa_records, store=CompactRecords).
+    #
+    # Delta updates are kept in a per-AFI overlay and folded into fresh
+    # arrays once the overlay grows beyond compact_ratio of the table.
+    compact_ratio = 0.25
+
+    def __init__(self, aspa_records):
+        self.tables = {afi: CompactTable.from_dict(records_afi) for afi, records_afi in aspa_records.items()}
+
+    @classmethod
+    def from_tables(cls, tables):
+        records = cls.__new__(cls)
+        records.tables = dict(tables)
+        return records
+
+    def verify_pair(self, as1, as2, afi):
+        table = self.tables.get(afi, None)
+        if table is None:
+            return Unknown
+        return table.verify_pair(as1, as2)
+
+    def apply_delta(self, added, withdrawn):
+        changed = {}
+        for afi in set(added) | set(withdrawn):
+            table = self.tables.get(afi, None)
+            if table is None:
+                if not added.get(afi):
+                    continue
+                table = self.tables[afi] = CompactTable.from_dict({})
+            changed_afi = table.apply_delta(added.get(afi, {}), withdrawn.get(afi, ()))
+            if len(table.changes) > max(1024, self.compact_ratio * len(table.customers)):
+                self.compact(afi)
+            if changed_afi:
+                changed[afi] = changed_afi
+        return changed
+
+    def compact(self, afi=None):
+        for name in list(self.tables) if afi is None else [afi]:
+            if self.tables[name].changes:
+                self.tables[name] = CompactTable.from_dict(self.tables[name].to_dict())
+
+    def to_dict(self):
+        return {afi: table.to_dict() for afi, table in self.tables.items()}
+
+
+class HotProviderTable:
+    # ASPA records of a single AFI split by provider popularity:
+    #   hot      - {provider_as: bit mask} for the hot_size providers listed
+    #              by the most customers, the lowest bits for the most popular
+    #   bitmaps  - {customer_as: int} with the bits of its hot providers set
+    #   tail     - {customer_as: tuple or frozenset} of the remaining
+    #              providers, only for the customers that have any
+    __slots__ = ('hot', 'providers', 'bitmaps', 'tail')
+
+    def __init__(self, hot_providers):
+        self.providers = list(hot_providers)
+        self.hot = {provider: 1 << bit for bit, provider in enumerate(self.providers)}
+        self.bitmaps = {}
+        self.tail = {}
+
+    @classmethod
+    def from_dict(cls, records_afi, hot_size):
+        popularity = Counter(chain.from_iterable(records_afi.values()))
+        table = cls(provider for provider, _ in popularity.most_common(hot_size))
+        for customer, providers in records_afi.items():
+            table.store(customer, providers)
+        return table
+
+    def store(self, customer, providers):
+        hot, bits, tail = self.hot, 0, []
+        for provider in providers:
+            mask = hot.get(provider, None)
+            if mask is None:
+                tail.append(provider)
+            else:
+                bits |= mask
+        self.bitmaps[customer] = bits
+        if tail:
+            # a linear scan of a short tuple beats hashing into a set
+            self.tail[customer] = tuple(sorted(tail)) if len(tail) <= 8 else frozenset(tail)
+        else:
+            self.tail.pop(customer, None)
+
+    def providers_of(self, customer):
+        bits = self.bitmaps.get(customer, None)
+        if bits is None:
+            return None
+        providers = {provider for provider, mask in self.hot.items() if bits & mask}
+        providers.update(self.tail.get(customer, ()))
+        return frozenset(providers)
+
+    def verify_pair(self, as1, as2):
+        bits = self.bitmaps.get(as1, None)
+        if bits is None:
+            return Unknown
+        mask = self.hot.get(as2, None)
+        if mask is not None:
+            return Valid if bits & mask else Invalid
+        tail = self.tail.get(as1, None)
+        return Valid if tail is not None and as2 in tail else Invalid
+
+    def apply_delta(self, added, withdrawn):
+        # providers that are not hot yet go to the tail until rebalance()
+        changed = set()
+        for customer_as in withdrawn:
+            if customer_as not in added and customer_as in self.bitmaps:
+                del self.bitmaps[customer_as]
+                self.tail.pop(customer_as, None)
+                changed.add(customer_as)
+        for customer_as, providers in added.items():
+            providers = frozenset(providers)
+            if self.providers_of(customer_as) != providers:
+                self.store(customer_as, providers)
+                changed.add(customer_as)
+        return changed
+
+    def to_dict(self):
+        return {customer: set(self.providers_of(customer)) for customer in self.bitmaps}
+
+
+class HotProviderRecords:
+    # Replacement for the {afi: {customer_as: set(providers)}} dict, selected
+    # with ASPA(aspa_records, store=HotProviderRecords). Membership tests of
+    # the hot providers are a single AND on the bitmap of the customer.
+    hot_size = 256
+
+    def __init__(self, aspa_records):
+        self.tables = {afi: HotProviderTable.from_dict(records_afi, self.hot_size)
+                       for afi, records_afi in aspa_records.items()}
+
+    def verify_pair(self, as1, as2, afi):
+        table = self.tables.get(afi, None)
+        if table is None:
+            return Unknown
+        return table.verify_pair(as1, as2)
+
+    def apply_delta(self, added, withdrawn):
+        changed = {}
+        for afi in set(added) | set(withdrawn):
+            table = self.tables.get(afi, None)
+            if table is None:
+                if not added.get(afi):
+                    continue
+                table = self.tables[afi] = HotProviderTable.from_dict({}, self.hot_size)
+            changed_afi = table.apply_delta(added.get(afi, {}), withdrawn.get(afi, ()))
+            if changed_afi:
+                changed[afi] = changed_afi
+        return changed
+
+    def rebalance(self, afi=None):
+        # ranks the providers again after the delta updates
+        for name in list(self.tables) if afi is None else [afi]:
+            self.tables[name] = HotProviderTable.from_dict(self.tables[name].to_dict(), self.hot_size)
+
+    def to_dict(self):
+        return {afi: table.to_dict() for afi, table in self.tables.items()}
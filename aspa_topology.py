@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+#
+# Seeded generator of an Internet-like AS topology, the ASPA records its
+# ASes would publish and AS_PATH workloads over it, for load tests and
+# benchmarks at production scale.
+#
+#   python aspa_topology.py --ases 80000 --paths 1000000 --adoption 0.3 \
+#       --records records.json --output paths.jsonl.gz
+#
+# records.json holds {afi: {customer_as: [providers]}}. Every line of the
+# paths file is a JSON object
+#
+#   {"path": [43247, 13238, [1, 2], 3356], "neighbor": 3356, "afi": 4,
+#    "kind": "downflow", "leak": false}
+#
+# with the path origin first like the ASPA check methods expect and AS_SET
+# members grouped in a nested list.
+#
+import argparse
+import gzip
+import json
+import random
+import sys
+
+from aspa_logic import *
+
+
+KINDS = {'upflow': UPFLOW, 'downflow': DOWNFLOW, 'ix': IX}
+KIND_NAMES = {kind: name for name, kind in KINDS.items()}
+
+
+class PathsError(ValueError):
+    pass
+
+
+class Topology:
+    def __init__(self, ases=80000, seed=0, tier1=16, tier2_ratio=0.01, tier3_ratio=0.1):
+        rng = random.Random(seed)
+        asns = rng.sample(range(1, 400000), ases)
+        tier2 = max(1, int(ases * tier2_ratio))
+        tier3 = max(1, int(ases * tier3_ratio))
+        self.tiers = [asns[:tier1], asns[tier1:tier1 + tier2], asns[tier1 + tier2:tier1 + tier2 + tier3],
+                      asns[tier1 + tier2 + tier3:]]
+        self.providers = {asn: [] for asn in asns}
+        self.customers = {asn: [] for asn in asns}
+        self.peers = {asn: set() for asn in asns}
+
+        tier1, tier2, tier3, stubs = self.tiers
+        for index, asn in enumerate(tier1):
+            self.peers[asn].update(tier1[:index] + tier1[index + 1:])
+        for asn in tier2:
+            self.connect(asn, rng.sample(tier1, rng.randint(1, 3)))
+        for asn in tier3:
+            upstreams = tier2 if rng.random() < 0.9 else tier1
+            self.connect(asn, rng.sample(upstreams, min(len(upstreams), rng.randint(1, 3))))
+        for asn in stubs:
+            upstreams = tier3 if rng.random() < 0.7 else tier2
+            self.connect(asn, rng.sample(upstreams, min(len(upstreams), rng.choice([1, 1, 2, 2, 3]))))
+
+        for tier, count in ((tier2, 20), (tier3, 3)):
+            for asn in tier:
+                for peer in rng.sample(tier, min(len(tier) - 1, rng.randint(0, count))):
+                    if peer != asn:
+                        self.peers[asn].add(peer)
+                        self.peers[peer].add(asn)
+        self.peers = {asn: sorted(peers) for asn, peers in self.peers.items()}
+
+    def connect(self, customer, providers):
+        self.providers[customer].extend(providers)
+        for provider in providers:
+            self.customers[provider].append(customer)
+
+    def aspa_records(self, adoption=1.0, seed=0, afis=(IPv4, IPv6)):
+        # providerless ASes attest AS 0
+        rng = random.Random(seed)
+        records = {}
+        for asn, providers in self.providers.items():
+            if rng.random() < adoption:
+                records[asn] = set(providers) or {0}
+        return {afi: {asn: set(providers) for asn, providers in records.items()} for afi in afis}
+
+    def paths(self, count, seed=0, leak_ratio=0.05, prepend_ratio=0.1, set_ratio=0.01,
+              downflow_ratio=0.7, afis=(IPv4, IPv6)):
+        # yields (path, neighbor_as, afi, kind, leak) with path in the
+        # JSON representation of the module comment
+        rng = random.Random(seed)
+        origins = list(self.providers)
+        while count > 0:
+            kind = DOWNFLOW if rng.random() < downflow_ratio else UPFLOW
+            path = self.valley_free_path(rng, rng.choice(origins), kind)
+            if path is None:
+                continue
+            leak = rng.random() < leak_ratio and self.leak(rng, path)
+
+            items = []
+            for asn in path:
+                items.extend([asn] * (1 + (rng.randint(1, 3) if rng.random() < prepend_ratio else 0)))
+            if rng.random() < set_ratio:
+                items[0] = sorted(rng.sample(origins, rng.randint(2, 3)))
+            count -= 1
+            yield items, path[-1], rng.choice(afis), kind, leak
+
+    def valley_free_path(self, rng, origin, kind):
+        # up-ramp, optionally one peer hop and, for paths received from a
+        # provider, a down-ramp
+        path = [origin]
+        while self.providers[path[-1]] and rng.random() < 0.8:
+            provider = rng.choice(self.providers[path[-1]])
+            if provider in path:
+                break
+            path.append(provider)
+        if kind == UPFLOW:
+            return path
+
+        if self.peers[path[-1]] and rng.random() < 0.5:
+            peer = rng.choice(self.peers[path[-1]])
+            if peer not in path:
+                path.append(peer)
+        while self.customers[path[-1]] and rng.random() < 0.6:
+            customer = rng.choice(self.customers[path[-1]])
+            if customer in path:
+                break
+            path.append(customer)
+        # the verifying AS is a customer of the neighbor
+        return path if self.customers[path[-1]] else None
+
+    def leak(self, rng, path):
+        # a route learned from a provider or peer is re-announced to another
+        # provider; routes learned from a customer are first passed to a
+        # peer, which leaks them to one of its providers
+        last = path[-1]
+        if len(path) < 2 or path[-2] in self.customers[last]:
+            peers = [peer for peer in self.peers[last] if peer not in path]
+            if not peers:
+                return False
+            last = rng.choice(peers)
+            candidates = [provider for provider in self.providers[last] if provider not in path]
+            if not candidates:
+                return False
+            path.append(last)
+        else:
+            candidates = [provider for provider in self.providers[last] if provider not in path]
+            if not candidates:
+                return False
+        path.append(rng.choice(candidates))
+        return True
+
+
+def to_segments(items):
+    aspath = []
+    for item in items:
+        if isinstance(item, list):
+            aspath.extend(Segment(asn, AS_SET) for asn in item)
+        else:
+            aspath.append(Segment(item, AS_SEQUENCE))
+    return aspath
+
+
+def open_text(path, mode='r'):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't')
+    return open(path, mode)
+
+
+def write_records(path, aspa_records):
+    with open_text(path, 'w') as file:
+        json.dump({afi: {customer_as: sorted(providers) for customer_as, providers in records_afi.items()}
+                   for afi, records_afi in aspa_records.items()}, file)
+
+
+def read_records(path):
+    with open_text(path) as file:
+        data = json.load(file)
+    return {int(afi): {int(customer_as): set(providers) for customer_as, providers in records_afi.items()}
+            for afi, records_afi in data.items()}
+
+
+def write_paths(path, routes):
+    with open_text(path, 'w') as file:
+        for items, neighbor_as, afi, kind, leak in routes:
+            file.write(json.dumps({'path': items, 'neighbor': neighbor_as, 'afi': afi,
+                                   'kind': KIND_NAMES[kind], 'leak': leak}) + '\n')
+
+
+def iter_routes(files, convert=to_segments):
+    # yields (file name, line number, route object, (aspath, neighbor_as,
+    # afi, kind)) of the open paths files, the path items converted by
+    # convert (None keeps them); a malformed line raises PathsError
+    for file in files:
+        name = '-' if file is sys.stdin else getattr(file, 'name', '-')
+        for index, line in enumerate(file):
+            if not line.strip():
+                continue
+            try:
+                route = json.loads(line)
+                aspath = route['path'] if convert is None else convert(route['path'])
+                item = aspath, route['neighbor'], route.get('afi', IPv4), KINDS[route['kind']]
+            except (ValueError, KeyError, TypeError) as error:
+                raise PathsError(f"{name}:{index + 1}: invalid route: {error}") from error
+            yield name, index + 1, route, item
+
+
+def read_paths(file):
+    # yields (aspath, neighbor_as, afi, kind) from an open paths file
+    for _, _, _, item in iter_routes([file]):
+        yield item
+
+
+def main():
+    parser = argparse.ArgumentParser(description="generate a synthetic AS topology, ASPA records and AS_PATHs")
+    parser.add_argument('--ases', type=int, default=80000)
+    parser.add_argument('--paths', type=int, default=1000000)
+    parser.add_argument('--adoption', type=float, default=0.3, help="share of ASes publishing an ASPA record")
+    parser.add_argument('--leak-ratio', type=float, default=0.05)
+    parser.add_argument('--prepend-ratio', type=float, default=0.1)
+    parser.add_argument('--set-ratio', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--records', required=True, help="output file of the ASPA records (JSON)")
+    parser.add_argument('--output', required=True, help="output file of the paths (JSON lines, .gz to compress)")
+    args = parser.parse_args()
+
+    topology = Topology(args.ases, args.seed)
+    write_records(args.records, topology.aspa_records(args.adoption, args.seed))
+    write_paths(args.output, topology.paths(args.paths, args.seed, args.leak_ratio, args.prepend_ratio, args.set_ratio))
+
+
+if __name__ == '__main__':
+    main()
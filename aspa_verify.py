@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+#
+# Bulk validation of AS_PATHs from the command line.
+#
+#   python aspa_verify.py --table records.json paths.jsonl.gz --workers 8 --output verdicts.csv
+#   zcat paths.jsonl.gz | python aspa_verify.py --table aspa.snap --format json
+#
+# The table is a records file as written by aspa_topology (.json), a
+# snapshot (.snap) or a directory of .asa objects. Every input line is a
+# JSON object as written by aspa_topology
+#
+#   {"path": [43247, 13238, [1, 2], 3356], "neighbor": 3356, "afi": 4, "kind": "downflow"}
+#
+# and read from the files given or stdin. The verdicts are written in input
+# order as CSV or JSON lines, each with the file (- for stdin) and line
+# number of its route, the summary goes to stderr. With more than one
+# worker the routes are verified by a VerificationEngine, which holds at
+# most max_pending chunks of routes in memory at any time.
+#
+# A single process verifies with any backend of aspa_backends; --backend
+# auto picks the fastest one equivalent to ASPA on the first routes.
+#
+import argparse
+import csv
+import json
+import sys
+import time
+from collections import deque
+from itertools import chain, islice
+
+from aspa_logic import *
+from aspa_backends import BACKENDS, UnsupportedRoute, create_backend, select_backend
+from aspa_loader import load_records
+from aspa_engine import VerificationEngine
+from aspa_metrics import VERDICT_NAMES
+from aspa_topology import PathsError, iter_routes, open_text, to_segments
+
+
+def read_routes(files, pending, convert=None):
+    # yields the routes of the paths files, the path items converted by
+    # convert, and appends (file name, line number, route object) to pending
+    # for each
+    try:
+        for name, line, route, item in iter_routes(files, convert):
+            pending.append((name, line, route))
+            yield item
+    except PathsError as error:
+        raise SystemExit(f"aspa-verify: {error}")
+
+
+def local_verify(backend, routes):
+    verify = backend.verify
+    for aspath, neighbor_as, afi, kind in routes:
+        try:
+            yield verify(aspath, neighbor_as, afi, kind)
+        except UnsupportedRoute as error:
+            raise SystemExit(f"aspa-verify: backend {backend.name} cannot verify a route: {error}")
+
+
+def path_text(items):
+    # origin first like the input, AS_SET members in braces
+    return ' '.join(str(item) if isinstance(item, int) else '{' + ' '.join(map(str, item)) + '}' for item in items)
+
+
+class CSVWriter:
+    fields = ['file', 'line', 'path', 'neighbor', 'afi', 'kind', 'verdict']
+
+    def __init__(self, output):
+        self.writer = csv.writer(output)
+        self.writer.writerow(self.fields)
+
+    def write(self, name, line, route, verdict):
+        self.writer.writerow([name, line, path_text(route['path']), route['neighbor'], route.get('afi', IPv4),
+                              route['kind'], VERDICT_NAMES[verdict]])
+
+
+class JSONWriter:
+    def __init__(self, output):
+        self.output = output
+
+    def write(self, name, line, route, verdict):
+        route.update(file=name, line=line, verdict=VERDICT_NAMES[verdict])
+        self.output.write(json.dumps(route) + '\n')
+
+
+def main(argv=None):
+    started = time.perf_counter()
+    parser = argparse.ArgumentParser(prog='aspa-verify', description="verify AS_PATHs against an ASPA table")
+    parser.add_argument('--table', required=True, help="ASPA table (.json records, .snap snapshot or directory of .asa objects)")
+    parser.add_argument('paths', nargs='*', default=['-'], help="paths files (JSON lines, .gz compressed, - for stdin)")
+    parser.add_argument('--workers', type=int, default=1, help="worker processes, 1 verifies in this process")
+    parser.add_argument('--chunksize', type=int, default=2048)
+    parser.add_argument('--backend', default='aspa', choices=['auto'] + sorted(BACKENDS),
+                        help="verification backend of a single process, auto to calibrate")
+    parser.add_argument('--calibration-routes', type=int, default=1000, help="routes the auto backend is chosen on")
+    parser.add_argument('--format', choices=['csv', 'json'], help="output format, by default from the output suffix")
+    parser.add_argument('--output', default='-', help="verdicts output file, - for stdout")
+    args = parser.parse_args(argv)
+    if args.workers > 1 and args.backend != 'aspa':
+        parser.error("--backend needs --workers 1, the workers always verify with ASPA")
+
+    output_format = args.format or ('json' if args.output.endswith(('.json', '.jsonl', '.json.gz', '.jsonl.gz')) else 'csv')
+    files = [sys.stdin if path == '-' else open_text(path) for path in args.paths]
+    output = sys.stdout if args.output == '-' else open_text(args.output, 'w')
+    writer = (JSONWriter if output_format == 'json' else CSVWriter)(output)
+
+    pending = deque()
+    engine = backend = calibration = aspa_records = None
+    counts = {name: 0 for name in VERDICT_NAMES.values()}
+    try:
+        if args.workers > 1:
+            # the workers convert the paths, Segment objects are expensive to pickle
+            routes = read_routes(files, pending)
+            if args.table.endswith('.snap'):
+                # the workers map the snapshot itself
+                engine = VerificationEngine(args.table, workers=args.workers, chunksize=args.chunksize)
+            else:
+                engine = VerificationEngine.from_records(load_records(args.table), workers=args.workers,
+                                                         chunksize=args.chunksize)
+            verdicts = engine.verify(routes)
+        else:
+            routes = read_routes(files, pending, to_segments)
+            # a snapshot stays mapped, only the backends that need the dict copy it
+            aspa_records = load_records(args.table)
+            if args.backend == 'auto':
+                sample = list(islice(routes, args.calibration_routes))
+                backend, calibration = select_backend(aspa_records, sample)
+                routes = chain(sample, routes)
+            else:
+                backend = create_backend(args.backend, aspa_records)
+            verdicts = local_verify(backend, routes)
+        ready = time.perf_counter()
+
+        for verdict in verdicts:
+            name, line, route = pending.popleft()
+            writer.write(name, line, route, verdict)
+            counts[VERDICT_NAMES[verdict]] += 1
+    finally:
+        if engine is not None:
+            engine.close()
+        if hasattr(aspa_records, 'close'):
+            aspa_records.close()
+        for file in files:
+            if file is not sys.stdin:
+                file.close()
+        if output is not sys.stdout:
+            output.close()
+        else:
+            output.flush()
+
+    finished = time.perf_counter()
+    routes = sum(counts.values())
+    summary = {
+        'routes': routes,
+        'verdicts': counts,
+        'workers': args.workers,
+        'backend': backend.name if engine is None else 'aspa',
+        'startup': round(ready - started, 3),
+        'elapsed': round(finished - started, 3),
+        'routes_per_second': round(routes / (finished - ready)) if finished > ready else 0,
+    }
+    if calibration is not None:
+        # ns per route of every eligible backend, why the others are not
+        summary['calibration'] = calibration
+    print(json.dumps(summary), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
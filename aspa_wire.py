@@ -0,0 +1,175 @@
+#
+# Zero-copy decoding of the BGP AS_PATH and AS4_PATH attributes (RFC 4271,
+# RFC 6793) into the run-length ASPath taken by the ASPA check methods.
+#
+#   aspath = parse_as_path(attribute_body)
+#   aspath = parse_attributes(path_attributes, as4=False)
+#   attribute_body = encode_as_path(aspath)
+#
+# The attribute bytes are only read through memoryview slices; the ASNs of
+# every segment are copied once, straight into an array.
+#
+import sys
+from array import array
+from itertools import chain, groupby
+from operator import attrgetter
+
+from aspa_logic import *
+
+
+ATTR_AS_PATH, ATTR_AS4_PATH = 2, 17
+ATTR_FLAG_EXTENDED_LENGTH = 0x10
+
+MAX_SEGMENT_LENGTH = 255
+
+# placeholder of 4-byte ASNs in the AS_PATH of 2-byte speakers
+AS_TRANS = 23456
+
+SEGMENT_TYPES = frozenset((AS_SET, AS_SEQUENCE, AS_CONFED_SEQUENCE, AS_CONFED_SET))
+CONFED_TYPES = frozenset((AS_CONFED_SEQUENCE, AS_CONFED_SET))
+
+# ASNs are big endian on the wire
+SWAP = sys.byteorder == 'little'
+
+
+class WireError(ValueError):
+    pass
+
+
+def iter_attributes(data):
+    # yields (type, value) of a BGP path attribute block
+    data = memoryview(data)
+    offset = 0
+    while offset < len(data):
+        if offset + 3 > len(data):
+            raise WireError("truncated path attribute header")
+        flags, attr_type = data[offset], data[offset + 1]
+        if flags & ATTR_FLAG_EXTENDED_LENGTH:
+            if offset + 4 > len(data):
+                raise WireError("truncated path attribute header")
+            length = data[offset + 2] << 8 | data[offset + 3]
+            offset += 4
+        else:
+            length = data[offset + 2]
+            offset += 3
+        if offset + length > len(data):
+            raise WireError("truncated path attribute")
+        yield attr_type, data[offset:offset + length]
+        offset += length
+
+
+def iter_segments(data, as4=True):
+    # yields (segment type, ASN array in wire order) of an AS_PATH or
+    # AS4_PATH attribute body
+    data = memoryview(data)
+    size, typecode = (4, ASN_TYPECODE) if as4 else (2, 'H')
+    offset = 0
+    while offset < len(data):
+        if offset + 2 > len(data):
+            raise WireError("truncated AS_PATH segment header")
+        segment_type, count = data[offset], data[offset + 1]
+        end = offset + 2 + count * size
+        if end > len(data):
+            raise WireError("truncated AS_PATH segment")
+        if segment_type not in SEGMENT_TYPES:
+            raise WireError(f"unknown AS_PATH segment type {segment_type}")
+        asns = array(typecode)
+        asns.frombytes(data[offset + 2:end])
+        if SWAP:
+            asns.byteswap()
+        yield segment_type, asns
+        offset = end
+
+
+def segment_length(segment_type, asns):
+    # contribution to the AS_PATH length of RFC 4271 9.1.2.2
+    if segment_type == AS_SEQUENCE:
+        return len(asns)
+    if segment_type == AS_SET:
+        return 1 if asns else 0
+    return 0
+
+
+def merge_as4_path(segments, as4_segments):
+    # RFC 6793 4.2.3: the AS4_PATH replaces the trailing part of the AS_PATH
+    # of the same length; confederation segments of the AS4_PATH are
+    # discarded and an AS4_PATH longer than the AS_PATH is ignored
+    as4_segments = [(segment_type, asns) for segment_type, asns in as4_segments if segment_type not in CONFED_TYPES]
+    missing = sum(segment_length(*segment) for segment in segments) - \
+        sum(segment_length(*segment) for segment in as4_segments)
+    if missing < 0:
+        return segments
+
+    merged = []
+    for segment_type, asns in segments:
+        if missing <= 0 and segment_type not in CONFED_TYPES:
+            break
+        if segment_type == AS_SEQUENCE and len(asns) > missing:
+            asns = asns[:missing]
+        merged.append((segment_type, asns))
+        missing -= segment_length(segment_type, asns)
+    return merged + as4_segments
+
+
+def build_path(segments):
+    # ASPath of (segment type, ASN array) segments in wire order, i.e. with
+    # the neighbor first
+    if all(segment_type == AS_SEQUENCE for segment_type, _ in segments):
+        return ASPath.from_sequence(chain.from_iterable(reversed(asns) for _, asns in reversed(segments)))
+    return ASPath((asn, segment_type) for segment_type, asns in reversed(segments) for asn in reversed(asns))
+
+
+def parse_as_path(data, as4=True, as4_path=None):
+    # as4_path is the AS4_PATH body accompanying the AS_PATH of a speaker
+    # without 4-byte ASN support (as4=False)
+    data = memoryview(data)
+    if as4 and len(data) > 2 and data[0] == AS_SEQUENCE and len(data) == 2 + 4 * data[1]:
+        # a single AS_SEQUENCE segment, by far the most common AS_PATH
+        values = array(ASN_TYPECODE)
+        values.frombytes(data[2:])
+        if SWAP:
+            values.byteswap()
+        # no repeated ASN, hence no prepend: the array is the run array
+        if len(set(values)) == len(values):
+            values.reverse()
+            return ASPath.from_runs(values)
+        return ASPath.from_sequence(reversed(values))
+
+    segments = list(iter_segments(data, as4))
+    if not as4 and as4_path is not None:
+        segments = merge_as4_path(segments, iter_segments(as4_path))
+    return build_path(segments)
+
+
+def parse_attributes(data, as4=True):
+    # ASPath of a BGP path attribute block, None without AS_PATH; a speaker
+    # without 4-byte ASN support (as4=False) also sends AS4_PATH
+    as_path = as4_path = None
+    for attr_type, value in iter_attributes(data):
+        if attr_type == ATTR_AS_PATH:
+            as_path = value
+        elif attr_type == ATTR_AS4_PATH:
+            as4_path = value
+    if as_path is None:
+        return None
+    return parse_as_path(as_path, as4, as4_path)
+
+
+def encode_as_path(aspath, as4=True):
+    # AS_PATH attribute body of an ASPath or a list of Segment objects, the
+    # inverse of parse_as_path; without as4 the 4-byte ASNs become AS_TRANS
+    if isinstance(aspath, ASPath):
+        aspath = aspath.segments()
+    body = bytearray()
+    for segment_type, group in groupby(reversed(aspath), key=attrgetter('type')):
+        if as4:
+            asns = array(ASN_TYPECODE, [segment.value for segment in group])
+        else:
+            asns = array('H', [segment.value if segment.value <= 0xffff else AS_TRANS for segment in group])
+        if SWAP:
+            asns.byteswap()
+        for start in range(0, len(asns), MAX_SEGMENT_LENGTH):
+            chunk = asns[start:start + MAX_SEGMENT_LENGTH]
+            body += bytes((segment_type, len(chunk)))
+            body += chunk.tobytes()
+    return bytes(body)
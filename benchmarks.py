@@ -0,0 +1,951 @@
+#!/usr/bin/env python3
+#
+# Benchmarks for the ASPA verification code.
+#
+#   python benchmarks.py memory --customers 80000
+#   python benchmarks.py batch --paths 200000
+#   python benchmarks.py kernel --paths 20000 --length 32 --prepends 4
+#   python benchmarks.py aspath --paths 200000 --prepends 3
+#   python benchmarks.py wire --attributes 1000000
+#   python benchmarks.py rib --routes 500000 --updates 1000
+#   python benchmarks.py metrics --paths 200000
+#   python benchmarks.py routeserver --paths 20000 --sessions 200
+#   python benchmarks.py intern --routes 1000000 --paths 100000
+#   python benchmarks.py diff --routes 1000000 --changes 1000
+#   python benchmarks.py rcu --threads 1 2 4 8 --updates-per-second 1000
+#   python benchmarks.py daemon --paths 200000 --windows 1 16 256 4096
+#   python benchmarks.py cli --routes 1000000 --workers 1 4
+#   python benchmarks.py backends --routes 3000
+#   python benchmarks.py der --objects 50000
+#   python benchmarks.py snapshot --customers 80000
+#   python benchmarks.py engine --routes 1000000 --workers 1 2 4 8
+#   python benchmarks.py rtr --customers 80000 --updates 1000
+#   python benchmarks.py suite --output results.json [--baseline baseline.json]
+#
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from aspa_logic import *
+from aspa_backends import BACKENDS, create_backend, select_backend
+from aspa_daemon import VerificationClient
+from aspa_der import encode_signed_object, load_directory
+from aspa_diff import changed_customers, diff_records, impact, impact_routes
+from aspa_engine import VerificationEngine
+from aspa_intern import RouteTable
+from aspa_rtr import RTRCacheServer, RTRClient
+from aspa_snapshot import load_snapshot, write_snapshot
+from aspa_store import CompactRecords, HotProviderRecords
+from aspa_topology import write_paths, write_records
+from aspa_metrics import Metrics
+from aspa_rcu import RCUTable
+from aspa_rib import RIB
+from aspa_routeserver import RouteServer
+from aspa_wire import encode_as_path, parse_as_path
+
+from aspa_hackathon.structs import ASPADirection
+from aspa_hackathon.draft import draft_algorithm
+from aspa_hackathon.optimized import optimized_algorithm
+from aspa_hackathon.compiled import compiled_algorithm
+from aspa_hackathon.simple import new_algorithm
+
+
+# transit ASNs that show up in most real provider sets
+TRANSIT_ASES = [174, 1299, 2914, 3257, 3356, 3491, 6453, 6461, 6762, 6939, 9002, 12956]
+
+
+def synthetic_records(customers, seed=0, afis=(IPv4, IPv6)):
+    rng = random.Random(seed)
+    records = {}
+    for afi in afis:
+        records_afi = {}
+        for customer in rng.sample(range(1, 400000), customers):
+            providers = set(rng.sample(TRANSIT_ASES, rng.randint(1, 3)))
+            # long tail of regional providers
+            for _ in range(rng.randint(0, 3)):
+                providers.add(rng.randint(1, 400000))
+            records_afi[customer] = providers
+        records[afi] = records_afi
+    return records
+
+
+def traced_size(build):
+    tracemalloc.start()
+    try:
+        obj = build()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return obj, size
+
+
+def lookup_rate(aspa, pairs, afi):
+    verify_pair = aspa.verify_pair
+    start = time.perf_counter()
+    for as1, as2 in pairs:
+        verify_pair(as1, as2, afi)
+    return len(pairs) / (time.perf_counter() - start)
+
+
+def bench_memory(args):
+    # rebuild the input for every layout so that both are measured from scratch
+    layouts = [
+        ('dict', lambda: ASPA(synthetic_records(args.customers, args.seed))),
+        ('compact', lambda: ASPA(synthetic_records(args.customers, args.seed), store=CompactRecords)),
+        ('hot', lambda: ASPA(synthetic_records(args.customers, args.seed), store=HotProviderRecords)),
+    ]
+
+    rng = random.Random(args.seed)
+    customers = list(synthetic_records(args.customers, args.seed)[IPv4])
+    pairs = [(rng.choice(customers), rng.choice(TRANSIT_ASES)) for _ in range(args.lookups)]
+    # providers outside the transit core, mostly Invalid
+    tail_pairs = [(rng.choice(customers), rng.randint(1, 400000)) for _ in range(args.lookups)]
+
+    print(f"{'layout':<10} {'memory':>12} {'lookups/s':>12} {'tail lookups/s':>15}")
+    for name, build in layouts:
+        aspa, size = traced_size(build)
+        print(f"{name:<10} {size / 2 ** 20:>10.1f}MB {lookup_rate(aspa, pairs, IPv4):>12,.0f}"
+              f" {lookup_rate(aspa, tail_pairs, IPv4):>15,.0f}")
+
+
+def synthetic_paths(records, count, seed=0, max_length=8):
+    rng = random.Random(seed)
+    customers = list(records[IPv4])
+    paths = []
+    for _ in range(count):
+        path = [rng.choice(customers)]
+        while len(path) < rng.randint(1, max_length):
+            providers = records[IPv4].get(path[-1])
+            path.append(rng.choice(sorted(providers)) if providers and rng.random() < 0.8 else rng.choice(TRANSIT_ASES))
+        paths.append(path)
+    return paths
+
+
+def bench_batch(args):
+    records = synthetic_records(args.customers, args.seed)
+    paths = synthetic_paths(records, args.paths, args.seed)
+    neighbors = [path[-1] for path in paths]
+    segment_paths = [[Segment(asn, AS_SEQUENCE) for asn in path] for path in paths]
+
+    for name, store in (('dict', None), ('compact', CompactRecords)):
+        aspa = ASPA(records, store=store)
+        for kind, check in ((UPFLOW, aspa.check_upflow_path), (DOWNFLOW, aspa.check_downflow_path)):
+            start = time.perf_counter()
+            for aspath, neighbor_as in zip(segment_paths, neighbors):
+                check(aspath, neighbor_as, IPv4)
+            per_path = time.perf_counter() - start
+
+            aspa.verify_batch(paths[:1], neighbors[:1], IPv4, kind)
+            start = time.perf_counter()
+            aspa.verify_batch(paths, neighbors, IPv4, kind)
+            batch = time.perf_counter() - start
+
+            print(f"{name:<8} {('upflow', 'downflow')[kind]:<9} per-path {len(paths) / per_path:>12,.0f} paths/s"
+                  f"   batch {len(paths) / batch:>12,.0f} paths/s")
+
+
+def two_pass_downflow(aspa, aspath, neighbor_as, afi):
+    # check_downflow_path before the single pass kernel: two full
+    # get_indexes scans over the path and a reversed copy of it
+    if len(aspath) == 0 or aspath[-1].type == AS_SEQUENCE and aspath[-1].value != neighbor_as:
+        return Invalid
+    forward_invalid, forward_unknown, forward_unverifiable = aspa.get_indexes(aspath, afi)
+    backward_invalid, backward_unknown, backward_unverifiable = aspa.get_indexes(list(reversed(aspath)), afi)
+    if forward_invalid + backward_invalid < len(aspath):
+        return Invalid
+    if forward_unverifiable or backward_unverifiable:
+        return Unverifiable
+    if forward_unknown + backward_unknown < len(aspath):
+        return Unknown
+    return Valid
+
+
+def bench_kernel(args):
+    # long paths with every AS prepended up to --prepends times, a share of
+    # them leaked right after the origin so that the kernel can stop early
+    records = synthetic_records(args.customers, args.seed, afis=(IPv4,))
+    rng = random.Random(args.seed)
+    aspa = ASPA(records)
+    routes = []
+    for path in synthetic_paths(records, args.paths, args.seed, args.length):
+        if rng.random() < args.leak_ratio:
+            path.insert(1, rng.choice(list(records[IPv4])))
+        aspath = [Segment(asn, AS_SEQUENCE) for asn in path for _ in range(rng.randint(1, args.prepends))]
+        routes.append((aspath, path[-1]))
+
+    for name, check in (('two-pass', lambda aspath, neighbor_as, afi: two_pass_downflow(aspa, aspath, neighbor_as, afi)),
+                        ('kernel', aspa.check_downflow_path)):
+        verdicts, elapsed = timed(lambda: [check(aspath, neighbor_as, IPv4) for aspath, neighbor_as in routes])
+        print(f"{name:<9} {len(routes) / elapsed:>12,.0f} paths/s  "
+              f"{sum(len(aspath) for aspath, _ in routes) / len(routes):.1f} segments/path  "
+              f"valid/invalid/unknown {verdicts.count(Valid)}/{verdicts.count(Invalid)}/{verdicts.count(Unknown)}")
+
+
+def bench_aspath(args):
+    # memory and downflow verification of Segment lists against ASPath
+    records = synthetic_records(args.customers, args.seed, afis=(IPv4,))
+    rng = random.Random(args.seed)
+    paths = [[asn for asn in path for _ in range(rng.randint(1, args.prepends))]
+             for path in synthetic_paths(records, args.paths, args.seed, args.length)]
+    neighbors = [path[-1] for path in paths]
+    aspa = ASPA(records)
+
+    layouts = [
+        ('segments', lambda: [[Segment(asn, AS_SEQUENCE) for asn in path] for path in paths]),
+        ('aspath', lambda: [ASPath.from_sequence(path) for path in paths]),
+    ]
+    print(f"{'layout':<9} {'bytes/route':>12} {'build/s':>12} {'paths/s':>12}")
+    for name, build in layouts:
+        aspaths, size = traced_size(build)
+        _, build_time = timed(build)
+        _, verify_time = timed(lambda: [aspa.check_downflow_path(aspath, neighbor_as, IPv4)
+                                        for aspath, neighbor_as in zip(aspaths, neighbors)])
+        print(f"{name:<9} {size / len(paths):>12.0f} {len(paths) / build_time:>12,.0f} "
+              f"{len(paths) / verify_time:>12,.0f}")
+
+
+def decode_segments(data, as4=True):
+    # the Segment list decoder aspa_wire.parse_as_path replaced, origin first
+    asn_format = '!I' if as4 else '!H'
+    segments = []
+    offset = 0
+    while offset < len(data):
+        segment_type, count = data[offset], data[offset + 1]
+        end = offset + 2 + count * struct.calcsize(asn_format)
+        for (asn,) in struct.iter_unpack(asn_format, data[offset + 2:end]):
+            segments.append(Segment(asn, segment_type))
+        offset = end
+    segments.reverse()
+    return segments
+
+
+def bench_wire(args):
+    records = synthetic_records(args.customers, args.seed, afis=(IPv4,))
+    rng = random.Random(args.seed)
+    paths = synthetic_paths(records, args.distinct, args.seed, args.length)
+    attributes = []
+    for _ in range(args.attributes):
+        path = rng.choice(paths)
+        if rng.random() < args.prepend_ratio:
+            path = [asn for asn in path for _ in range(rng.randint(1, 3))]
+        attributes.append(memoryview(encode_as_path(ASPath.from_list(path))))
+
+    print(f"{'decoder':<14} {'attributes/s':>14}")
+    for name, decode in (('segment list', decode_segments), ('aspath', parse_as_path)):
+        _, elapsed = timed(lambda: [decode(data) for data in attributes])
+        print(f"{name:<14} {len(attributes) / elapsed:>14,.0f}")
+
+    # a 2-byte speaker sends the 4-byte ASNs of the AS_PATH as AS_TRANS
+    path = ASPath.from_list([174, 4200000000, 4200000001, 3356])
+    as_path = memoryview(encode_as_path(path, as4=False))
+    as4_path = memoryview(encode_as_path(ASPath.from_list([174, 4200000000, 4200000001])))
+    _, elapsed = timed(lambda: [parse_as_path(as_path, False, as4_path) for _ in range(len(attributes) // 10)])
+    print(f"{'as4 merge':<14} {len(attributes) // 10 / elapsed:>14,.0f}")
+
+
+def bench_rib(args):
+    # single customer record changes: incremental revalidation against
+    # re-running the checks on every stored route
+    records = synthetic_records(args.customers, args.seed, afis=(IPv4,))
+    rng = random.Random(args.seed)
+    aspa = ASPA(records)
+    rib = RIB(aspa)
+    _, build_time = timed(lambda: [rib.add(index, ASPath.from_sequence(path), path[-1], IPv4, DOWNFLOW)
+                                   for index, path in enumerate(synthetic_paths(records, args.routes, args.seed))])
+    print(f"{len(rib)} routes added in {build_time:.2f}s")
+
+    _, full_time = timed(lambda: [aspa.check_path(aspath, neighbor_as, afi, kind)
+                                  for aspath, neighbor_as, afi, kind, _ in rib.routes.values()])
+
+    customers = list(records[IPv4])
+    transitions = 0
+    start = time.perf_counter()
+    for _ in range(args.updates):
+        customer_as = rng.choice(customers)
+        transitions += len(rib.apply_delta(added={IPv4: {customer_as: rng.sample(TRANSIT_ASES, 2)}}))
+    incremental_time = (time.perf_counter() - start) / args.updates
+
+    print(f"full revalidation    {full_time * 1000:>10.2f}ms per update  {len(rib)} routes")
+    print(f"incremental          {incremental_time * 1000:>10.3f}ms per update  "
+          f"{rib.revalidated / args.updates:.1f} routes  {transitions / args.updates:.2f} transitions")
+
+
+def bench_metrics(args):
+    # instrumentation overhead: never enabled, enabled, and disabled again
+    records = synthetic_records(args.customers, args.seed, afis=(IPv4,))
+    routes = [(ASPath.from_sequence(path), path[-1]) for path in synthetic_paths(records, args.paths, args.seed)]
+    aspa = ASPA(records)
+    metrics = Metrics(aspa)
+
+    def run():
+        check = aspa.check_downflow_path
+        return timed(lambda: [check(aspath, neighbor_as, IPv4) for aspath, neighbor_as in routes])[1]
+
+    baseline = run()
+    metrics.enable()
+    enabled = run()
+    metrics.disable()
+    disabled = run()
+    for name, elapsed in (('off', baseline), ('enabled', enabled), ('disabled', disabled)):
+        print(f"{name:<9} {len(routes) / elapsed:>12,.0f} paths/s  {elapsed / baseline - 1:>+7.1%}")
+
+
+def bench_routeserver(args):
+    # every path is received from its neighbor AS over --sessions sessions
+    records = synthetic_records(args.customers, args.seed, afis=(IPv4,))
+    aspa = ASPA(records)
+    paths = [ASPath.from_sequence(path) for path in synthetic_paths(records, args.paths, args.seed)]
+    routes = [(aspath, aspath[-1].value, IPv4, UPFLOW) for aspath in paths for _ in range(args.sessions)]
+
+    _, per_session = timed(lambda: [aspa.check_upflow_path(aspath, neighbor_as, afi) for aspath, neighbor_as, afi, _ in routes])
+    server = RouteServer(aspa, maxsize=len(paths))
+    _, streamed = timed(lambda: list(server.verify_routes(routes)))
+    stats = server.stats()
+    neighbors = [[aspath[-1].value] * args.sessions for aspath in paths]
+    _, fanned_out = timed(lambda: [RouteServer(aspa).verify_sessions(aspath, IPv4, UPFLOW, sessions)
+                                   for aspath, sessions in zip(paths, neighbors)])
+
+    for name, elapsed in (('per session', per_session), ('route server', streamed), ('fan out', fanned_out)):
+        print(f"{name:<13} {len(routes) / elapsed:>12,.0f} routes/s")
+    print(f"hit ratio {stats['hit_ratio']:.3f}  path verifications {stats['path_verifications']}  "
+          f"saved {stats['saved_verifications']} ({stats['saved_ratio']:.1%})")
+
+
+def bench_intern(args):
+    # full table dump: a few paths carry most routes (Zipf like popularity)
+    records = synthetic_records(args.customers, args.seed, afis=(IPv4,))
+    aspa = ASPA(records)
+    paths = synthetic_paths(records, args.paths, args.seed)
+    rng = random.Random(args.seed)
+    weights = [1 / rank for rank in range(1, len(paths) + 1)]
+    picks = rng.choices(range(len(paths)), weights, k=args.routes)
+
+    # every route decoded into a fresh list of Segment objects
+    routes, per_route_size = traced_size(lambda: [([Segment(asn, AS_SEQUENCE) for asn in paths[pick]],
+                                                    paths[pick][-1], IPv4, DOWNFLOW) for pick in picks])
+    _, per_route = timed(lambda: [aspa.check_path(*route) for route in routes])
+    del routes
+
+    def build():
+        table = RouteTable()
+        for pick in picks:
+            path = paths[pick]
+            table.add(ASPath.from_sequence(path), path[-1], IPv4, DOWNFLOW)
+        return table
+
+    table, interned_size = traced_size(build)
+    _, interned = timed(lambda: list(table.verify(aspa)))
+    stats = table.stats()
+
+    print(f"{'layout':<10} {'memory':>12} {'routes/s':>12}")
+    for name, size, elapsed in (('per route', per_route_size, per_route), ('interned', interned_size, interned)):
+        print(f"{name:<10} {size / 2 ** 20:>10.1f}MB {args.routes / elapsed:>12,.0f}")
+    print(f"unique paths {stats['unique_paths']}  routes per path {stats['routes_per_path']:.1f}  "
+          f"saved verifications {stats['saved_verifications']} ({stats['saved_ratio']:.1%})")
+
+
+def bench_diff(args):
+    old_records = synthetic_records(args.customers, args.seed)
+    rng = random.Random(args.seed)
+    new_records = {afi: dict(records_afi) for afi, records_afi in old_records.items()}
+    for records_afi in new_records.values():
+        for customer_as in rng.sample(sorted(records_afi), args.changes):
+            if rng.random() < 0.5:
+                del records_afi[customer_as]
+            else:
+                records_afi[customer_as] = {rng.choice(TRANSIT_ASES)}
+    paths = synthetic_paths(old_records, args.routes, args.seed)
+    routes = [(index, ASPath.from_sequence(path), path[-1], IPv4, DOWNFLOW) for index, path in enumerate(paths)]
+    old_aspa, new_aspa = ASPA(old_records), ASPA(new_records)
+
+    (added, withdrawn), diff_time = timed(diff_records, old_records, new_records)
+    changed = changed_customers(added, withdrawn)
+
+    def full():
+        return [key for key, aspath, neighbor_as, afi, kind in routes
+                if old_aspa.check_path(aspath, neighbor_as, afi, kind)[0]
+                != new_aspa.check_path(aspath, neighbor_as, afi, kind)[0]]
+
+    flipped, full_time = timed(full)
+    report = impact_routes(routes, old_aspa, new_aspa, changed)
+    rib = RIB(old_aspa)
+    for key, aspath, neighbor_as, afi, kind in routes:
+        rib.add(key, aspath, neighbor_as, afi, kind)
+    rib_report = impact(rib, new_aspa, changed)
+    assert len(flipped) == len(report.transitions) == len(rib_report.transitions)
+
+    print(f"diff of {sum(map(len, changed.values()))} changed records  {diff_time:.3f}s")
+    for name, elapsed in (('both sets', full_time), ('routes', report.elapsed), ('rib', rib_report.elapsed)):
+        print(f"{name:<10} {elapsed:>8.3f}s")
+    print(f"affected routes {report.affected}  transitions {len(report.transitions)}")
+
+
+def stress(read, write, threads, duration, updates_per_second):
+    # threads readers verifying batches of paths against one writer thread;
+    # returns the verified batches and the applied updates
+    done = threading.Event()
+    counts = [0] * threads
+
+    def reader(index):
+        batches = 0
+        while not done.is_set():
+            read(batches)
+            batches += 1
+        counts[index] = batches
+
+    def writer():
+        updates, start = 0, time.perf_counter()
+        while not done.is_set():
+            write(updates)
+            updates += 1
+            # paced to updates_per_second
+            delay = start + updates / updates_per_second - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        counts.append(updates)
+
+    workers = [threading.Thread(target=reader, args=(index,)) for index in range(threads)]
+    workers.append(threading.Thread(target=writer))
+    for worker in workers:
+        worker.start()
+    time.sleep(duration)
+    done.set()
+    for worker in workers:
+        worker.join()
+    return sum(counts[:threads]), counts[threads]
+
+
+def bench_rcu(args):
+    records = synthetic_records(args.customers, args.seed)
+    paths = [([Segment(asn, AS_SEQUENCE) for asn in path], path[-1]) for path in synthetic_paths(records, 10000, args.seed)]
+    customers = sorted(records[IPv4])
+    rng = random.Random(args.seed)
+    deltas = [{IPv4: {customer_as: rng.sample(TRANSIT_ASES, 2)}, IPv6: {customer_as: rng.sample(TRANSIT_ASES, 2)}}
+              for customer_as in rng.sample(customers, 1000)]
+    batch = 64
+    batches = [paths[start:start + batch] for start in range(0, len(paths), batch)]
+
+    def locked():
+        aspa, lock = ASPA({afi: {customer_as: set(providers) for customer_as, providers in records_afi.items()}
+                           for afi, records_afi in records.items()}), threading.Lock()
+
+        def read(count):
+            # the lock is taken for every path, a path verified without
+            # it may see the records of both AFIs half updated
+            for aspath, neighbor_as in batches[count % len(batches)]:
+                with lock:
+                    aspa.check_upflow_path(aspath, neighbor_as, IPv4)
+
+        def write(update):
+            with lock:
+                aspa.apply_delta(added=deltas[update % len(deltas)])
+        return read, write, None
+
+    def rcu():
+        table = RCUTable(records)
+
+        def read(count):
+            aspa = table.current
+            for aspath, neighbor_as in batches[count % len(batches)]:
+                aspa.check_upflow_path(aspath, neighbor_as, IPv4)
+
+        def write(update):
+            table.apply_delta(added=deltas[update % len(deltas)])
+        return read, write, table
+
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print(f"{sys.version.split()[0]}  GIL {'enabled' if gil else 'disabled (free-threaded)'}  {os.cpu_count()} CPUs")
+    print(f"{'table':<8} {'threads':>7} {'paths/s':>12} {'updates/s':>10}")
+    for name, setup in (('locked', locked), ('rcu', rcu)):
+        for threads in args.threads:
+            read, write, table = setup()
+            verified, updates = stress(read, write, threads, args.duration, args.updates_per_second)
+            print(f"{name:<8} {threads:>7} {verified * batch / args.duration:>12,.0f} {updates / args.duration:>10,.0f}"
+                  + (f"  live versions {len(table.live_versions())}" if table is not None else ''))
+
+
+def bench_daemon(args):
+    records = synthetic_records(args.customers, args.seed)
+    aspa = ASPA(records)
+    routes = [(ASPath.from_sequence(path), path[-1], IPv4, UPFLOW) for path in synthetic_paths(records, args.paths, args.seed)]
+    _, in_process = timed(lambda: [aspa.check_path(*route) for route in routes])
+    print(f"{'in process':<16} {len(routes) / in_process:>12,.0f} paths/s")
+
+    async def run(path):
+        client = await VerificationClient.connect_unix(path)
+        try:
+            latencies = []
+            for route in routes[:args.requests]:
+                start = time.perf_counter()
+                await client.verify(*route)
+                latencies.append(time.perf_counter() - start)
+            latencies.sort()
+            print(f"{'one at a time':<16} p50 {latencies[len(latencies) // 2] * 1e6:>8.1f}us"
+                  f"  p99 {latencies[len(latencies) * 99 // 100] * 1e6:>8.1f}us")
+
+            for window in args.windows:
+                start = time.perf_counter()
+                for offset in range(0, len(routes), window):
+                    await client.verify_many(routes[offset:offset + window])
+                elapsed = time.perf_counter() - start
+                print(f"{f'window {window}':<16} {len(routes) / elapsed:>12,.0f} paths/s")
+        finally:
+            await client.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        records_path = os.path.join(directory, 'records.json')
+        socket_path = os.path.join(directory, 'aspa.sock')
+        write_records(records_path, records)
+        daemon = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'aspa_daemon.py'),
+                                   '--records', records_path, '--unix', socket_path])
+        try:
+            while not os.path.exists(socket_path):
+                if daemon.poll() is not None:
+                    raise SystemExit("aspa_daemon.py exited")
+                time.sleep(0.05)
+            asyncio.run(run(socket_path))
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+
+def bench_cli(args):
+    # startup: empty input, steady state: routes per second of the summary
+    records = synthetic_records(args.customers, args.seed)
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'aspa_verify.py')]
+    with tempfile.TemporaryDirectory() as directory:
+        tables = {'json': os.path.join(directory, 'records.json'), 'snap': os.path.join(directory, 'aspa.snap')}
+        write_records(tables['json'], records)
+        write_snapshot(tables['snap'], records)
+        paths = os.path.join(directory, 'paths.jsonl')
+        write_paths(paths, ((path, path[-1], IPv4, DOWNFLOW, False)
+                            for path in synthetic_paths(records, args.routes, args.seed)))
+
+        print(f"{'table':<6} {'workers':>7} {'startup':>9} {'routes/s':>12}")
+        for name, table in tables.items():
+            for workers in args.workers:
+                arguments = ['--table', table, '--workers', str(workers), '--output', os.devnull]
+                start = time.perf_counter()
+                subprocess.run(command + arguments, input=b'', check=True, capture_output=True)
+                startup = time.perf_counter() - start
+                result = subprocess.run(command + arguments + [paths], check=True, capture_output=True)
+                summary = json.loads(result.stderr)
+                print(f"{name:<6} {workers:>7} {startup:>8.3f}s {summary['routes_per_second']:>12,.0f}")
+
+
+IMPORT_TIME = '''
+import time
+start = time.perf_counter()
+import aspa_backends
+loaded = time.perf_counter()
+if {name!r}:
+    aspa_backends.create_backend({name!r}, {{}})
+print(loaded - start, time.perf_counter() - loaded)
+'''
+
+
+def bench_backends(args):
+    # import time of every backend in a fresh interpreter, then the
+    # calibration select_backend runs on a sample of the workload
+    directory = os.path.dirname(os.path.abspath(__file__))
+    print(f"{'backend':<10} {'import':>9}")
+    for name in [''] + list(BACKENDS):
+        best = None
+        for _ in range(args.repeat):
+            output = subprocess.run([sys.executable, '-c', IMPORT_TIME.format(name=name)], cwd=directory,
+                                    check=True, capture_output=True, text=True).stdout
+            loaded, created = map(float, output.split())
+            best = (loaded, created) if best is None else min(best, (loaded, created))
+        print(f"{name or 'registry':<10} {(best[0] if not name else best[1]) * 1e3:>7.2f}ms")
+
+    records = synthetic_records(args.customers, args.seed)
+    routes = [([Segment(asn, AS_SEQUENCE) for asn in path], path[-1], IPv4, kind)
+              for path in synthetic_paths(records, args.routes, args.seed) for kind in (UPFLOW, DOWNFLOW)]
+    print(f"\n{'backend':<10} {'build':>9} {'ns/route':>10}")
+    for name in BACKENDS:
+        _, build = timed(create_backend, name, records)
+        _, report = select_backend(records, routes, names=[name], repeat=args.repeat)
+        result = report[name]
+        print(f"{name:<10} {build:>8.3f}s " + (f"{result:>10.0f}" if isinstance(result, float) else f" {result}"))
+    backend, _ = select_backend(records, routes, repeat=args.repeat)
+    print(f"\nselected {backend.name}")
+
+
+def bench_der(args):
+    records = synthetic_records(args.objects, args.seed, afis=(IPv4,))[IPv4]
+    with tempfile.TemporaryDirectory() as directory:
+        for customer_as, providers in records.items():
+            with open(os.path.join(directory, f"{customer_as}.asa"), 'wb') as file:
+                file.write(encode_signed_object(customer_as, providers - {customer_as}))
+
+        for workers in args.workers:
+            _, report = load_directory(directory, workers=workers)
+            print(f"{workers:>2} workers  {report.parsed:>8} objects  {report.objects_per_second():>12,.0f} objects/s"
+                  f"  {len(report.malformed)} malformed")
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_snapshot(args):
+    records = synthetic_records(args.customers, args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        json_path = os.path.join(directory, 'aspa.json')
+        snapshot_path = os.path.join(directory, 'aspa.snap')
+        with open(json_path, 'w') as file:
+            json.dump({afi: {customer_as: sorted(providers) for customer_as, providers in records_afi.items()}
+                       for afi, records_afi in records.items()}, file)
+        _, write_time = timed(write_snapshot, snapshot_path, records)
+
+        def from_json():
+            with open(json_path) as file:
+                data = json.load(file)
+            return ASPA({int(afi): {int(customer_as): set(providers) for customer_as, providers in records_afi.items()}
+                         for afi, records_afi in data.items()})
+
+        loaders = [
+            ('json + dict', from_json),
+            ('dict -> compact', lambda: ASPA(records, store=CompactRecords)),
+            ('snapshot mmap', lambda: ASPA(load_snapshot(snapshot_path))),
+        ]
+        customer_as = next(iter(records[IPv4]))
+        print(f"snapshot written in {write_time * 1000:.1f}ms, {os.path.getsize(snapshot_path) / 2 ** 20:.1f}MB")
+        for name, load in loaders:
+            aspa, load_time = timed(load)
+            _, query_time = timed(aspa.verify_pair, customer_as, 3356, IPv4)
+            print(f"{name:<16} ready in {load_time * 1000:>9.2f}ms   first lookup {query_time * 1e6:>7.1f}us")
+
+
+def bench_engine(args):
+    records = synthetic_records(args.customers, args.seed)
+    routes = [(path, path[-1], IPv4, DOWNFLOW) for path in synthetic_paths(records, args.routes, args.seed)]
+
+    aspa = ASPA(records, store=CompactRecords)
+    start = time.perf_counter()
+    for path, neighbor_as, afi, _ in routes:
+        aspa.check_downflow_path([Segment(asn, AS_SEQUENCE) for asn in path], neighbor_as, afi)
+    print(f"in-process  {len(routes) / (time.perf_counter() - start):>12,.0f} routes/s")
+
+    for workers in args.workers:
+        with VerificationEngine.from_records(records, workers=workers) as engine:
+            start = time.perf_counter()
+            for _ in engine.verify(routes):
+                pass
+            print(f"{workers:>2} workers  {len(routes) / (time.perf_counter() - start):>12,.0f} routes/s")
+
+
+async def rtr_session(args):
+    records = synthetic_records(args.customers, args.seed, afis=(IPv4,))[IPv4]
+    server = RTRCacheServer(records)
+    host, port = await server.start()
+    client = RTRClient(ASPA({IPv4: {}, IPv6: {}}), host, port)
+    task = asyncio.ensure_future(client.run())
+
+    start = time.perf_counter()
+    await client.wait_serial(0)
+    print(f"reset query: {len(records)} records in {time.perf_counter() - start:.2f}s")
+    client.latencies.clear()
+
+    rng = random.Random(args.seed)
+    customers = list(records)
+    start = time.perf_counter()
+    for _ in range(args.updates):
+        server.update(added={rng.choice(customers): rng.sample(TRANSIT_ASES, 2)})
+        await client.wait_serial(server.serial)
+    elapsed = time.perf_counter() - start
+
+    summary = client.latency_summary()
+    print(f"{args.updates} serial updates in {elapsed:.2f}s, PDU arrival to visible: "
+          f"p50 {summary['p50'] * 1e6:.0f}us  p99 {summary['p99'] * 1e6:.0f}us  max {summary['max'] * 1e6:.0f}us")
+    await server.stop()
+    await task
+
+
+def bench_rtr(args):
+    asyncio.run(rtr_session(args))
+
+
+class Workload:
+    # AS_PATHs with fresh ASNs per path, built as valley-free paths whose
+    # class (valid, invalid or unknown) is drawn from mix; coverage is the
+    # share of ASPA records kept on the invalid and unknown paths only, a
+    # valid path needs all of its records, and prepend_ratio the share of
+    # ASes that are prepended one to three times
+    def __init__(self, length, prepend_ratio, coverage, kind, mix, paths, seed):
+        self.params = {'length': length, 'prepend_ratio': prepend_ratio, 'coverage': coverage,
+                       'kind': ('upflow', 'downflow')[kind], 'mix': list(mix)}
+        rng = random.Random(seed)
+        self.records = {}
+        self.paths = []
+        next_as = 1
+        for _ in range(paths):
+            path = list(range(next_as, next_as + length))
+            next_as += length
+            self.build(rng, path, kind, rng.choices(range(3), mix)[0], coverage)
+
+            aspath = []
+            for asn in path:
+                aspath += [Segment(asn, AS_SEQUENCE)] * (1 + (rng.randint(1, 3) if rng.random() < prepend_ratio else 0))
+            self.paths.append((aspath, path))
+        self.kind = kind
+
+    def build(self, rng, path, kind, path_class, coverage):
+        apex = len(path) - 1 if kind == UPFLOW else rng.randrange(len(path))
+        records = {}
+        for index, asn in enumerate(path):
+            if index < apex:
+                records[asn] = {path[index + 1]}
+            elif index > apex:
+                records[asn] = {path[index - 1]}
+
+        if path_class != 0:
+            for asn in list(records):
+                if rng.random() > coverage:
+                    del records[asn]
+        if path_class == 1 and len(path) >= 3:
+            # a leak: nP+ hops towards the same AS from both sides
+            index = rng.randrange(1, len(path) - 1)
+            records[path[index - 1]] = {path[index - 1] + 10 ** 9}
+            if kind == DOWNFLOW:
+                records[path[index + 1]] = {path[index + 1] + 10 ** 9}
+        elif path_class == 2 and records:
+            del records[rng.choice(list(records))]
+        self.records.update(records)
+
+
+def implementations(workload):
+    aspa = ASPA({IPv4: workload.records})
+    hackathon_aspa = {asn: list(providers) for asn, providers in workload.records.items()}
+    direction = ASPADirection.UPSTREAM if workload.kind == UPFLOW else ASPADirection.DOWNSTREAM
+    check = aspa.check_upflow_path if workload.kind == UPFLOW else aspa.check_downflow_path
+    # the aspa_hackathon algorithms expect prepends removed and the
+    # neighbor first, the ASPA check methods take the raw path origin first
+    return [
+        ('aspa_logic', [(aspath, aspath[-1].value, IPv4) for aspath, _ in workload.paths], check),
+        ('draft', [(hackathon_aspa, path[::-1], direction) for _, path in workload.paths], draft_algorithm),
+        ('optimized', [(hackathon_aspa, path[::-1], direction) for _, path in workload.paths], optimized_algorithm),
+        ('simple', [(hackathon_aspa, path[::-1], direction) for _, path in workload.paths], new_algorithm),
+        ('compiled', [(hackathon_aspa, path[::-1], direction) for _, path in workload.paths], compiled_algorithm),
+    ]
+
+
+def measure(function, calls, peak_samples=200):
+    # timings over all calls, the tracemalloc peak of the first peak_samples
+    timings = []
+    perf_counter_ns = time.perf_counter_ns
+    start = perf_counter_ns()
+    for args in calls:
+        call_start = perf_counter_ns()
+        function(*args)
+        timings.append(perf_counter_ns() - call_start)
+    total = perf_counter_ns() - start
+    timings.sort()
+
+    tracemalloc.start()
+    peaks = []
+    for args in calls[:peak_samples]:
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        function(*args)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+
+    return {
+        'ns_per_path': total / len(calls),
+        'p50_ns': timings[len(timings) // 2],
+        'p99_ns': timings[min(len(timings) - 1, len(timings) * 99 // 100)],
+        'peak_bytes_per_path': sum(peaks) / len(peaks),
+    }
+
+
+def workload_key(result):
+    return json.dumps([result['workload'], result['implementation']], sort_keys=True)
+
+
+def bench_suite(args):
+    mixes = [tuple(map(float, mix.split(','))) for mix in args.mixes]
+    kinds = [{'upflow': UPFLOW, 'downflow': DOWNFLOW}[kind] for kind in args.kinds]
+    results = []
+    grid = itertools.product(args.lengths, args.prepend_ratios, args.coverages, kinds, mixes)
+    for length, prepend_ratio, coverage, kind, mix in grid:
+        workload = Workload(length, prepend_ratio, coverage, kind, mix, args.paths, args.seed)
+        candidates = implementations(workload)
+        _, calls, function = candidates[0]
+        verdicts = [function(*args) for args in calls]
+        observed = {name: verdicts.count(verdict) / len(verdicts)
+                    for name, verdict in (('valid', Valid), ('invalid', Invalid), ('unknown', Unknown))}
+        for name, calls, function in candidates:
+            result = {'workload': workload.params, 'implementation': name, 'observed_mix': observed}
+            result.update(measure(function, calls))
+            results.append(result)
+            print(f"{json.dumps(workload.params):<100} {name:<10} {result['ns_per_path']:>9.0f}ns/path"
+                  f"  p99 {result['p99_ns']:>7}ns  peak {result['peak_bytes_per_path']:>7.0f}B/path")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'python': sys.version, 'seed': args.seed, 'paths': args.paths, 'results': results}, file, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = {workload_key(result): result for result in json.load(file)['results']}
+        regressions = 0
+        for result in results:
+            previous = baseline.get(workload_key(result))
+            if previous is None:
+                continue
+            ratio = result['ns_per_path'] / previous['ns_per_path']
+            if ratio > 1 + args.threshold:
+                regressions += 1
+                print(f"REGRESSION {result['implementation']:<10} {json.dumps(result['workload'])}: "
+                      f"{previous['ns_per_path']:.0f} -> {result['ns_per_path']:.0f}ns/path ({ratio:.2f}x)")
+        print(f"{regressions} regressions against {args.baseline}")
+        if regressions:
+            sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ASPA verification benchmarks")
+    parser.add_argument('--seed', type=int, default=0)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    memory = commands.add_parser('memory', help="memory of the dict, compact and hot provider record stores")
+    memory.add_argument('--customers', type=int, default=80000)
+    memory.add_argument('--lookups', type=int, default=1000000)
+    memory.set_defaults(run=bench_memory)
+
+    batch = commands.add_parser('batch', help="ASPA.verify_batch against the per-path check methods")
+    batch.add_argument('--customers', type=int, default=80000)
+    batch.add_argument('--paths', type=int, default=200000)
+    batch.set_defaults(run=bench_batch)
+
+    kernel = commands.add_parser('kernel', help="single pass check_downflow_path against the two pass checks")
+    kernel.add_argument('--customers', type=int, default=80000)
+    kernel.add_argument('--paths', type=int, default=20000)
+    kernel.add_argument('--length', type=int, default=32, help="maximum number of distinct ASes per path")
+    kernel.add_argument('--prepends', type=int, default=4, help="maximum number of times an AS is repeated")
+    kernel.add_argument('--leak-ratio', type=float, default=0.3)
+    kernel.set_defaults(run=bench_kernel)
+
+    aspath = commands.add_parser('aspath', help="run-length ASPath against lists of Segment objects")
+    aspath.add_argument('--customers', type=int, default=80000)
+    aspath.add_argument('--paths', type=int, default=200000)
+    aspath.add_argument('--length', type=int, default=16, help="maximum number of distinct ASes per path")
+    aspath.add_argument('--prepends', type=int, default=3, help="maximum number of times an AS is repeated")
+    aspath.set_defaults(run=bench_aspath)
+
+    wire = commands.add_parser('wire', help="AS_PATH attribute decoding")
+    wire.add_argument('--customers', type=int, default=80000)
+    wire.add_argument('--attributes', type=int, default=1000000)
+    wire.add_argument('--distinct', type=int, default=50000, help="number of distinct paths")
+    wire.add_argument('--length', type=int, default=8, help="maximum number of distinct ASes per path")
+    wire.add_argument('--prepend-ratio', type=float, default=0.2)
+    wire.set_defaults(run=bench_wire)
+
+    rib = commands.add_parser('rib', help="incremental RIB revalidation against full revalidation")
+    rib.add_argument('--customers', type=int, default=80000)
+    rib.add_argument('--routes', type=int, default=500000)
+    rib.add_argument('--updates', type=int, default=1000)
+    rib.set_defaults(run=bench_rib)
+
+    metrics = commands.add_parser('metrics', help="overhead of the verification instrumentation")
+    metrics.add_argument('--customers', type=int, default=80000)
+    metrics.add_argument('--paths', type=int, default=200000)
+    metrics.set_defaults(run=bench_metrics)
+
+    routeserver = commands.add_parser('routeserver', help="route server stage against per-session checks")
+    routeserver.add_argument('--customers', type=int, default=80000)
+    routeserver.add_argument('--paths', type=int, default=20000)
+    routeserver.add_argument('--sessions', type=int, default=200)
+    routeserver.set_defaults(run=bench_routeserver)
+
+    intern = commands.add_parser('intern', help="interned route table against per-route Segment lists")
+    intern.add_argument('--customers', type=int, default=80000)
+    intern.add_argument('--routes', type=int, default=1000000)
+    intern.add_argument('--paths', type=int, default=100000)
+    intern.set_defaults(run=bench_intern)
+
+    diff = commands.add_parser('diff', help="impact analysis of a new data set against verifying all routes twice")
+    diff.add_argument('--customers', type=int, default=80000)
+    diff.add_argument('--routes', type=int, default=1000000)
+    diff.add_argument('--changes', type=int, default=1000, help="changed records per AFI")
+    diff.set_defaults(run=bench_diff)
+
+    rcu = commands.add_parser('rcu', help="read-copy-update table against a locked dict under concurrent updates")
+    rcu.add_argument('--customers', type=int, default=80000)
+    rcu.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    rcu.add_argument('--duration', type=float, default=2.0)
+    rcu.add_argument('--updates-per-second', type=int, default=1000)
+    rcu.set_defaults(run=bench_rcu)
+
+    daemon = commands.add_parser('daemon', help="latency and throughput of the verification daemon")
+    daemon.add_argument('--customers', type=int, default=80000)
+    daemon.add_argument('--paths', type=int, default=200000)
+    daemon.add_argument('--requests', type=int, default=2000, help="requests sent one at a time for the latency")
+    daemon.add_argument('--windows', type=int, nargs='+', default=[1, 16, 256, 4096])
+    daemon.set_defaults(run=bench_daemon)
+
+    cli = commands.add_parser('cli', help="startup time and throughput of aspa_verify.py")
+    cli.add_argument('--customers', type=int, default=80000)
+    cli.add_argument('--routes', type=int, default=1000000)
+    cli.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count()])
+    cli.set_defaults(run=bench_cli)
+
+    backends = commands.add_parser('backends', help="import time and calibration of the verification backends")
+    backends.add_argument('--customers', type=int, default=80000)
+    backends.add_argument('--routes', type=int, default=3000, help="paths of the calibration sample")
+    backends.add_argument('--repeat', type=int, default=3)
+    backends.set_defaults(run=bench_backends)
+
+    der = commands.add_parser('der', help="decoding a directory of .asa objects")
+    der.add_argument('--objects', type=int, default=50000)
+    der.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count()])
+    der.set_defaults(run=bench_der)
+
+    snapshot = commands.add_parser('snapshot', help="startup time of the mmap snapshot against rebuilding")
+    snapshot.add_argument('--customers', type=int, default=80000)
+    snapshot.set_defaults(run=bench_snapshot)
+
+    engine = commands.add_parser('engine', help="multi-process verification engine scaling")
+    engine.add_argument('--customers', type=int, default=80000)
+    engine.add_argument('--routes', type=int, default=1000000)
+    engine.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    engine.set_defaults(run=bench_engine)
+
+    rtr = commands.add_parser('rtr', help="RTR client synchronization and update latency")
+    rtr.add_argument('--customers', type=int, default=80000)
+    rtr.add_argument('--updates', type=int, default=1000)
+    rtr.set_defaults(run=bench_rtr)
+
+    suite = commands.add_parser('suite', help="aspa_logic against the aspa_hackathon algorithms")
+    suite.add_argument('--paths', type=int, default=2000)
+    suite.add_argument('--lengths', type=int, nargs='+', default=[2, 4, 8, 16])
+    suite.add_argument('--prepend-ratios', type=float, nargs='+', default=[0.0, 0.3])
+    suite.add_argument('--coverages', type=float, nargs='+', default=[1.0, 0.5],
+                       help="share of the ASPA records kept on invalid and unknown paths, valid paths keep all")
+    suite.add_argument('--kinds', nargs='+', choices=['upflow', 'downflow'], default=['upflow', 'downflow'])
+    suite.add_argument('--mixes', nargs='+', default=['1,0,0', '0.6,0.2,0.2'],
+                       help="valid,invalid,unknown shares of the generated paths")
+    suite.add_argument('--output', help="write the results as JSON")
+    suite.add_argument('--baseline', help="JSON results to compare against")
+    suite.add_argument('--threshold', type=float, default=0.1, help="allowed slowdown against the baseline")
+    suite.set_defaults(run=bench_suite)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
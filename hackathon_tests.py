@@ -18,12 +18,13 @@
 #                                          +++++++
 
 from enum import Enum
-from structs import ASPADirection, ASPAVerificationResult, Hop
+from aspa_hackathon.structs import ASPADirection, ASPAVerificationResult, Hop
 
 
-from simple import new_algorithm
-from draft import draft_algorithm
-from optimized import optimized_algorithm
+from aspa_hackathon.simple import new_algorithm
+from aspa_hackathon.draft import draft_algorithm
+from aspa_hackathon.optimized import optimized_algorithm
+from aspa_hackathon.compiled import compiled_algorithm
 
 
 # Test
@@ -35,8 +36,10 @@ def testASPACase(case):
     draft_res = draft_algorithm(case["aspa"], case["path"], case["direction"])
     optimized_res = optimized_algorithm(case["aspa"], case["path"], case["direction"])
     simple_res = new_algorithm(case["aspa"], case["path"], case["direction"])
+    compiled_res = compiled_algorithm(case["aspa"], case["path"], case["direction"])
 
-    if simple_res != optimized_res or simple_res != draft_res or optimized_res != case["expect"]:
+    if simple_res != optimized_res or simple_res != draft_res or optimized_res != case["expect"] \
+            or compiled_res != draft_res:
         print(case["label"])
 
     print(
@@ -47,6 +50,8 @@ def testASPACase(case):
         optimized_res.name,
         "SIMPLE:",
         simple_res.name,
+        "COMPILED:",
+        compiled_res.name,
         "EXPECTED:",
         case["expect"].name,
     )
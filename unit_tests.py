@@ -1,5 +1,43 @@
+import asyncio
+import contextlib
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
+from unittest import mock
 from aspa_logic import *
+from aspa_backends import BACKENDS, NoBackend, UnsupportedRoute, create_backend, register, select_backend
+from aspa_cache import VerdictCache
+from aspa_daemon import ERROR, DaemonError, VerificationClient, VerificationServer, request_header, response
+from aspa_der import encode_signed_object, load_directory
+from aspa_diff import changed_customers, diff_records, impact, impact_routes
+import aspa_engine
+from aspa_engine import VerificationEngine
+from aspa_intern import RouteTable
+from aspa_metrics import VERDICT_NAMES, Metrics
+from aspa_mrt import MRTError, MRTReader
+from aspa_rcu import SHARD_MASK, RCUTable
+from aspa_rib import RIB
+from aspa_routeserver import RouteServer
+from aspa_rtr import RTRCacheServer, RTRClient
+from aspa_snapshot import SnapshotError, SnapshotRecords, load_snapshot, snapshot_entry, snapshot_header, write_snapshot
+from aspa_wire import WireError, encode_as_path, parse_as_path, parse_attributes
+from aspa_verify import main as verify_main
+from aspa_topology import PathsError, Topology, iter_routes, read_paths, read_records, to_segments, write_paths, write_records
+from aspa_store import CompactRecords, HotProviderRecords
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 # just an example for the tests
@@ -22,6 +60,13 @@ aspa_records = {
 
 aspa_manager = ASPA(aspa_records)
 
+
+def copy_records():
+    # the example records for tests that apply deltas to them
+    return {afi: {customer_as: set(providers) for customer_as, providers in records_afi.items()}
+            for afi, records_afi in aspa_records.items()}
+
+
 class ASPATests(unittest.TestCase):
     def __init__(self, *args, **kwargs):
         super(ASPATests, self).__init__(*args, **kwargs)
@@ -292,6 +337,1225 @@ class ASPATests(unittest.TestCase):
         with self.subTest():
             self.assertEqual(aspa_manager.check_ix_path(aspath, 6695, IPv4), Unknown)
 
+
+class StoreManager:
+    # runs the ASPATests, which use the module level aspa_manager, against
+    # the aspa_manager of the test class
+    def setUp(self):
+        global aspa_manager
+        self.dict_manager, aspa_manager = aspa_manager, self.aspa_manager
+
+    def tearDown(self):
+        global aspa_manager
+        aspa_manager = self.dict_manager
+
+    def test_verify_pair_matches_dict(self):
+        ases = {0, 1, 2, 20485} | set(aspa_records[IPv4])
+        for providers in aspa_records[IPv4].values():
+            ases |= providers
+
+        for afi in (IPv4, IPv6, 0):
+            for as1 in ases:
+                for as2 in ases:
+                    with self.subTest(afi=afi, as1=as1, as2=as2):
+                        self.assertEqual(self.aspa_manager.verify_pair(as1, as2, afi),
+                                         self.dict_manager.verify_pair(as1, as2, afi))
+
+
+class CompactStoreTests(StoreManager, ASPATests):
+    aspa_manager = ASPA(aspa_records, store=CompactRecords)
+
+    def test_round_trip(self):
+        self.assertEqual(CompactRecords(aspa_records).to_dict(), aspa_records)
+
+
+class FewHotProviderRecords(HotProviderRecords):
+    # most providers of the example records end up in the long tail
+    hot_size = 4
+
+
+class HotProviderStoreTests(StoreManager, ASPATests):
+    aspa_manager = ASPA(aspa_records, store=FewHotProviderRecords)
+
+    def test_layout(self):
+        table = self.aspa_manager.aspa_records.tables[IPv4]
+        self.assertEqual(len(table.hot), 4)
+        # listed by three and two customers, the other providers by one
+        self.assertLessEqual({0, 3356, 1299}, set(table.hot))
+        self.assertNotIn(3356, table.tail[13238])
+        self.assertNotIn(2914, table.tail)
+
+    def test_round_trip(self):
+        self.assertEqual(FewHotProviderRecords(aspa_records).to_dict(), aspa_records)
+        self.assertEqual(HotProviderRecords(aspa_records).to_dict(), aspa_records)
+
+
+class SnapshotStoreTests(StoreManager, ASPATests):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.directory.name, 'aspa.snap')
+        write_snapshot(cls.path, aspa_records, serial=42)
+        cls.aspa_manager = ASPA(load_snapshot(cls.path))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.aspa_manager.aspa_records.close()
+        cls.directory.cleanup()
+
+    def test_snapshot_contents(self):
+        records = self.aspa_manager.aspa_records
+        self.assertEqual(records.serial, 42)
+        self.assertEqual(records.to_dict(), aspa_records)
+        self.assertIsInstance(records.tables[IPv4].providers, memoryview)
+
+    def test_compact_records_round_trip(self):
+        path = os.path.join(self.directory.name, 'compact.snap')
+        write_snapshot(path, CompactRecords(aspa_records))
+        records = load_snapshot(path)
+        self.assertEqual(records.to_dict(), aspa_records)
+        records.close()
+
+    def test_store_round_trip(self):
+        hot_path = os.path.join(self.directory.name, 'hot.snap')
+        write_snapshot(hot_path, FewHotProviderRecords(aspa_records))
+        records = load_snapshot(hot_path)
+        self.assertEqual(records.to_dict(), aspa_records)
+
+        # a mapped snapshot is written again as it is
+        copy_path = os.path.join(self.directory.name, 'copy.snap')
+        write_snapshot(copy_path, records, serial=43)
+        records.close()
+        copy = load_snapshot(copy_path)
+        self.assertEqual((copy.serial, copy.to_dict()), (43, aspa_records))
+        copy.close()
+
+    def test_invalid_snapshot(self):
+        path = os.path.join(self.directory.name, 'invalid.snap')
+        with open(self.path, 'rb') as file:
+            data = file.read()
+        for invalid in (b'', b'NOTASNAP' + data[8:], data[:8] + b'\x09' + data[9:], data[:-8]):
+            with open(path, 'wb') as file:
+                file.write(invalid)
+            with self.subTest(invalid=invalid[:12]):
+                self.assertRaises(SnapshotError, load_snapshot, path)
+
+    def test_invalid_offsets(self):
+        path = os.path.join(self.directory.name, 'offsets.snap')
+        with open(self.path, 'rb') as file:
+            data = bytearray(file.read())
+        _, customer_count, provider_count, _, _, offsets, _ = snapshot_entry.unpack_from(data, snapshot_header.size)
+        for position, value in ((offsets, 1), (offsets + customer_count * 4, provider_count + 1)):
+            invalid = bytearray(data)
+            struct.pack_into('<I', invalid, position, value)
+            with open(path, 'wb') as file:
+                file.write(invalid)
+            with self.subTest(position=position):
+                self.assertRaises(SnapshotError, load_snapshot, path)
+
+    def test_failed_write(self):
+        path = os.path.join(self.directory.name, 'failed.snap')
+        with mock.patch('aspa_snapshot.os.replace', side_effect=OSError(28, "No space left on device")):
+            with self.assertRaises(OSError):
+                write_snapshot(path, aspa_records)
+        self.assertEqual([name for name in os.listdir(self.directory.name) if name.startswith('failed')], [])
+
+
+class DeltaTests(unittest.TestCase):
+    store = None
+
+    def setUp(self):
+        self.aspa = ASPA(copy_records(), store=self.store)
+
+    def test_add_replace_withdraw(self):
+        aspath = [Segment(43247, AS_SEQUENCE), Segment(13238, AS_SEQUENCE), Segment(3356, AS_SEQUENCE)]
+        self.assertEqual(self.aspa.check_upflow_path(aspath, 3356, IPv4), Valid)
+
+        changed = self.aspa.apply_delta(added={IPv4: {13238: [174]}})
+        self.assertEqual(changed, {IPv4: {13238}})
+        self.assertEqual(self.aspa.serial, 1)
+        self.assertEqual(self.aspa.check_upflow_path(aspath, 3356, IPv4), Invalid)
+
+        changed = self.aspa.apply_delta(withdrawn={IPv4: [13238, 5]})
+        self.assertEqual(changed, {IPv4: {13238}})
+        self.assertEqual(self.aspa.check_upflow_path(aspath, 3356, IPv4), Unknown)
+
+        changed = self.aspa.apply_delta(added={IPv6: {13238: [3356]}, IPv4: {13238: [3356], 1: [2]}})
+        self.assertEqual(changed, {IPv4: {13238, 1}, IPv6: {13238}})
+        self.assertEqual(self.aspa.check_upflow_path(aspath, 3356, IPv4), Valid)
+        self.assertEqual(self.aspa.verify_pair(13238, 3356, IPv6), Valid)
+        self.assertEqual(self.aspa.serial, 3)
+
+    def test_unchanged_records_are_not_reported(self):
+        changed = self.aspa.apply_delta(added={IPv4: {43247: [13238]}}, withdrawn={IPv4: [5], 0: [1]})
+        self.assertEqual(changed, {})
+        self.assertEqual(self.aspa.serial, 1)
+
+    def test_replace_wins_over_withdraw(self):
+        changed = self.aspa.apply_delta(added={IPv4: {43247: [13238]}}, withdrawn={IPv4: [43247]})
+        self.assertEqual(changed, {})
+        self.assertEqual(self.aspa.verify_pair(43247, 13238, IPv4), Valid)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_batch_tables_are_refreshed(self):
+        paths, neighbors = [[43247, 13238]], [13238]
+        self.assertEqual(self.aspa.verify_batch(paths, neighbors, IPv4, UPFLOW).tolist(), [Valid])
+        self.aspa.apply_delta(added={IPv4: {43247: [3356]}})
+        self.assertEqual(self.aspa.verify_batch(paths, neighbors, IPv4, UPFLOW).tolist(), [Invalid])
+
+
+class CompactDeltaTests(DeltaTests):
+    store = CompactRecords
+
+    def test_compaction(self):
+        records = self.aspa.aspa_records
+        self.aspa.apply_delta(added={IPv4: {customer_as: [1] for customer_as in range(100, 2000)}},
+                              withdrawn={IPv4: [3356]})
+        self.assertEqual(records.tables[IPv4].changes, {})
+        self.assertEqual(self.aspa.verify_pair(150, 1, IPv4), Valid)
+        self.assertEqual(self.aspa.verify_pair(3356, 6695, IPv4), Unknown)
+        self.assertEqual(self.aspa.verify_pair(13238, 3356, IPv4), Valid)
+
+
+class HotProviderDeltaTests(DeltaTests):
+    store = FewHotProviderRecords
+
+    def test_rebalance(self):
+        records = self.aspa.aspa_records
+        self.aspa.apply_delta(added={IPv4: {customer_as: [64500] for customer_as in range(100, 200)}})
+        self.assertNotIn(64500, records.tables[IPv4].hot)
+        self.assertEqual(self.aspa.verify_pair(150, 64500, IPv4), Valid)
+        records.rebalance()
+        self.assertIn(64500, records.tables[IPv4].hot)
+        self.assertEqual(self.aspa.verify_pair(150, 64500, IPv4), Valid)
+        self.assertEqual(self.aspa.verify_pair(13238, 3356, IPv4), Valid)
+        self.assertEqual(self.aspa.verify_pair(13238, 64500, IPv4), Invalid)
+
+
+class RCUTableTests(unittest.TestCase):
+    def setUp(self):
+        self.table = RCUTable(aspa_records)
+
+    def test_versions(self):
+        old_aspa = self.table.current
+        aspath = [Segment(43247, AS_SEQUENCE), Segment(13238, AS_SEQUENCE), Segment(3356, AS_SEQUENCE)]
+        self.assertEqual(self.table.apply_delta(added={IPv4: {13238: [174]}}), {IPv4: {13238}})
+        self.assertEqual(self.table.apply_delta(added={IPv4: {43247: [13238]}}, withdrawn={IPv4: [5]}), {})
+        self.assertEqual(self.table.current.serial, 1)
+
+        # readers holding the old version keep seeing it unchanged
+        self.assertEqual(old_aspa.check_upflow_path(aspath, 3356, IPv4), Valid)
+        self.assertEqual(self.table.current.check_upflow_path(aspath, 3356, IPv4), Invalid)
+        self.assertEqual(old_aspa.aspa_records.to_dict(), aspa_records)
+        self.assertRaises(TypeError, old_aspa.apply_delta, {IPv4: {13238: [3356]}})
+
+        self.table.apply_delta(added={IPv6: {13238: [3356]}}, withdrawn={IPv4: [13238, 5]})
+        self.assertEqual(self.table.current.check_upflow_path(aspath, 3356, IPv4), Unknown)
+        self.assertEqual(self.table.current.verify_pair(13238, 3356, IPv6), Valid)
+
+    def test_structural_sharing(self):
+        old_shards = self.table.current.aspa_records.shards
+        self.table.apply_delta(added={IPv4: {13238: [174]}})
+        new_shards = self.table.current.aspa_records.shards
+        self.assertIs(new_shards[IPv6], old_shards[IPv6])
+        copied = [index for index in range(SHARD_MASK + 1) if new_shards[IPv4][index] is not old_shards[IPv4][index]]
+        self.assertEqual(copied, [13238 & SHARD_MASK])
+
+    def test_reclamation(self):
+        reader = self.table.current
+        self.table.apply_delta(added={IPv4: {13238: [174]}})
+        self.table.apply_delta(added={IPv4: {13238: [1299]}})
+        self.assertEqual(self.table.live_versions(), [0, 2])
+        del reader
+        self.assertEqual(self.table.live_versions(), [2])
+
+    def test_concurrent_readers(self):
+        # every version lists the same provider for 43247 in both AFIs
+        table = RCUTable({IPv4: {43247: {1}}, IPv6: {43247: {1}}})
+        torn = []
+        done = threading.Event()
+
+        def read():
+            while not done.is_set():
+                aspa = table.current
+                if aspa.verify_pair(43247, 1, IPv4) != aspa.verify_pair(43247, 1, IPv6):
+                    torn.append(aspa.serial)
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for update in range(2000):
+            provider = update % 2 + 2
+            table.apply_delta(added={IPv4: {43247: [provider]}, IPv6: {43247: [provider]}})
+        done.set()
+        for reader in readers:
+            reader.join()
+        self.assertEqual(torn, [])
+        self.assertEqual(table.current.serial, 2000)
+
+
+class VerdictCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.aspa = ASPA(copy_records())
+        self.cache = VerdictCache(self.aspa, maxsize=3)
+
+    def test_hits_and_misses(self):
+        aspath = [Segment(43247, AS_SEQUENCE), Segment(13238, AS_SEQUENCE), Segment(3356, AS_SEQUENCE)]
+        for _ in range(3):
+            self.assertEqual(self.cache.check_downflow_path(aspath, 3356, IPv4), Valid)
+        self.assertEqual(self.cache.check_upflow_path(aspath, 3356, IPv4), Valid)
+        self.assertEqual(self.cache.check_upflow_path(aspath, 174, IPv4), Invalid)
+        self.assertEqual(self.cache.check_ix_path(aspath, 174, IPv4), Valid)
+        self.assertEqual(self.cache.check_ix_path(aspath, 6695, IPv4), Valid)
+
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (3, 4, 1))
+        self.assertEqual(len(self.cache), 3)
+
+    def test_invalidation_is_per_asn(self):
+        upstream = [Segment(43247, AS_SEQUENCE), Segment(13238, AS_SEQUENCE), Segment(3356, AS_SEQUENCE)]
+        other = [Segment(8342, AS_SEQUENCE), Segment(12389, AS_SEQUENCE)]
+        self.assertEqual(self.cache.check_upflow_path(upstream, 3356, IPv4), Valid)
+        self.assertEqual(self.cache.check_upflow_path(other, 12389, IPv4), Valid)
+
+        self.cache.apply_delta(added={IPv4: {13238: [174]}})
+        self.assertEqual(self.cache.stats()['invalidations'], 1)
+        self.assertEqual(self.cache.check_upflow_path(upstream, 3356, IPv4), Invalid)
+        self.assertEqual(self.cache.check_upflow_path(other, 12389, IPv4), Valid)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+        # a change in another AFI keeps the IPv4 verdicts
+        self.cache.apply_delta(added={IPv6: {13238: [3356]}})
+        self.assertEqual(self.cache.stats()['invalidations'], 1)
+
+    def test_matches_uncached(self):
+        cache = VerdictCache(self.aspa, maxsize=50)
+        paths = list(random_paths(300)) * 2
+        for aspath, neighbor_as in paths:
+            with self.subTest(aspath=[(segment.value, segment.type) for segment in aspath]):
+                self.assertEqual(cache.check_downflow_path(aspath, neighbor_as, IPv4),
+                                 self.aspa.check_downflow_path(aspath, neighbor_as, IPv4))
+                self.assertEqual(cache.check_ix_path(aspath, neighbor_as, IPv4),
+                                 self.aspa.check_ix_path(aspath, neighbor_as, IPv4))
+        self.assertLessEqual(len(cache), 50)
+        self.assertEqual(sum(map(len, cache.dependents.values())),
+                         sum(len(dependencies) for _, dependencies in cache.entries.values()))
+
+
+class RouteServerTests(unittest.TestCase):
+    def test_matches_per_session_checks(self):
+        aspa = ASPA(aspa_records)
+        checks = {UPFLOW: aspa.check_upflow_path, DOWNFLOW: aspa.check_downflow_path, IX: aspa.check_ix_path}
+        server = RouteServer(aspa)
+        paths = list(random_paths(200, seed=4))
+        neighbors = [0, 1, 3356, 13238, 43247, 174]
+        for kind in (UPFLOW, DOWNFLOW, IX):
+            for aspath, neighbor_as in paths:
+                sessions = neighbors + [neighbor_as]
+                expected = [checks[kind](aspath, session_as, IPv4) for session_as in sessions]
+                with self.subTest(kind=kind):
+                    self.assertEqual(server.verify_sessions(aspath, IPv4, kind, sessions), expected)
+                    self.assertEqual(list(server.verify_routes((aspath, session_as, IPv4, kind)
+                                                               for session_as in sessions)), expected)
+
+        stats = server.stats()
+        self.assertEqual(stats['sessions'], 3 * 2 * len(paths) * (len(neighbors) + 1))
+        self.assertLessEqual(stats['path_verifications'], 3 * len(paths))
+        self.assertEqual(stats['saved_verifications'], stats['path_sessions'] - stats['path_verifications'])
+        self.assertGreater(stats['saved_ratio'], 0.85)
+
+    def test_invalidation(self):
+        server = RouteServer(ASPA(copy_records()))
+        aspath = ASPath.from_list([43247, 13238, 13238, 3356])
+        self.assertEqual(server.verify_sessions(aspath, IPv4, UPFLOW, [3356, 174]), [Valid, Invalid])
+        server.apply_delta(added={IPv4: {13238: [174]}})
+        self.assertEqual(server.verify_sessions(aspath, IPv4, UPFLOW, [3356]), [Invalid])
+        self.assertEqual((server.cache.misses, server.cache.invalidations), (2, 1))
+
+    def test_saved_verifications(self):
+        server = RouteServer(ASPA(aspa_records))
+        aspath = ASPath.from_list([43247, 13238, 3356])
+        self.assertEqual(server.verify_sessions(aspath, IPv4, UPFLOW, [3356, 174, 174]), [Valid, Invalid, Invalid])
+        # neither empty paths nor neighbor mismatches run the kernel
+        self.assertEqual(server.verify_sessions(aspath, IPv6, UPFLOW, [174]), [Invalid])
+        self.assertEqual(list(server.verify_routes([(aspath, 3356, IPv4, UPFLOW), (aspath, 3356, IPv4, UPFLOW),
+                                                    ([], 3356, IPv4, UPFLOW), (aspath, 174, IPv4, UPFLOW)])),
+                         [Valid, Valid, Invalid, Invalid])
+        stats = server.stats()
+        self.assertEqual((stats['sessions'], stats['neighbor_mismatches'], stats['path_sessions']), (8, 4, 3))
+        self.assertEqual((stats['path_verifications'], stats['saved_verifications']), (1, 2))
+        self.assertAlmostEqual(stats['saved_ratio'], 2 / 3)
+
+
+class RouteTableTests(unittest.TestCase):
+    def test_matches_per_route_checks(self):
+        aspa = ASPA(aspa_records)
+        table = RouteTable()
+        paths = list(random_paths(100, seed=5))
+        routes = [(aspath, neighbor_as, IPv4, kind) for kind in (UPFLOW, DOWNFLOW, IX)
+                  for aspath, neighbor_as in paths * 4]
+        table.extend(routes)
+        expected = [aspa.check_path(*route)[0] for route in routes]
+        self.assertEqual(list(table.verify(aspa)), expected)
+
+        stats = table.stats()
+        self.assertEqual((stats['routes'], stats['verified_routes']), (len(routes), len(routes)))
+        self.assertLessEqual(stats['unique_paths'], len(paths))
+        self.assertLessEqual(stats['verifications'], 3 * len(paths))
+        self.assertGreaterEqual(stats['saved_ratio'], 0.75)
+
+    def test_interning(self):
+        table = RouteTable()
+        first = table.add(ASPath.from_list([43247, 13238, 3356]), 3356, IPv4, UPFLOW)
+        second = table.add([Segment(43247, AS_SEQUENCE), Segment(13238, AS_SEQUENCE), Segment(3356, AS_SEQUENCE)],
+                           3356, IPv6, DOWNFLOW)
+        # prepending makes a distinct path
+        table.add(ASPath.from_list([43247, 13238, 13238, 3356]), 3356, IPv4, UPFLOW)
+        self.assertEqual(list(table.path_ids), [0, 0, 1])
+        self.assertEqual(len(table.interner), 2)
+        self.assertEqual(table[second], (ASPath.from_list([43247, 13238, 3356]), 3356, IPv6, DOWNFLOW))
+        self.assertIs(table[first][0], table[second][0])
+
+
+class RIBTests(unittest.TestCase):
+    def setUp(self):
+        self.aspa = ASPA(copy_records())
+        self.events = []
+        self.rib = RIB(self.aspa, on_transition=lambda *transition: self.events.append(transition))
+
+    def test_transitions(self):
+        aspath = [Segment(43247, AS_SEQUENCE), Segment(13238, AS_SEQUENCE), Segment(3356, AS_SEQUENCE)]
+        self.assertEqual(self.rib.add('a', aspath, 3356, IPv4, UPFLOW), Valid)
+        self.assertEqual(self.rib.add('b', ASPath.from_list([8342, 12389]), 12389, IPv4, UPFLOW), Valid)
+
+        transitions = self.rib.apply_delta(added={IPv4: {13238: [174]}})
+        self.assertEqual(transitions, [('a', Valid, Invalid)])
+        self.assertEqual(self.events, transitions)
+        self.assertEqual(self.rib.revalidated, 1)
+        self.assertEqual(self.rib.verdict('a'), Invalid)
+
+        # changes of records no stored path contains revalidate nothing
+        self.assertEqual(self.rib.apply_delta(added={IPv4: {65000: [174]}}), [])
+        self.assertEqual(self.rib.revalidated, 1)
+
+        self.assertEqual(self.rib.remove('a'), Invalid)
+        self.assertEqual(self.rib.apply_delta(withdrawn={IPv4: [13238]}), [])
+        self.assertNotIn((IPv4, 13238), self.rib.index)
+
+    def test_matches_full_revalidation(self):
+        paths = list(random_paths(500, seed=3))
+        for index, (aspath, neighbor_as) in enumerate(paths):
+            self.rib.add(index, aspath, neighbor_as, IPv4, index % 3)
+
+        rng = random.Random(3)
+        customers = list(aspa_records[IPv4])
+        for _ in range(20):
+            customer_as = rng.choice(customers)
+            before = {index: self.rib.verdict(index) for index in range(len(paths))}
+            transitions = self.rib.apply_delta(added={IPv4: {customer_as: rng.sample([174, 1299, 3356, 13238], 2)}})
+            expected = []
+            for index, (aspath, neighbor_as) in enumerate(paths):
+                verdict = self.aspa.check_path(aspath, neighbor_as, IPv4, index % 3)[0]
+                if verdict != before[index]:
+                    expected.append((index, before[index], verdict))
+            self.assertEqual(sorted(transitions), expected)
+
+
+class DiffTests(unittest.TestCase):
+    new_records = {
+        IPv4: {**aspa_records[IPv4], 13238: {174}, 65000: {174}},
+        IPv6: {43247: {13238}},
+    }
+
+    def test_diff_records(self):
+        old_records = {IPv4: {customer_as: providers for customer_as, providers in aspa_records[IPv4].items()
+                              if customer_as != 8342}}
+        added, withdrawn = diff_records(old_records, CompactRecords(self.new_records))
+        self.assertEqual(added, {IPv4: {13238: {174}, 65000: {174}, 8342: {12389, 8359}}, IPv6: {43247: {13238}}})
+        self.assertEqual(withdrawn, {})
+        added, withdrawn = diff_records(self.new_records, aspa_records)
+        self.assertEqual(added, {IPv4: {13238: aspa_records[IPv4][13238]}})
+        self.assertEqual(withdrawn, {IPv4: [65000], IPv6: [43247]})
+        self.assertEqual(changed_customers(added, withdrawn), {IPv4: {13238, 65000}, IPv6: {43247}})
+        self.assertEqual(diff_records(aspa_records, CompactRecords(aspa_records)), ({}, {}))
+
+    def test_matches_verifying_all_routes(self):
+        old_aspa, new_aspa = ASPA(aspa_records), ASPA(self.new_records)
+        changed = changed_customers(*diff_records(aspa_records, self.new_records))
+        routes = [(index, aspath, neighbor_as, afi, kind)
+                  for index, (aspath, neighbor_as) in enumerate(random_paths(300, seed=6))
+                  for afi, kind in ((IPv4, UPFLOW), (IPv6, DOWNFLOW))]
+        expected = []
+        for key, aspath, neighbor_as, afi, kind in routes:
+            old_verdict = old_aspa.check_path(aspath, neighbor_as, afi, kind)[0]
+            new_verdict = new_aspa.check_path(aspath, neighbor_as, afi, kind)[0]
+            if old_verdict != new_verdict:
+                expected.append((key, old_verdict, new_verdict))
+        self.assertTrue(expected)
+
+        report = impact_routes(routes, old_aspa, new_aspa, changed)
+        self.assertEqual(report.transitions, expected)
+        self.assertEqual(report.routes, len(routes))
+        self.assertLess(report.affected, len(routes))
+
+        rib = RIB(old_aspa)
+        for key, aspath, neighbor_as, afi, kind in routes:
+            rib.add((key, afi), aspath, neighbor_as, afi, kind)
+        report = impact(rib, new_aspa, changed)
+        self.assertEqual(sorted((key, old, new) for (key, _), old, new in report.transitions), expected)
+        summary = report.summary()
+        self.assertEqual(summary['transitions'], len(expected))
+        self.assertEqual(sum(summary['flips'].values()), len(expected))
+        # the RIB keeps the verdicts of the deployed data set
+        for key, old_verdict, _ in report.transitions:
+            self.assertEqual(rib.verdict(key), old_verdict)
+
+
+class MetricsTests(unittest.TestCase):
+    def test_counters(self):
+        aspa = ASPA(aspa_records)
+        metrics = Metrics(aspa)
+        metrics.enable()
+        aspath = [Segment(43247, AS_SEQUENCE), Segment(13238, AS_SEQUENCE), Segment(3356, AS_SEQUENCE)]
+        self.assertEqual(aspa.check_upflow_path(aspath, 3356, IPv4), Valid)
+        leak = [Segment(43247, AS_SEQUENCE), Segment(2914, AS_SEQUENCE), Segment(3356, AS_SEQUENCE)]
+        self.assertEqual(aspa.check_downflow_path(leak, 3356, IPv4), Invalid)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual((snapshot['paths'], snapshot['pair_lookups']), (2, 4))
+        self.assertEqual(snapshot['verdicts']['upflow']['valid'], 1)
+        self.assertEqual(snapshot['verdicts']['downflow']['invalid'], 1)
+        self.assertEqual(snapshot['path_length']['sum'], 6)
+        self.assertEqual((snapshot['exit_position']['count'], snapshot['exit_position']['sum']), (1, 1))
+        self.assertEqual(snapshot['latency_ns']['count'], 2)
+
+        metrics.disable()
+        self.assertNotIn('verify_pair', vars(aspa))
+        self.assertNotIn('check_path', vars(aspa))
+        aspa.check_upflow_path(aspath, 3356, IPv4)
+        self.assertEqual(metrics.paths, 2)
+
+    def test_path_length(self):
+        # the hops of a route, whether it is a Segment list or an ASPath
+        aspa = ASPA(aspa_records)
+        metrics = Metrics(aspa)
+        metrics.enable()
+        hops = [43247, 43247, 13238, 3356]
+        aspa.check_upflow_path([Segment(asn, AS_SEQUENCE) for asn in hops], 3356, IPv4)
+        aspa.check_upflow_path(ASPath.from_list(hops), 3356, IPv4)
+        snapshot = metrics.snapshot()['path_length']
+        self.assertEqual((snapshot['count'], snapshot['sum']), (2, 8))
+        self.assertEqual(max(snapshot['counts']), 2)
+
+    def test_store_and_prometheus(self):
+        aspa = ASPA(aspa_records, store=CompactRecords)
+        store_verify_pair = aspa.verify_pair
+        metrics = Metrics(aspa)
+        metrics.enable()
+        for aspath, neighbor_as in random_paths(100):
+            aspa.check_ix_path(aspath, neighbor_as, IPv4)
+        metrics.disable()
+        self.assertEqual(aspa.verify_pair, store_verify_pair)
+
+        fd, path = tempfile.mkstemp(suffix='.prom')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        metrics.write_prometheus(path)
+        with open(path) as file:
+            lines = file.read().splitlines()
+        self.assertIn(f'aspa_pair_lookups_total {metrics.pair_lookups}', lines)
+        self.assertIn('aspa_verification_seconds_count 100', lines)
+        self.assertIn('aspa_path_length_bucket{le="+Inf"} 100', lines)
+        self.assertEqual(sum(int(line.split()[-1]) for line in lines if line.startswith('aspa_verdicts_total')), 100)
+
+
+class RTRClientTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = RTRCacheServer({13238: [3356, 174], 43247: [13238]})
+        host, port = await self.server.start()
+        self.aspa = ASPA({IPv4: {}, IPv6: {}})
+        self.changes = []
+        self.client = RTRClient(self.aspa, host, port, on_update=self.changes.append)
+        self.task = asyncio.ensure_future(self.client.run())
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+        await asyncio.wait_for(self.task, 5)
+
+    async def wait_serial(self, serial):
+        await asyncio.wait_for(self.client.wait_serial(serial), 5)
+
+    async def test_reset_and_serial_query(self):
+        await self.wait_serial(0)
+        aspath = [Segment(43247, AS_SEQUENCE), Segment(13238, AS_SEQUENCE), Segment(3356, AS_SEQUENCE)]
+        self.assertEqual(self.aspa.check_upflow_path(aspath, 3356, IPv4), Valid)
+        self.assertEqual(self.aspa.check_upflow_path(aspath, 3356, IPv6), Valid)
+
+        self.server.update(added={13238: [174]}, withdrawn=[43247])
+        await self.wait_serial(1)
+        self.assertEqual(self.changes[-1], {IPv4: {13238, 43247}, IPv6: {13238, 43247}})
+        self.assertEqual(self.aspa.check_upflow_path(aspath, 3356, IPv4), Invalid)
+        self.assertEqual(self.aspa.verify_pair(43247, 13238, IPv4), Unknown)
+        self.assertEqual(self.client.latency_summary()['count'], 4)
+
+    async def test_cache_reset(self):
+        await self.wait_serial(0)
+        self.server.update(added={1: [2]})
+        self.server.update(withdrawn=[13238])
+        self.server.history.clear()
+        self.server.update(added={3: [4]})
+        await self.wait_serial(3)
+        self.assertEqual(self.aspa.aspa_records[IPv4], {43247: {13238}, 1: {2}, 3: {4}})
+        # further Serial Notifies may lead to empty updates
+        self.assertEqual(set().union(*(changed.get(IPv4, set()) for changed in self.changes[1:])), {13238, 1, 3})
+
+
+class VerificationDaemonTests(unittest.IsolatedAsyncioTestCase):
+    def make_aspa(self):
+        return ASPA(aspa_records)
+
+    async def asyncSetUp(self):
+        self.aspa = self.make_aspa()
+        # small batches already go through verify_batch
+        self.server = VerificationServer(self.aspa, batch_threshold=8)
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = await self.server.start_unix(os.path.join(self.directory.name, 'aspa.sock'))
+        self.client = await VerificationClient.connect_unix(self.path)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.stop()
+        self.directory.cleanup()
+
+    async def test_pipelined_requests(self):
+        routes = [(aspath, neighbor_as, afi, kind) for aspath, neighbor_as in random_paths(300, seed=8)
+                  for afi, kind in ((IPv4, UPFLOW), (IPv4, DOWNFLOW), (IPv6, IX))]
+        expected = [self.aspa.check_path(*route)[0] for route in routes]
+        self.assertEqual(await asyncio.wait_for(self.client.verify_many(routes), 5), expected)
+        self.assertEqual(await self.client.verify(ASPath.from_list([43247, 13238, 3356]), 3356, IPv4, UPFLOW), Valid)
+
+        stats = self.server.stats()
+        self.assertEqual(stats['requests'], len(routes) + 1)
+        self.assertGreater(stats['mean_batch'], 1)
+
+    async def test_malformed_requests(self):
+        with self.assertRaises(DaemonError):
+            await self.client.verify(b'\x02\x05\x00', 3356, IPv4, UPFLOW)
+        with self.assertRaises(DaemonError):
+            await self.client.verify(ASPath.from_list([43247, 13238]), 13238, 5, UPFLOW)
+        # the connection stays usable
+        body = encode_as_path([Segment(43247, AS_SEQUENCE), Segment(13238, AS_SEQUENCE)])
+        self.assertEqual(await self.client.verify(body, 13238, IPv4, UPFLOW), Valid)
+        self.assertEqual(self.server.stats()['errors'], 2)
+
+    async def test_malformed_header(self):
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        # unknown verification kind, then a valid request on the same connection
+        body = encode_as_path(ASPath.from_list([43247, 13238]))
+        writer.write(request_header.pack(7, 13238, IPv4, 9, len(body)) + body)
+        writer.write(request_header.pack(8, 13238, IPv4, UPFLOW, len(body)) + body)
+        data = await asyncio.wait_for(reader.readexactly(2 * response.size), 5)
+        self.assertEqual(list(response.iter_unpack(data)), [(7, ERROR), (8, Valid)])
+        writer.close()
+        await writer.wait_closed()
+
+    async def test_closed_connection(self):
+        await self.server.stop()
+        with self.assertRaises(DaemonError):
+            await asyncio.wait_for(self.client.verify(ASPath.from_list([43247]), 43247, IPv4, UPFLOW), 5)
+
+    async def test_oversized_path(self):
+        with self.assertRaises(DaemonError):
+            self.client.send(ASPath.from_sequence(list(range(1, 20000))), 19999, IPv4, UPFLOW)
+        self.assertEqual(await self.client.verify(ASPath.from_list([43247, 13238, 3356]), 3356, IPv4, UPFLOW), Valid)
+
+    async def test_failing_verification(self):
+        routes = [(aspath, neighbor_as, IPv4, UPFLOW) for aspath, neighbor_as in random_paths(100, seed=9)]
+        expected = [self.aspa.check_path(*route)[0] for route in routes]
+        check_path = self.aspa.check_path
+
+        def failing_check_path(aspath, neighbor_as, afi, kind):
+            if neighbor_as == 666:
+                raise RuntimeError("verification failed")
+            return check_path(aspath, neighbor_as, afi, kind)
+
+        def failing_verify_batch(*args, **kwargs):
+            raise RuntimeError("verification failed")
+
+        self.aspa.check_path = failing_check_path
+        self.aspa.verify_batch = failing_verify_batch
+        futures = [self.client.send(*route) for route in routes]
+        failing = self.client.send(ASPath.from_list([43247, 666]), 666, IPv4, UPFLOW)
+        with self.assertLogs('aspa_daemon', 'ERROR') as logs:
+            await self.client.drain()
+            self.assertEqual(await asyncio.wait_for(asyncio.gather(*futures), 5), expected)
+            with self.assertRaises(DaemonError):
+                await asyncio.wait_for(failing, 5)
+        self.assertEqual(self.server.stats()['errors'], 1)
+        self.assertIn("verification of request", logs.output[-1])
+
+
+class RCUDaemonTests(VerificationDaemonTests):
+    # verify_batch does not support RCU versions
+    def make_aspa(self):
+        return RCUTable(aspa_records).current
+
+
+class TopologyTests(unittest.TestCase):
+    topology = Topology(2000, seed=7)
+
+    def test_full_adoption_verdicts(self):
+        aspa = ASPA(self.topology.aspa_records(adoption=1.0))
+        checks = {UPFLOW: aspa.check_upflow_path, DOWNFLOW: aspa.check_downflow_path}
+        leaks = 0
+        for items, neighbor_as, afi, kind, leak in self.topology.paths(2000, seed=7, leak_ratio=0.2, set_ratio=0):
+            leaks += leak
+            with self.subTest(path=items, kind=kind):
+                self.assertEqual(checks[kind](to_segments(items), neighbor_as, afi), Invalid if leak else Valid)
+        self.assertGreater(leaks, 100)
+
+    def test_adoption_and_determinism(self):
+        records = self.topology.aspa_records(adoption=0.3, seed=1)
+        self.assertLess(abs(len(records[IPv4]) - 600), 100)
+        self.assertEqual(records, Topology(2000, seed=7).aspa_records(adoption=0.3, seed=1))
+        self.assertEqual(list(self.topology.paths(50, seed=2)), list(Topology(2000, seed=7).paths(50, seed=2)))
+
+    def test_files(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        records_path = os.path.join(directory.name, 'records.json')
+        paths_path = os.path.join(directory.name, 'paths.jsonl.gz')
+        records = self.topology.aspa_records(adoption=0.5)
+        routes = list(self.topology.paths(100, set_ratio=0.5))
+
+        write_records(records_path, records)
+        write_paths(paths_path, routes)
+        self.assertEqual(read_records(records_path), records)
+        with gzip.open(paths_path, 'rt') as file:
+            for (aspath, neighbor_as, afi, kind), (items, *route) in zip(read_paths(file), routes):
+                self.assertEqual([segment.value for segment in aspath],
+                                 [asn for item in items for asn in (item if isinstance(item, list) else [item])])
+                self.assertEqual([neighbor_as, afi, kind], route[:3])
+
+    def test_invalid_paths(self):
+        lines = io.StringIO('{"path": [1, [2, 3]], "neighbor": 1, "kind": "ix"}\n\n{"path": [1], "kind": "upflow"}\n')
+        routes = iter_routes([lines])
+        self.assertEqual(next(routes)[:2], ('-', 1))
+        with self.assertRaisesRegex(PathsError, '^-:3: invalid route'):
+            next(routes)
+
+
+def mrt_record(mrt_type, subtype, body):
+    return struct.pack('!IHHI', 0, mrt_type, subtype, len(body)) + body
+
+
+def as_path_attribute(segments, as4=True):
+    body = b''
+    for segment_type, asns in segments:
+        body += struct.pack('!BB', segment_type, len(asns))
+        body += b''.join(struct.pack('!I' if as4 else '!H', asn) for asn in asns)
+    return struct.pack('!BBB', 0x40, 2, len(body)) + body
+
+
+def as_path_body(segments, as4=True):
+    return as_path_attribute(segments, as4)[3:]
+
+
+class WireTests(unittest.TestCase):
+    def test_as_path(self):
+        path = parse_as_path(memoryview(as_path_body([(AS_SEQUENCE, [3356, 13238, 43247])])))
+        self.assertEqual((list(path.values), path.types, path.counts), ([43247, 13238, 3356], None, None))
+
+        path = parse_as_path(as_path_body([(AS_SEQUENCE, [3356, 3356]), (AS_SEQUENCE, [13238]),
+                                           (AS_CONFED_SEQUENCE, [65001])]))
+        self.assertEqual(str(path), '3356 3356 13238 (65001)')
+        self.assertEqual(str(parse_as_path(as_path_body([(AS_SEQUENCE, [3356, 13238])], as4=False), as4=False)),
+                         '3356 13238')
+
+        for data in (bytes([AS_SEQUENCE]), bytes([AS_SEQUENCE, 2, 0, 0, 0, 1]), bytes([5, 0])):
+            with self.subTest(data=data), self.assertRaises(WireError):
+                parse_as_path(data)
+
+    def test_as4_path_merge(self):
+        as_path = as_path_body([(AS_SEQUENCE, [3356, 23456, 23456]), (AS_SET, [1, 23456])], as4=False)
+        as4_path = as_path_body([(AS_SEQUENCE, [4200000000, 4200000001]), (AS_SET, [1, 4200000002])])
+        self.assertEqual(str(parse_as_path(as_path, False, as4_path)), '3356 4200000000 4200000001 {1 4200000002}')
+        # an AS4_PATH longer than the AS_PATH is ignored
+        self.assertEqual(str(parse_as_path(as_path_body([(AS_SEQUENCE, [23456])], as4=False), False, as4_path)),
+                         '23456')
+        # confederation segments of the AS4_PATH are discarded
+        confed = as_path_body([(AS_CONFED_SEQUENCE, [65001]), (AS_SEQUENCE, [4200000000])])
+        self.assertEqual(str(parse_as_path(as_path, False, confed)), '3356 23456 23456 4200000000')
+        # the AS4_PATH is only merged for 2-byte speakers
+        self.assertEqual(str(parse_as_path(as_path_body([(AS_SEQUENCE, [3356])]), True, as4_path)), '3356')
+
+    def test_attributes(self):
+        as4_path = struct.pack('!BBH', 0xd0, 17, 6) + as_path_body([(AS_SEQUENCE, [4200000000])])
+        attributes = struct.pack('!BBBB', 0x40, 1, 1, 0) + \
+            as_path_attribute([(AS_SEQUENCE, [3356, 23456])], as4=False) + as4_path
+        self.assertEqual(str(parse_attributes(attributes, as4=False)), '3356 4200000000')
+        self.assertIsNone(parse_attributes(struct.pack('!BBBB', 0x40, 1, 1, 0)))
+        with self.assertRaises(WireError):
+            parse_attributes(attributes[:-1])
+
+    def test_encode_as_path(self):
+        path = ASPath.from_string('3356 3356 13238 {1 70000} 4200000000')
+        self.assertEqual(parse_as_path(encode_as_path(path)), path)
+        self.assertEqual(str(parse_as_path(encode_as_path(path, as4=False), as4=False)), '3356 3356 13238 {1 23456} 23456')
+        self.assertEqual(encode_as_path(ASPath.from_sequence([70000, 3356]), as4=False),
+                         as_path_body([(AS_SEQUENCE, [3356, 23456])], as4=False))
+
+
+class MRTReaderTests(unittest.TestCase):
+    def write(self, data, compress=False):
+        fd, path = tempfile.mkstemp(suffix='.mrt')
+        with os.fdopen(fd, 'wb') as file:
+            file.write(gzip.compress(data) if compress else data)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_table_dump_v2(self):
+        peers = struct.pack('!BI4sH', 0, 1, bytes(4), 3356) + struct.pack('!BI16sI', 3, 2, bytes(16), 174)
+        peer_index = struct.pack('!IH', 0, 0) + struct.pack('!H', 2) + peers
+
+        valid = as_path_attribute([(AS_SEQUENCE, [3356, 13238, 43247])])
+        leak = as_path_attribute([(AS_SEQUENCE, [174, 2914, 3356])])
+        entries = struct.pack('!HIH', 0, 0, len(valid)) + valid + struct.pack('!HIH', 1, 0, len(leak)) + leak
+        rib_v4 = struct.pack('!IB3sH', 0, 24, bytes([192, 0, 2]), 2) + entries
+
+        unverifiable = as_path_attribute([(AS_SEQUENCE, [174, 13238]), (AS_SET, [1, 2])])
+        entry = struct.pack('!HIIH', 1, 0, 7, len(unverifiable)) + unverifiable
+        rib_v6 = struct.pack('!IB4sH', 1, 32, bytes([0x20, 0x01, 0x0d, 0xb8]), 1) + entry
+
+        data = mrt_record(13, 1, peer_index) + mrt_record(13, 2, rib_v4) + mrt_record(13, 10, rib_v6)
+        reader = MRTReader(aspa_manager)
+        routes = list(reader.verify(self.write(data, compress=True)))
+        self.assertEqual(routes, [
+            ('192.0.2.0/24', 3356, IPv4, Valid),
+            ('192.0.2.0/24', 174, IPv4, Invalid),
+            ('2001:db8::/32', 174, IPv6, Unverifiable),
+        ])
+        self.assertEqual((reader.records, reader.routes), (3, 3))
+
+        routes = list(reader.read_routes(self.write(mrt_record(13, 1, peer_index) + mrt_record(13, 10, rib_v6))))
+        self.assertEqual([(segment.value, segment.type) for segment in routes[0][3]],
+                         [(2, AS_SET), (1, AS_SET), (13238, AS_SEQUENCE), (174, AS_SEQUENCE)])
+
+    def test_bgp4mp(self):
+        attributes = struct.pack('!BBBB', 0x40, 1, 1, 0) + as_path_attribute([(AS_SEQUENCE, [3356, 13238])], as4=False)
+        update = struct.pack('!H', 0) + struct.pack('!H', len(attributes)) + attributes
+        update += bytes([24, 198, 51, 100, 16, 10, 1])
+        message = b'\xff' * 16 + struct.pack('!HB', 19 + len(update), 2) + update
+        body = struct.pack('!HHHH4s4s', 3356, 64512, 0, 1, bytes(4), bytes(4)) + message
+        et_body = struct.pack('!I', 0) + body
+
+        reader = MRTReader(aspa_manager, kind=UPFLOW)
+        routes = list(reader.verify(self.write(mrt_record(16, 1, body) + mrt_record(17, 1, et_body))))
+        self.assertEqual(routes, [
+            ('198.51.100.0/24', 3356, IPv4, Valid),
+            ('10.1.0.0/16', 3356, IPv4, Valid),
+        ] * 2)
+        self.assertGreater(reader.routes_per_second(), 0)
+
+    def test_truncated_records(self):
+        peer_index = struct.pack('!IH', 0, 0) + struct.pack('!H', 1) + struct.pack('!BI4sH', 0, 1, bytes(4), 3356)
+        attribute = as_path_attribute([(AS_SEQUENCE, [3356, 13238])])
+        rib = struct.pack('!IB3sH', 0, 24, bytes([192, 0, 2]), 1) + struct.pack('!HIH', 0, 0, len(attribute)) + attribute
+        attributes = as_path_attribute([(AS_SEQUENCE, [3356, 13238])], as4=False)
+        update = struct.pack('!HH', 0, len(attributes)) + attributes + bytes([24, 198, 51, 100])
+        message = b'\xff' * 16 + struct.pack('!HB', 19 + len(update), 2) + update
+        bgp4mp = struct.pack('!HHHH4s4s', 3356, 64512, 0, 1, bytes(4), bytes(4)) + message
+
+        reader = MRTReader(aspa_manager)
+        for prefix, mrt_type, subtype, body in ((b'', 13, 1, peer_index), (mrt_record(13, 1, peer_index), 13, 2, rib),
+                                                (b'', 16, 1, bgp4mp)):
+            for length in range(len(body)):
+                # the MRT header matches the truncated body, read_records
+                # cannot tell
+                path = self.write(prefix + mrt_record(mrt_type, subtype, body[:length]))
+                with self.subTest(mrt_type=mrt_type, subtype=subtype, length=length):
+                    try:
+                        list(reader.read_routes(path))
+                    except MRTError:
+                        pass
+
+
+class DERTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+        objects = {
+            'a/13238.asa': encode_signed_object(13238, [3356, 174, 4200000000]),
+            'a/b/43247.asa': encode_signed_object(43247, [13238]),
+            'c/43247-2.asa': encode_signed_object(43247, [1299]),
+            'c/empty.asa': b'',
+            'c/truncated.asa': encode_signed_object(1, [2])[:-3],
+            'c/self.asa': encode_signed_object(5, [5]),
+            'c/ignored.roa': encode_signed_object(6, [7]),
+        }
+        for name, data in objects.items():
+            os.makedirs(os.path.dirname(os.path.join(self.directory, name)), exist_ok=True)
+            with open(os.path.join(self.directory, name), 'wb') as file:
+                file.write(data)
+
+    def check_load(self, workers):
+        records, report = load_directory(self.directory, workers=workers)
+        self.assertEqual(records[IPv4], {13238: {174, 3356, 4200000000}, 43247: {13238, 1299}})
+        self.assertEqual(records[IPv6], records[IPv4])
+        self.assertEqual(report.parsed, 3)
+        self.assertEqual(sorted(os.path.basename(path) for path, _ in report.malformed),
+                         ['empty.asa', 'self.asa', 'truncated.asa'])
+
+    def test_load_directory(self):
+        self.check_load(workers=1)
+
+    def test_load_directory_pool(self):
+        self.check_load(workers=2)
+
+
+def random_paths(count, seed=0):
+    rng = random.Random(seed)
+    ases = [0, 1, 2, 20485] + list(aspa_records[IPv4]) + [174, 1299, 6762, 9002, 208722]
+    for _ in range(count):
+        aspath = []
+        while len(aspath) < rng.randint(0, 8):
+            segment_type = AS_SEQUENCE if rng.random() < 0.9 else rng.choice([AS_SET, AS_CONFED_SEQUENCE])
+            aspath += [Segment(rng.choice(ases), segment_type)] * rng.choice([1, 1, 2])
+        neighbor_as = aspath[-1].value if aspath and rng.random() < 0.8 else rng.choice(ases)
+        yield aspath, neighbor_as
+
+
+def two_pass_check(aspa, aspath, neighbor_as, afi, kind):
+    # the get_indexes based checks check_path replaced
+    aspath_len = len(aspath)
+    if aspath_len == 0 or kind != IX and aspath[-1].type == AS_SEQUENCE and aspath[-1].value != neighbor_as:
+        return Invalid
+    forward_invalid, forward_unknown, unverifiable = aspa.get_indexes(aspath, afi)
+    backward_invalid, backward_unknown, backward_unverifiable = \
+        aspa.get_indexes(list(reversed(aspath)), afi) if kind == DOWNFLOW else (0, 0, False)
+    if kind == DOWNFLOW:
+        if forward_invalid + backward_invalid < aspath_len:
+            return Invalid
+        if unverifiable or backward_unverifiable:
+            return Unverifiable
+        return Unknown if forward_unknown + backward_unknown < aspath_len else Valid
+    if forward_invalid < aspath_len:
+        return Invalid
+    if unverifiable:
+        return Unverifiable
+    return Unknown if forward_unknown < aspath_len else Valid
+
+
+class KernelTests(unittest.TestCase):
+    def test_matches_two_pass_checks(self):
+        for store in (None, CompactRecords):
+            aspa = ASPA(aspa_records, store=store)
+            for aspath, neighbor_as in random_paths(3000, seed=1):
+                for kind in (UPFLOW, DOWNFLOW, IX):
+                    with self.subTest(store=store, kind=kind):
+                        self.assertEqual(aspa.check_path(aspath, neighbor_as, IPv4, kind)[0],
+                                         two_pass_check(aspa, aspath, neighbor_as, IPv4, kind))
+
+    def test_run_length_paths(self):
+        for aspath, neighbor_as in random_paths(3000, seed=2):
+            path = ASPath.from_segments(aspath)
+            for kind in (UPFLOW, DOWNFLOW, IX):
+                with self.subTest(kind=kind):
+                    self.assertEqual(aspa_manager.check_path(path, neighbor_as, IPv4, kind)[0],
+                                     aspa_manager.check_path(aspath, neighbor_as, IPv4, kind)[0])
+
+    def test_positions(self):
+        aspath = [Segment(asn, AS_SEQUENCE) for asn in (43247, 13238, 13238, 2914, 3356)]
+        self.assertEqual(aspa_manager.check_path(aspath, 3356, IPv4, UPFLOW), (Invalid, 3))
+        self.assertEqual(aspa_manager.check_path(aspath, 174, IPv4, UPFLOW), (Invalid, 4))
+        self.assertEqual(aspa_manager.check_path([], 174, IPv4, UPFLOW), (Invalid, None))
+
+        aspath = [Segment(asn, AS_SEQUENCE) for asn in (1, 13238, 3356, 3356, 6695)]
+        self.assertEqual(aspa_manager.check_path(aspath, 6695, IPv4, UPFLOW), (Unknown, 1))
+        self.assertEqual(aspa_manager.check_path(aspath, 6695, IPv4, DOWNFLOW), (Unknown, 1))
+        self.assertEqual(aspa_manager.check_path(aspath[1:], 6695, IPv4, DOWNFLOW), (Valid, None))
+
+
+class ASPathTests(unittest.TestCase):
+    def test_runs(self):
+        path = ASPath.from_list([43247, 13238, 13238, 3356, 3356, 3356])
+        self.assertEqual((list(path.values), path.types, list(path.counts)), ([43247, 13238, 3356], None, [1, 2, 3]))
+        self.assertEqual((len(path), path.hops()), (3, 6))
+        self.assertEqual(aspa_manager.check_upflow_path(path, 3356, IPv4), Valid)
+
+        path = ASPath.from_list([43247, 13238, 3356])
+        self.assertIsNone(path.counts)
+        self.assertEqual([segment.value for segment in path.segments()], [43247, 13238, 3356])
+
+    def test_string(self):
+        path = ASPath.from_string('3356 3356 13238 {1,2} 43247')
+        self.assertEqual([(segment.value, segment.type) for segment in path],
+                         [(43247, AS_SEQUENCE), (2, AS_SET), (1, AS_SET), (13238, AS_SEQUENCE), (3356, AS_SEQUENCE)])
+        self.assertEqual(list(path.counts), [1, 1, 1, 1, 2])
+        self.assertEqual(str(path), '3356 3356 13238 {1 2} 43247')
+        self.assertEqual(str(ASPath.from_string('(65001 65002) [65003] 3356')), '(65001 65002) [65003] 3356')
+        for text in ('3356 {1 2', '3356 x', '{1 {2}}'):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                ASPath.from_string(text)
+
+    def test_wire(self):
+        data = bytes([AS_SEQUENCE, 3]) + struct.pack('!III', 3356, 3356, 13238) + \
+            bytes([AS_SET, 2]) + struct.pack('!II', 1, 2)
+        self.assertEqual(str(ASPath.from_wire(data)), '3356 3356 13238 {1 2}')
+        self.assertEqual(str(ASPath.from_wire(bytes([AS_SEQUENCE, 2]) + struct.pack('!HH', 3356, 13238), as4=False)),
+                         '3356 13238')
+        with self.assertRaises(ValueError):
+            ASPath.from_wire(data[:-1])
+
+
+class VerificationEngineTests(unittest.TestCase):
+    def test_verdicts_in_order(self):
+        checks = {UPFLOW: aspa_manager.check_upflow_path, DOWNFLOW: aspa_manager.check_downflow_path,
+                  IX: aspa_manager.check_ix_path}
+        routes, expected = [], []
+        for index, (aspath, neighbor_as) in enumerate(random_paths(1000)):
+            if any(segment.type == AS_CONFED_SEQUENCE for segment in aspath):
+                # not expressible in the paths files
+                continue
+            kind = index % 3
+            items = []
+            for segment in aspath:
+                if segment.type == AS_SEQUENCE:
+                    items.append(segment.value)
+                elif items and isinstance(items[-1], list):
+                    items[-1].append(segment.value)
+                else:
+                    items.append([segment.value])
+            self.assertEqual([(segment.value, segment.type) for segment in to_segments(items)],
+                             [(segment.value, segment.type) for segment in aspath])
+            routes.append((items, neighbor_as, IPv4, kind))
+            expected.append(checks[kind](aspath, neighbor_as, IPv4))
+        routes.append(([43247, 13238, 3356], 3356, IPv4, UPFLOW))
+        expected.append(Valid)
+
+        with VerificationEngine.from_records(aspa_records, workers=2, chunksize=64, max_pending=3) as engine:
+            self.assertEqual(list(engine.verify(iter(routes))), expected)
+            self.assertEqual(list(engine.verify([])), [])
+
+    def test_invalid_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'aspa.snap')
+            with open(path, 'wb') as file:
+                file.write(b'\0' * 64)
+            with self.assertRaises(SnapshotError):
+                VerificationEngine(path, workers=1)
+            with self.assertRaises(FileNotFoundError):
+                VerificationEngine(os.path.join(directory, 'missing.snap'), workers=1)
+
+    def test_failing_worker(self):
+        # a worker that cannot load the snapshot fails its chunks instead of
+        # being respawned by the Pool forever
+        with tempfile.TemporaryDirectory() as directory:
+            aspa_engine.init_worker(os.path.join(directory, 'missing.snap'))
+        try:
+            with self.assertRaises(FileNotFoundError):
+                aspa_engine.verify_chunk([([43247, 13238, 3356], 3356, IPv4, UPFLOW)])
+        finally:
+            aspa_engine.worker_error = None
+
+
+class VerifyCommandTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.table = os.path.join(self.directory.name, 'records.json')
+        self.paths = os.path.join(self.directory.name, 'paths.jsonl.gz')
+        write_records(self.table, aspa_records)
+        self.routes = [([43247, 13238, 3356], 3356, IPv4, UPFLOW, False), ([8342, [1, 2], 12389], 12389, IPv4, UPFLOW, False),
+                       ([43247, 13238], 3356, IPv4, DOWNFLOW, True), ([6695, 3356], 3356, IPv6, IX, False)]
+        write_paths(self.paths, self.routes)
+        self.expected = [aspa_manager.check_path(to_segments(path), neighbor_as, afi, kind)[0]
+                         for path, neighbor_as, afi, kind, _ in self.routes]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_command(self, *argv):
+        output, summary = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(summary):
+            verify_main(['--table', self.table, *argv])
+        return output.getvalue(), json.loads(summary.getvalue())
+
+    def test_csv(self):
+        output, summary = self.run_command(self.paths)
+        rows = list(csv.DictReader(io.StringIO(output)))
+        self.assertEqual([row['verdict'] for row in rows], ['valid', 'unverifiable', 'invalid', 'unknown'])
+        self.assertEqual(rows[1]['path'], '8342 {1 2} 12389')
+        self.assertEqual((rows[1]['file'], rows[1]['line']), (self.paths, '2'))
+        self.assertEqual(summary['routes'], len(self.routes))
+        self.assertEqual(summary['verdicts'], {'valid': 1, 'invalid': 1, 'unknown': 1, 'unverifiable': 1})
+
+    def test_workers(self):
+        other = os.path.join(self.directory.name, 'other.jsonl')
+        write_paths(other, self.routes[:2])
+        output, summary = self.run_command('--workers', '2', '--chunksize', '1', '--format', 'json', self.paths, other)
+        lines = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual([line['verdict'] for line in lines],
+                         [VERDICT_NAMES[verdict] for verdict in self.expected + self.expected[:2]])
+        self.assertEqual([(line['file'], line['line']) for line in lines],
+                         [(self.paths, 1), (self.paths, 2), (self.paths, 3), (self.paths, 4), (other, 1), (other, 2)])
+        self.assertEqual(summary['workers'], 2)
+
+    def test_invalid_route(self):
+        with open(self.paths.replace('.gz', ''), 'w') as file:
+            file.write('{"path": [1], "neighbor": 1, "kind": "sideways"}\n')
+        with self.assertRaises(SystemExit):
+            self.run_command(self.paths.replace('.gz', ''))
+
+    def test_backends(self):
+        output, summary = self.run_command('--backend', 'auto', '--format', 'json', self.paths)
+        self.assertEqual([json.loads(line)['verdict'] for line in output.splitlines()],
+                         [VERDICT_NAMES[verdict] for verdict in self.expected])
+        self.assertIn(summary['backend'], ('aspa', 'compact', 'hot'))
+        self.assertTrue(summary['calibration']['draft'].startswith('unsupported'))
+        # the AS_SET route
+        with self.assertRaises(SystemExit):
+            self.run_command('--backend', 'draft', self.paths)
+
+    def test_snapshot_table(self):
+        snapshot = os.path.join(self.directory.name, 'aspa.snap')
+        write_snapshot(snapshot, aspa_records)
+        for backend in ('aspa', 'compact', 'auto'):
+            with self.subTest(backend=backend), \
+                    mock.patch.object(SnapshotRecords, 'to_dict', autospec=True, side_effect=SnapshotRecords.to_dict) as to_dict, \
+                    mock.patch.object(SnapshotRecords, 'close', autospec=True, side_effect=SnapshotRecords.close) as close:
+                output, summary = self.run_command('--table', snapshot, '--backend', backend, '--format', 'json', self.paths)
+                self.assertEqual([json.loads(line)['verdict'] for line in output.splitlines()],
+                                 [VERDICT_NAMES[verdict] for verdict in self.expected])
+                # ASPA queries the mapping in place
+                self.assertEqual(to_dict.called, backend != 'aspa')
+                close.assert_called_once()
+
+
+def sequence_routes(count, seed=0):
+    # AS_SEQUENCE upflow and downflow routes the aspa_hackathon algorithms
+    # can verify; ASPA skips AS 0 in a path, they look it up
+    routes = []
+    for aspath, neighbor_as in random_paths(count, seed):
+        if all(segment.type == AS_SEQUENCE and segment.value != 0 for segment in aspath):
+            routes += [(aspath, neighbor_as, IPv4, UPFLOW), (aspath, neighbor_as, IPv4, DOWNFLOW)]
+    return routes
+
+
+class BackendTests(unittest.TestCase):
+    def test_equivalent_backends(self):
+        routes = sequence_routes(2000)
+        expected = [aspa_manager.check_path(*route)[0] for route in routes]
+        for name in ('aspa', 'compact', 'hot', 'draft', 'compiled'):
+            backend = create_backend(name, aspa_records)
+            with self.subTest(name=name):
+                self.assertEqual(backend.name, name)
+                self.assertEqual([backend.verify(*route) for route in routes], expected)
+
+    def test_unsupported_routes(self):
+        backend = create_backend('draft', aspa_records)
+        aspath = [Segment(43247, AS_SEQUENCE), Segment(13238, AS_SEQUENCE), Segment(3356, AS_SEQUENCE)]
+        self.assertEqual(backend.verify(aspath, 3356, IPv4, UPFLOW), Valid)
+        self.assertEqual(backend.verify(aspath, 174, IPv4, UPFLOW), Invalid)
+        with self.assertRaises(UnsupportedRoute):
+            backend.verify(aspath, 3356, IPv4, IX)
+        with self.assertRaises(UnsupportedRoute):
+            backend.verify([Segment(1, AS_SET)] + aspath, 3356, IPv4, UPFLOW)
+        with self.assertRaises(KeyError):
+            create_backend('quantum', aspa_records)
+
+    def test_select_backend(self):
+        routes = sequence_routes(1000, seed=1)
+        backend, report = select_backend(aspa_records, routes, repeat=1)
+        self.assertIn(backend.name, [name for name, result in report.items() if isinstance(result, float)])
+        self.assertEqual([backend.verify(*route) for route in routes],
+                         [aspa_manager.check_path(*route)[0] for route in routes])
+        self.assertTrue(report['optimized'].startswith('not equivalent'))
+
+        routes.append(([Segment(1, AS_SET), Segment(3356, AS_SEQUENCE)], 3356, IPv4, UPFLOW))
+        backend, report = select_backend(aspa_records, routes, names=['draft'], repeat=1)
+        self.assertEqual(backend.name, 'aspa')
+        self.assertEqual(list(report), ['aspa', 'draft'])
+        self.assertTrue(report['draft'].startswith('unsupported'))
+
+    def test_failing_backend(self):
+        register('missing', 'aspa_missing:Backend')
+        self.addCleanup(BACKENDS.pop, 'missing')
+        backend, report = select_backend(aspa_records, sequence_routes(100), names=['missing'], repeat=1)
+        self.assertEqual(backend.name, 'aspa')
+        self.assertTrue(report['missing'].startswith('failed: ModuleNotFoundError'))
+
+    def test_no_usable_backend(self):
+        saved = dict(BACKENDS)
+        self.addCleanup(BACKENDS.update, saved)
+        self.addCleanup(BACKENDS.clear)
+        BACKENDS.clear()
+        register('aspa', 'aspa_missing:Backend')
+        register('draft', 'aspa_backends:HackathonBackend', module='aspa_hackathon.draft', function='draft_algorithm')
+        routes = [([Segment(1, AS_SET), Segment(3356, AS_SEQUENCE)], 3356, IPv4, UPFLOW)]
+        with self.assertRaises(NoBackend) as raised:
+            select_backend(aspa_records, routes, repeat=1)
+        # the candidates are never compared against each other
+        self.assertEqual(list(raised.exception.report), ['aspa'])
+        self.assertTrue(raised.exception.report['aspa'].startswith('failed: ModuleNotFoundError'))
+        self.assertIn('aspa_missing', str(raised.exception))
+
+        register('aspa', 'aspa_backends:HackathonBackend', module='aspa_hackathon.draft', function='draft_algorithm')
+        with self.assertRaises(NoBackend) as raised:
+            select_backend(aspa_records, routes, repeat=1)
+        self.assertTrue(raised.exception.report['aspa'].startswith('unsupported'))
+
+    def test_lazy_loading(self):
+        loaded = subprocess.check_output(
+            [sys.executable, '-c', "import sys, aspa_backends; print(' '.join(sorted(sys.modules)))"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), text=True).split()
+        for module in ('aspa_store', 'aspa_hackathon', 'aspa_hackathon.draft', 'numpy'):
+            self.assertNotIn(module, loaded)
+
+    def test_hackathon_package(self):
+        # the algorithms stay inside their package, sys.path is untouched
+        path = list(sys.path)
+        create_backend('draft', aspa_records)
+        self.assertEqual(sys.path, path)
+        self.assertIn('aspa_hackathon.structs', sys.modules)
+        for module in ('structs', 'draft', 'simple'):
+            self.assertNotIn(module, sys.modules)
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class BatchTests(unittest.TestCase):
+    def check_batch(self, aspa, paths, afi):
+        checks = {UPFLOW: aspa.check_upflow_path, DOWNFLOW: aspa.check_downflow_path, IX: aspa.check_ix_path}
+        values = [[segment.value for segment in aspath] for aspath, _ in paths]
+        types = [[segment.type for segment in aspath] for aspath, _ in paths]
+        neighbors = [neighbor_as for _, neighbor_as in paths]
+
+        for kind, check in checks.items():
+            expected = [check(aspath, neighbor_as, afi) for aspath, neighbor_as in paths]
+            with self.subTest(kind=kind):
+                self.assertEqual(aspa.verify_batch(values, neighbors, afi, kind, types=types).tolist(), expected)
+
+            width = max(map(len, values))
+            padded = numpy.zeros((len(values), width), dtype=numpy.uint32)
+            padded_types = numpy.full((len(values), width), AS_SEQUENCE, dtype=numpy.uint8)
+            for row, (path_values, path_types) in enumerate(zip(values, types)):
+                padded[row, :len(path_values)] = path_values
+                padded_types[row, :len(path_types)] = path_types
+            lengths = [len(path_values) for path_values in values]
+            with self.subTest(kind=kind, padded=True):
+                self.assertEqual(aspa.verify_batch(padded, neighbors, afi, kind, lengths, padded_types).tolist(), expected)
+
+    def test_matches_per_path_checks(self):
+        paths = list(random_paths(2000))
+        for store in (None, CompactRecords):
+            for afi in (IPv4, IPv6):
+                self.check_batch(ASPA(aspa_records, store=store), paths, afi)
+
+    def test_empty_provider_sets(self):
+        self.check_batch(ASPA({IPv4: {1: set()}}), list(random_paths(200)), IPv4)
+
+
 if __name__ == '__main__':
     # aspa_manager = ASPA(aspa_records)
     # aspath = [Segment(3356, AS_SEQUENCE), Segment(1, AS_SEQUENCE), Segment(4635, AS_SEQUENCE)]